@@ -0,0 +1,74 @@
+# aggregation.py - свертка оценок модели в категории эмоций бота
+from typing import Dict, List
+
+import numpy as np
+
+# Маппинг эмоций английской модели к нашим категориям
+EN_EMOTION_MAP = {
+    "admiration": "gratitude",
+    "amusement": "joy",
+    "anger": "anger",
+    "annoyance": "anger",
+    "approval": "gratitude",
+    "caring": "love",
+    "confusion": "confusion",
+    "curiosity": "excitement",
+    "desire": "love",
+    "disappointment": "sadness",
+    "disapproval": "anger",
+    "disgust": "disgust",
+    "embarrassment": "embarrassment",
+    "excitement": "excitement",
+    "fear": "fear",
+    "gratitude": "gratitude",
+    "grief": "sadness",
+    "joy": "joy",
+    "love": "love",
+    "nervousness": "fear",
+    "optimism": "joy",
+    "pride": "joy",
+    "realization": "surprise",
+    "relief": "serenity",
+    "remorse": "shame",
+    "sadness": "sadness",
+    "surprise": "surprise",
+    "neutral": "neutral"
+}
+
+
+class ScoreAggregator:
+    """
+    Складывает вероятности меток модели в категории бота одним умножением
+    на матрицу (метки x категории). Оценки каждого текста сначала
+    нормируются в сумму 1: у GoEmotions независимые сигмоиды на каждую метку
+    """
+
+    def __init__(self, label_map: Dict[str, str], categories: List[str], fallback: str = "neutral"):
+        self.categories = list(categories)
+        self.labels = list(label_map)
+        self._label_index = {label: i for i, label in enumerate(self.labels)}
+        # Неизвестные метки уходят в fallback, как и в прежнем emotion_map.get(label, "neutral")
+        self._fallback_row = len(self.labels)
+        category_index = {category: i for i, category in enumerate(self.categories)}
+        self.matrix = np.zeros((len(self.labels) + 1, len(self.categories)), dtype=np.float32)
+        for i, label in enumerate(self.labels):
+            self.matrix[i, category_index[label_map[label]]] = 1.0
+        self.matrix[self._fallback_row, category_index[fallback]] = 1.0
+
+    def aggregate(self, results: List[List[dict]]) -> np.ndarray:
+        # results - полные распределения модели ([{label, score}, ...] на текст)
+        scores = np.zeros((len(results), len(self.labels) + 1), dtype=np.float32)
+        for i, result in enumerate(results):
+            for item in result:
+                scores[i, self._label_index.get(item["label"], self._fallback_row)] += item["score"]
+        totals = scores.sum(axis=1, keepdims=True)
+        np.divide(scores, totals, out=scores, where=totals > 0)
+        return scores @ self.matrix
+
+    def top(self, aggregated: np.ndarray, k: int) -> List[List[tuple]]:
+        # k лучших категорий для каждого текста: [(категория, оценка), ...]
+        order = np.argsort(-aggregated, axis=1)[:, :k]
+        return [
+            [(self.categories[j], float(row[j])) for j in indices]
+            for row, indices in zip(aggregated, order)
+        ]
@@ -1,27 +1,99 @@
 # app.py - FastAPI сервис для определения эмоций в тексте
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from transformers import pipeline
-import re
-from typing import Dict
+import json
+import asyncio
+import logging
+from typing import Dict, List, Optional
 import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)  # Общие модули проекта (common/)
+
+from common.language import route_language
+from batching import MicroBatcher
+from inference import InferenceExecutor, Overloaded
+from cache import PredictionCache
+from models import MODEL_CACHE_DIR, model_key
+from heads import HeadStore
+from prefork import process_memory, workers_memory
+from aggregation import EN_EMOTION_MAP, ScoreAggregator
+from chunking import pool_scores, split_text
+import metrics
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-# Загрузка моделей для обработки текста
-# Русская модель для определения эмоций
-ru_model = pipeline(
-    "text-classification",
-    model="blanchefort/rubert-base-cased-sentiment"  
-)
-# Английская модель для определения эмоций
-en_model = pipeline(
-    "text-classification",
-    model="SamLowe/roberta-base-go_emotions"
+# Параметры микробатчинга
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "16"))  # Максимум текстов в одном проходе модели
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", "10"))  # Сколько ждать попутных запросов
+# Параметры пула инференса
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "thread")  # thread - общие модели, process - реплика модели в каждом воркере
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))  # Сколько батчей считается одновременно
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "256"))  # Сверх этого числа текстов в очереди отвечаем 503
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "0"))  # Потоков torch на воркер, 0 - ядра поровну между воркерами
+RETRY_AFTER = int(os.getenv("RETRY_AFTER", "1"))  # Значение заголовка Retry-After в секундах
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")  # torch, onnx (ONNX Runtime) или int8 (квантованная ONNX)
+MIXED_ROUTING = os.getenv("MIXED_ROUTING", "0") == "1"  # Смешанные RU/EN тексты отправлять в обе модели
+MAX_CHUNK_CHARS = int(os.getenv("MAX_CHUNK_CHARS", "1000"))  # Более длинные тексты делятся на окна по предложениям
+# Языки, модели которых грузятся в фоне при старте; остальные грузятся при первом запросе
+PRELOAD_LANGS = [lang.strip() for lang in os.getenv("PRELOAD_LANGS", "ru,en").split(",") if lang.strip()]
+# Параметры сервера
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8001"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))  # Процессов API; больше 1 - prefork с общими весами моделей
+# Потоков torch на процесс в режиме prefork: ядра поровну между процессами и потоками инференса в них
+WORKER_TORCH_THREADS = TORCH_THREADS or max(1, (os.cpu_count() or 1) // (API_WORKERS * INFERENCE_WORKERS))
+MEMORY_REPORT_INTERVAL = float(os.getenv("MEMORY_REPORT_INTERVAL", "60"))  # Как часто мастер пишет в лог память воркеров, сек
+
+executor = InferenceExecutor(
+    mode=INFERENCE_MODE,
+    workers=INFERENCE_WORKERS,
+    max_queue=MAX_QUEUE_DEPTH,
+    torch_threads=TORCH_THREADS,
+    retry_after=RETRY_AFTER,
+    backend=INFERENCE_BACKEND,
+    preload=PRELOAD_LANGS,
 )
+
 # Модель запроса - ожидает текст для анализа
 class TextRequest(BaseModel):
     text: str
+    top_k: int = 0  # Вернуть k самых вероятных эмоций
+    all_scores: bool = False  # Вернуть оценки по всем эмоциям
+# Модель пакетного запроса - список текстов для анализа
+class TextBatchRequest(BaseModel):
+    texts: List[str]
+    top_k: int = 0
+    all_scores: bool = False
+# Параметры кэша предсказаний
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "10000"))  # Максимум записей в памяти
+CACHE_TTL = float(os.getenv("CACHE_TTL", "0")) or None  # Время жизни записи в секундах, 0 - без ограничения
+CACHE_PATH = os.getenv("CACHE_PATH", "")  # Файл SQLite для кэша на диске, пусто - только в памяти
+CACHE_WRITE_BATCH = int(os.getenv("CACHE_WRITE_BATCH", "64"))  # Записей кэша в одном коммите SQLite
+CACHE_WRITE_INTERVAL = float(os.getenv("CACHE_WRITE_INTERVAL", "1"))  # Максимальная задержка записи на диск, сек
+
+cache = PredictionCache(
+    max_size=CACHE_SIZE,
+    ttl=CACHE_TTL,
+    disk_path=CACHE_PATH or None,
+    write_batch=CACHE_WRITE_BATCH,
+    write_interval=CACHE_WRITE_INTERVAL,
+)
+metrics.CACHE_HIT_RATE.set_function(lambda: cache.stats()["hit_rate"])
+for kind in ("rss", "pss", "shared", "private"):
+    metrics.PROCESS_MEMORY.labels(kind).set_function(lambda kind=kind: process_memory(os.getpid()).get(f"{kind}_mb", 0.0))
+
+# Головы, обученные по голосам пользователей (api/train_head.py); новые файлы подхватываются на лету
+HEADS_DIR = os.getenv("HEADS_DIR", os.path.join(MODEL_CACHE_DIR, "heads"))
+HEAD_CHECK_INTERVAL = float(os.getenv("HEAD_CHECK_INTERVAL", "5"))  # Как часто проверять файлы голов, сек
+
+heads = HeadStore(HEADS_DIR, HEAD_CHECK_INTERVAL)
+
 # Словарь соответствий эмоций на русском и английском
 EMOTIONS = {
     "joy": {"ru": "радость", "en": "joy"},
@@ -43,63 +115,245 @@ EMOTIONS = {
     "confusion": {"ru": "замешательство", "en": "confusion"}
 }
 
-def detect_language(text: str) -> str:
-    return "ru" if re.search(r'[а-яё]', text.lower()) else "en"
+# Вероятности 28 меток GoEmotions складываются в наши категории
+en_aggregator = ScoreAggregator(EN_EMOTION_MAP, list(EMOTIONS))
+
+batcher = MicroBatcher(executor.run, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT_MS / 1000)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Идентификатор трассировки от бота (или новый) доступен всем стадиям запроса
+    token = metrics.trace_id.set(request.headers.get(metrics.TRACE_HEADER) or metrics.new_trace_id())
+    try:
+        with metrics.stage("request"):
+            response = await call_next(request)
+        response.headers[metrics.TRACE_HEADER] = metrics.trace_id.get()
+        return response
+    finally:
+        metrics.trace_id.reset(token)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Очередь переполнена - просим клиента повторить позже
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Inference queue is full"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.on_event("startup")
+def start_executor():
+    # Модели грузятся в фоне, сервер сразу принимает соединения
+    executor.start()
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    executor.shutdown()
+    cache.close()
+
+async def classify_chunks(lang: str, chunks: List[str]) -> List[dict]:
+    # Окна длинного текста идут в общие батчи, их оценки усредняются
+    if len(chunks) == 1:
+        return await batcher.submit(lang, chunks[0])
+    return pool_scores(await batcher.submit_many(lang, chunks), chunks)
+
+async def lookup(lang: str, texts: List[str]) -> List[Optional[List[dict]]]:
+    # Оценки из кэша предсказаний, None - промах
+    with metrics.stage("cache"):
+        results = await cache.get_many(model_key(lang, INFERENCE_BACKEND), texts)
+    misses = sum(1 for result in results if result is None)
+    metrics.CACHE_LOOKUPS.labels("hit").inc(len(texts) - misses)
+    metrics.CACHE_LOOKUPS.labels("miss").inc(misses)
+    return results
+
+def build_responses(results: List[List[dict]], lang: str, top_k: int = 0, all_scores: bool = False) -> List[dict]:
+    # results - полные распределения модели, по одному на текст
+    with metrics.stage("aggregate"):
+        if lang == "ru": # Обработка русского текста: метки модели отдаем как есть
+            ranked = [[(item["label"], item["score"]) for item in sorted(result, key=lambda x: -x["score"])] for result in results]
+        else: # Обработка английского текста: argmax по сумме вероятностей в каждой категории
+            ranked = en_aggregator.top(en_aggregator.aggregate(results), len(EMOTIONS))
+        head = heads.get(lang)
+        if head is not None: # Поправка по голосам пользователей поверх ответа модели
+            ranked = head.rank(results, ranked)
+
+    responses = []
+    for scores in ranked:
+        emotion, confidence = scores[0]
+        logger.debug(f"[{metrics.trace_id.get()}] {lang}: {emotion} ({confidence:.3f})")
+        response = {
+            "emotion": emotion,  # Ключ эмоции
+            "label": EMOTIONS.get(emotion, {}).get(lang, emotion), # Локализованное название
+            "confidence": confidence, # Уверенность модели (0-1)
+            "language": lang # Язык текста ("ru" или "en")
+        }
+        if top_k > 0:
+            response["top"] = [
+                {"emotion": name, "label": EMOTIONS.get(name, {}).get(lang, name), "score": score}
+                for name, score in scores[:top_k]
+            ]
+        if all_scores:
+            response["scores"] = dict(scores)
+        responses.append(response)
+    return responses
+
+async def predict_texts(texts: List[str], top_k: int = 0, all_scores: bool = False) -> List[dict]:
+    # Группируем тексты по языку, каждый язык идет в свои батчи.
+    # В режиме MIXED_ROUTING смешанный текст попадает в обе группы
+    routes = [route_language(text) for text in texts]
+    groups: Dict[str, List[int]] = {}
+    for i, route in enumerate(routes):
+        langs = ("ru", "en") if MIXED_ROUTING and route.mixed else (route.lang,)
+        for lang in langs:
+            groups.setdefault(lang, []).append(i)
+    for lang, indices in groups.items():
+        metrics.REQUESTS.labels(lang).inc(len(indices))
+
+    # Сначала кэш: запрос, который целиком в кэше, не занимает очередь и не получает 503.
+    # Места в очереди считаются по окнам - длинный текст уходит в модель несколькими проходами
+    outputs = await asyncio.gather(*(lookup(lang, [texts[i] for i in indices]) for lang, indices in groups.items()))
+    misses = [
+        (lang, output, j, indices[j], split_text(texts[indices[j]], MAX_CHUNK_CHARS))
+        for (lang, indices), output in zip(groups.items(), outputs)
+        for j, result in enumerate(output) if result is None
+    ]
+    if misses:
+        with executor.admit(sum(len(chunks) for *_, chunks in misses)):
+            computed = await asyncio.gather(*(classify_chunks(lang, chunks) for lang, *_, chunks in misses))
+        for (lang, output, j, i, _), result in zip(misses, computed):
+            cache.put(model_key(lang, INFERENCE_BACKEND), texts[i], result)
+            output[j] = result
+
+    results = [None] * len(texts)
+    for (lang, indices), output in zip(groups.items(), outputs):
+        responses = build_responses(output, lang, top_k, all_scores)
+        for i, response in zip(indices, responses):
+            response["language_confidence"] = routes[i].share(lang)
+            # Из двух моделей побеждает ответ с большей уверенностью с учетом доли алфавита
+            current = results[i]
+            if current is None or (
+                response["confidence"] * response["language_confidence"]
+                > current["confidence"] * current["language_confidence"]
+            ):
+                results[i] = response
+    return results
 
 @app.post("/predict")
-def predict(request: TextRequest):
+async def predict(request: TextRequest):
+    return (await predict_texts([request.text], request.top_k, request.all_scores))[0]
+
+@app.post("/predict_batch")
+async def predict_batch(request: TextBatchRequest):
+    return {"results": await predict_texts(request.texts, request.top_k, request.all_scores)}
+
+@app.post("/predict_stream")
+async def predict_stream(request: TextRequest):
+    """
+    NDJSON: по строке на каждое окно текста по мере готовности, последняя строка - итог.
+    Места в очереди занимаются до отправки заголовков, поэтому при переполнении
+    клиент получает тот же 503 с Retry-After, что и от /predict. Итог берется
+    из кэша предсказаний и сохраняется в него. Текст идет в одну модель по
+    преобладающему алфавиту: MIXED_ROUTING здесь не применяется
+    """
     text = request.text
-    lang = detect_language(text)
-    # Обработка русского текста
-    if lang == "ru":
-        result = ru_model(text)[0]
-        print(f"Raw RU model output: {result}")  # Логирование
-        emotion = result["label"]
-    else: # Обработка английского текста
-        result = en_model(text)[0]
-        print(f"Raw EN model output: {result}")  # Логирование
-        emotion_map = { # Маппинг эмоций английской модели к нашим категориям
-            "admiration": "gratitude",
-            "amusement": "joy",
-            "anger": "anger",
-            "annoyance": "anger",
-            "approval": "gratitude",
-            "caring": "love",
-            "confusion": "confusion",
-            "curiosity": "excitement",
-            "desire": "love",
-	    "disappointment": "sadness",
-            "disapproval": "anger",
-            "disgust": "disgust",
-            "embarrassment": "embarrassment",
-            "excitement": "excitement",
-            "fear": "fear",
-            "gratitude": "gratitude",
-            "grief": "sadness",
-            "joy": "joy",
-            "love": "love",
-            "nervousness": "fear",
-            "optimism": "joy",
-            "pride": "joy",
-            "realization": "surprise",
-            "relief": "serenity",
-            "remorse": "shame",
-            "sadness": "sadness",
-            "surprise": "surprise",
-            "neutral": "neutral"
-        }
-        emotion = emotion_map.get(result['label'], "neutral")
-    
-    print(f"Final emotion: {emotion}")  #Логирование итоговой эмоции
-    localized_label = EMOTIONS.get(emotion, {}).get(lang, emotion)
-    
-    return {
-        "emotion": emotion,  # Ключ эмоции
-        "label": localized_label, # Локализованное название
-        "confidence": result["score"], # Уверенность модели (0-1)
-        "language": lang # Язык текста ("ru" или "en")
-    }
+    route = route_language(text)
+    lang = route.lang
+    chunks = split_text(text, MAX_CHUNK_CHARS)
+    model_id = model_key(lang, INFERENCE_BACKEND)
+    metrics.REQUESTS.labels(lang).inc()
+
+    with metrics.stage("cache"):
+        cached = (await cache.get_many(model_id, [text]))[0]
+    metrics.CACHE_LOOKUPS.labels("hit" if cached is not None else "miss").inc()
+    release = executor.reserve(len(chunks)) if cached is None else None
+
+    def line(output: List[dict], **fields) -> str:
+        # Те же поля, что у /predict, плюс номер окна или признак итога
+        response = build_responses([output], lang, request.top_k, request.all_scores)[0]
+        response["language_confidence"] = route.share(lang)
+        return json.dumps({**fields, "chunks": len(chunks), **response}, ensure_ascii=False) + "\n"
+
+    async def stream():
+        if cached is not None:
+            yield line(cached, final=True)
+            return
+        try:
+            async def run_chunk(index: int):
+                return index, await batcher.submit(lang, chunks[index])
+
+            outputs = [None] * len(chunks)
+            for next_done in asyncio.as_completed([run_chunk(i) for i in range(len(chunks))]):
+                index, output = await next_done
+                outputs[index] = output
+                yield line(output, chunk=index)
+        finally:
+            release()
+
+        pooled = outputs[0] if len(chunks) == 1 else pool_scores(outputs, chunks)
+        cache.put(model_id, text, pooled)
+        yield line(pooled, final=True)
+
+    # Если клиент ушел до начала ответа, генератор не запустится - места освобождает фоновая задача
+    async def cleanup():
+        release()
+
+    background = BackgroundTask(cleanup) if release is not None else None
+    return StreamingResponse(stream(), media_type="application/x-ndjson", background=background)
+
+@app.get("/health")
+def health():
+    # Liveness: процесс жив, даже если модели еще грузятся
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    # Readiness: модели из PRELOAD_LANGS загружены, можно отдавать трафик
+    status = executor.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+@app.get("/heads")
+def heads_status():
+    # Загруженные головы: когда обучены, на скольких голосах, точность до и после
+    return heads.status()
+
+@app.post("/heads/reload")
+def heads_reload():
+    return heads.reload()
+
+@app.get("/workers")
+def workers():
+    # Память мастера и каждого воркера (RSS, PSS, общая и частная); без prefork - только этот процесс
+    return workers_memory()
+
+@app.get("/metrics")
+def metrics_endpoint():
+    # Метрики в текстовом формате Prometheus
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
-    import uvicorn # Запуск сервера FastAPI
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    if API_WORKERS > 1:
+        # Несколько процессов на одном порту с общей копией весов (см. prefork.py)
+        from prefork import PreforkServer
+        import inference
+        logging.basicConfig(level=logging.INFO)
+        if INFERENCE_MODE != "thread":
+            logger.warning("API_WORKERS > 1 uses INFERENCE_MODE=thread in every worker")
+        # Воркеры импортируют app заново и читают эти настройки при импорте
+        os.environ["INFERENCE_MODE"] = "thread"
+        os.environ["TORCH_THREADS"] = str(WORKER_TORCH_THREADS)
+        cache.close() # Соединение SQLite нельзя переносить через fork, у каждого воркера свое
+        preload = None
+        if INFERENCE_BACKEND == "torch":
+            preload = lambda: inference.preload_models(INFERENCE_BACKEND, PRELOAD_LANGS)
+        else:
+            # Сессии ONNX Runtime создают пулы потоков при загрузке, после fork они не работают
+            logger.warning(f"Backend {INFERENCE_BACKEND} is loaded separately in every worker")
+        server = PreforkServer("app", API_HOST, API_PORT, API_WORKERS, report_interval=MEMORY_REPORT_INTERVAL)
+        server.serve(preload)
+    else:
+        import uvicorn # Запуск сервера FastAPI
+        uvicorn.run(app, host=API_HOST, port=API_PORT)
@@ -0,0 +1,72 @@
+# batching.py - динамический микробатчинг запросов к моделям
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+import metrics
+
+
+class MicroBatcher:
+    """
+    Собирает одновременные запросы в батчи отдельно для каждого языка.
+    Батч уходит в модель, когда набралось max_batch_size текстов
+    или прошло max_wait секунд с момента первого запроса в батче.
+    Каждый вызывающий получает свой результат через Future
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[str, List[str]], Awaitable[List[Any]]],
+        max_batch_size: int = 16,
+        max_wait: float = 0.01,
+    ):
+        self.run_batch = run_batch  # async (lang, texts) -> результаты в том же порядке
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future, float]]] = {}  # (текст, результат, время постановки)
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def submit(self, lang: str, text: str) -> Any:
+        # Ставит текст в очередь своего языка и ждет результат
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(lang, [])
+        pending.append((text, future, time.perf_counter()))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(lang)
+        elif len(pending) == 1:
+            self._timers[lang] = loop.call_later(self.max_wait, self._flush, lang)
+        return await future
+
+    async def submit_many(self, lang: str, texts: Sequence[str]) -> List[Any]:
+        # Тексты из одного запроса попадают в общие батчи вместе с остальными
+        return list(await asyncio.gather(*(self.submit(lang, text) for text in texts)))
+
+    def _flush(self, lang: str):
+        timer = self._timers.pop(lang, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(lang, None)
+        if not pending:
+            return
+        task = asyncio.ensure_future(self._run(lang, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, lang: str, pending: List[Tuple[str, asyncio.Future, float]]):
+        texts = [text for text, _, _ in pending]
+        started = time.perf_counter()
+        for _, _, queued in pending:
+            metrics.STAGE_LATENCY.labels("queue_wait").observe(started - queued)
+        try:
+            results = await self.run_batch(lang, texts)
+        except Exception as e:
+            for _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,168 @@
+# cache.py - кэш предсказаний моделей по нормализованному тексту
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    # Регистр не трогаем: русская модель чувствительна к регистру
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+# Меняется при смене формата значений, чтобы не читать старые записи с диска
+CACHE_VERSION = 2
+
+def cache_key(model_id: str, text: str) -> str:
+    digest = hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+    return f"v{CACHE_VERSION}:{model_id}:{digest}"
+
+
+class PredictionCache:
+    """
+    LRU-кэш ответов модели с ограничением по размеру и необязательным TTL.
+    Если указан disk_path, записи дублируются в SQLite и переживают рестарт.
+    Память читается и пишется сразу, а SQLite - только в отдельном потоке:
+    промахи памяти дочитываются с диска через get_many, новые записи
+    копятся и сохраняются пачками по write_batch одним коммитом
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: Optional[float] = None,
+        disk_path: Optional[str] = None,
+        write_batch: int = 64,
+        write_interval: float = 1.0,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.write_batch = write_batch  # Записей в одном коммите
+        self.write_interval = write_interval  # Не дольше стольких секунд держим записи в памяти до коммита
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._db = None
+        self._io: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Tuple[str, str, float]] = []  # Записи, еще не отправленные на диск
+        self._last_write = time.monotonic()
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            if ttl is not None:
+                # Чистим записи, устаревшие пока сервис был выключен
+                self._db.execute("DELETE FROM predictions WHERE created < ?", (time.time() - ttl,))
+            self._db.commit()
+            # Один поток на все обращения к SQLite: чтения и записи идут по порядку
+            self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-io")
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is not None and not self._expired(item[0]):
+            self._items.move_to_end(key)
+            return item[1]
+        if item is not None:
+            del self._items[key]
+        return None
+
+    def _read_disk(self, keys: List[str]) -> List[Optional[Tuple[float, Any]]]:
+        # Выполняется в потоке cache-io
+        rows = []
+        for key in keys:
+            row = self._db.execute("SELECT value, created FROM predictions WHERE key = ?", (key,)).fetchone()
+            rows.append((row[1], json.loads(row[0])) if row and not self._expired(row[1]) else None)
+        return rows
+
+    def _write_disk(self, batch: List[Tuple[str, str, float]]):
+        # Выполняется в потоке cache-io: вся пачка - один коммит
+        self._db.executemany("INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)", batch)
+        self._db.commit()
+
+    def _resolve(self, keys: List[str], values: List[Optional[Any]], rows) -> List[Optional[Any]]:
+        # Найденное на диске возвращается в память; считаем попадания и промахи
+        missing = [i for i, value in enumerate(values) if value is None]
+        for i, row in zip(missing, rows or [None] * len(missing)):
+            if row is not None:
+                self._remember(keys[i], *row)
+                values[i] = row[1]
+                self.disk_hits += 1
+        found = sum(1 for value in values if value is not None)
+        self.hits += found
+        self.misses += len(values) - found
+        return values
+
+    def get(self, model_id: str, text: str) -> Optional[Any]:
+        # Блокирующий вариант для офлайн-скриптов; в event loop - get_many
+        key = cache_key(model_id, text)
+        value = self._lookup(key)
+        rows = None
+        if value is None and self._io is not None:
+            rows = self._io.submit(self._read_disk, [key]).result()
+        return self._resolve([key], [value], rows)[0]
+
+    async def get_many(self, model_id: str, texts: List[str]) -> List[Optional[Any]]:
+        # Память проверяется сразу, на диск идут только промахи и не блокируют event loop
+        keys = [cache_key(model_id, text) for text in texts]
+        values = [self._lookup(key) for key in keys]
+        missing = [keys[i] for i, value in enumerate(values) if value is None]
+        rows = None
+        if missing and self._io is not None:
+            rows = await asyncio.wrap_future(self._io.submit(self._read_disk, missing))
+        return self._resolve(keys, values, rows)
+
+    def put(self, model_id: str, text: str, value: Any):
+        key = cache_key(model_id, text)
+        created = time.time()
+        self._remember(key, created, value)
+        if self._io is not None:
+            self._pending.append((key, json.dumps(value), created))
+            if len(self._pending) >= self.write_batch or time.monotonic() - self._last_write >= self.write_interval:
+                self.flush()
+
+    def flush(self) -> Optional[Future]:
+        # Отправляет накопленные записи в поток cache-io, не дожидаясь коммита
+        if not self._pending:
+            return None
+        batch, self._pending = self._pending, []
+        self._last_write = time.monotonic()
+        return self._io.submit(self._write_disk, batch)
+
+    def _remember(self, key: str, created: float, value: Any):
+        self._items[key] = (created, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)  # Вытесняем самую старую запись
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "pending_writes": len(self._pending),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._io.shutdown(wait=True)  # Дожидаемся записи последних пачек
+            self._io = None
+            self._db.close()
+            self._db = None
@@ -0,0 +1,51 @@
+# chunking.py - разбиение длинных текстов на окна и объединение оценок
+import re
+from typing import Dict, List
+
+# Конец предложения: . ! ? … и переводы строк
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def split_text(text: str, max_chars: int = 1000) -> List[str]:
+    """
+    Делит текст на окна не длиннее max_chars, стараясь резать по предложениям.
+    Слишком длинное предложение режется по словам, слишком длинное слово - как есть
+    """
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+
+    # Склеиваем соседние предложения, пока окно не заполнится
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks or [text[:max_chars]]
+
+def pool_scores(chunk_results: List[List[dict]], chunks: List[str]) -> List[dict]:
+    # Среднее оценок по окнам, взвешенное по длине окна
+    total = sum(len(chunk) for chunk in chunks) or 1
+    pooled: Dict[str, float] = {}
+    for result, chunk in zip(chunk_results, chunks):
+        weight = len(chunk) / total
+        for item in result:
+            pooled[item["label"]] = pooled.get(item["label"], 0.0) + item["score"] * weight
+    return sorted(({"label": label, "score": score} for label, score in pooled.items()), key=lambda x: -x["score"])
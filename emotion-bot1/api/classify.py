@@ -0,0 +1,310 @@
+# classify.py - офлайн-разметка больших корпусов без HTTP: поток из файла через пул процессов
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)  # Общие модули проекта (common/)
+
+from common.language import route_language
+from aggregation import EN_EMOTION_MAP, ScoreAggregator
+from chunking import pool_scores, split_text
+import inference
+
+# Границы корзин по длине в символах: тексты близкой длины идут в один батч,
+# чтобы паддинг до самого длинного текста не съедал время прохода
+LENGTH_BUCKETS = (64, 256, 1024)
+CHECKPOINT_INTERVAL = 10.0  # Как часто сохранять прогресс, сек
+
+# Record: (номер строки во входе, исходные поля, которые нужно перенести в результат, текст)
+Record = Tuple[int, dict, str]
+
+_aggregator: Optional[ScoreAggregator] = None
+
+
+# ================== ЧТЕНИЕ ВХОДА ==================
+def read_jsonl(path: str, text_field: str, id_field: Optional[str]) -> Iterator[Tuple[dict, str]]:
+    # Строка - объект с полем текста или просто строка JSON
+    # Битые строки, JSON другого типа (число, список, null) и не строка в поле текста пропускаются с предупреждением
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                print(f"{path}:{line_no}: skipped malformed JSON: {e}", file=sys.stderr)
+                continue
+            if isinstance(item, str):
+                yield {}, item
+            elif not isinstance(item, dict):
+                print(f"{path}:{line_no}: skipped {type(item).__name__}, expected object or string", file=sys.stderr)
+            elif not isinstance(item.get(text_field) or "", str):
+                # Число, список или объект в поле текста упали бы уже в модели и остановили весь прогон
+                print(f"{path}:{line_no}: skipped {type(item[text_field]).__name__} in field {text_field}, expected string", file=sys.stderr)
+            else:
+                yield ({"id": item.get(id_field)} if id_field else {}), item.get(text_field) or ""
+
+def read_csv(path: str, text_field: str, id_field: Optional[str]) -> Iterator[Tuple[dict, str]]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            yield ({"id": row.get(id_field)} if id_field else {}), row.get(text_field) or ""
+
+def read_storage(path: str, table: str) -> Iterator[Tuple[dict, str]]:
+    # Переразметка данных бота прямо из bot/data/user_data.db; прежняя эмоция сохраняется для сравнения
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        if table == "history":
+            rows = db.execute("SELECT rowid, user_id, text, emotion FROM history ORDER BY rowid")
+            for rowid, user_id, text, emotion in rows:
+                yield {"id": rowid, "user_id": user_id, "previous_emotion": emotion}, text
+        else:
+            rows = db.execute("SELECT text, emotion FROM message_to_emotion ORDER BY text")
+            for text, emotion in rows:
+                yield {"id": text, "previous_emotion": emotion}, text
+    finally:
+        db.close()
+
+def read_records(path: str, text_field: str = "text", id_field: str = None, table: str = "history") -> Iterator[Record]:
+    if path.endswith(".csv"):
+        source = read_csv(path, text_field, id_field)
+    elif path.endswith(".db"):
+        source = read_storage(path, table)
+    else:
+        source = read_jsonl(path, text_field, id_field)
+    for index, (meta, text) in enumerate(source):
+        yield index, meta, text
+
+
+# ================== РАЗБИЕНИЕ НА БАТЧИ ==================
+def length_bucket(text: str) -> int:
+    for i, bound in enumerate(LENGTH_BUCKETS):
+        if len(text) <= bound:
+            return i
+    return len(LENGTH_BUCKETS)
+
+def make_batches(records: Iterator[Record], batch_size: int, max_buffered: int) -> Iterator[Tuple[str, List[Record]]]:
+    """
+    Раскладывает поток по корзинам (язык, длина) и отдает полные батчи.
+    Если всего накоплено больше max_buffered текстов, досрочно уходит корзина
+    с самой старой записью - так память постоянна, а редкие корзины не задерживают прогресс
+    """
+    buffers: Dict[Tuple[str, int], List[Record]] = {}
+    buffered = 0
+    for record in records:
+        key = (route_language(record[2]).lang, length_bucket(record[2]))
+        buffer = buffers.setdefault(key, [])
+        buffer.append(record)
+        buffered += 1
+        if len(buffer) >= batch_size:
+            buffered -= len(buffer)
+            yield key[0], buffers.pop(key)
+        elif buffered > max_buffered:
+            oldest = min(buffers, key=lambda k: buffers[k][0][0])
+            buffered -= len(buffers[oldest])
+            yield oldest[0], buffers.pop(oldest)
+    for (lang, _), buffer in sorted(buffers.items(), key=lambda item: item[1][0][0]):
+        yield lang, buffer
+
+
+# ================== ВОРКЕР ==================
+def classify_batch(lang: str, records: List[Record], max_chunk_chars: int, top_k: int) -> List[dict]:
+    # Выполняется в процессе пула: длинные тексты делятся на окна, окна всего батча - один проход модели
+    global _aggregator
+    chunked = [split_text(text, max_chunk_chars) for _, _, text in records]
+    flat = [chunk for chunks in chunked for chunk in chunks]
+    outputs, _ = inference._infer(lang, flat)
+
+    results, offset = [], 0
+    for chunks in chunked:
+        window = outputs[offset:offset + len(chunks)]
+        offset += len(chunks)
+        results.append(window[0] if len(chunks) == 1 else pool_scores(window, chunks))
+
+    if lang == "ru":
+        ranked = [[(item["label"], item["score"]) for item in sorted(result, key=lambda x: -x["score"])] for result in results]
+    else:
+        if _aggregator is None:
+            _aggregator = ScoreAggregator(EN_EMOTION_MAP, list(dict.fromkeys(EN_EMOTION_MAP.values())))
+        ranked = _aggregator.top(_aggregator.aggregate(results), max(1, top_k))
+
+    rows = []
+    for (index, meta, text), scores in zip(records, ranked):
+        emotion, confidence = scores[0]
+        row = {"index": index, **meta, "emotion": emotion, "confidence": confidence, "language": lang,
+               "language_confidence": route_language(text).confidence}
+        if top_k > 0:
+            row["top"] = [{"emotion": name, "score": score} for name, score in scores[:top_k]]
+        rows.append(row)
+    return rows
+
+
+# ================== КОНТРОЛЬНЫЕ ТОЧКИ ==================
+class Checkpoint:
+    """
+    Прогресс прогона: watermark - номер первой записи, которая еще не записана
+    в результат (все записи до него точно записаны). Записи после watermark могли
+    уже попасть в вывод, при продолжении их номера берутся из самого файла вывода
+    """
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = input_path
+        self.watermark = 0
+        self.written = 0
+        self._done = set()  # Записанные номера за watermark - их немного, порядок нарушают только батчи в работе
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state["input"] != os.path.abspath(self.input_path):
+            raise ValueError(f"Checkpoint {self.path} belongs to {state['input']}")
+        self.watermark = state["watermark"]
+        self.written = state["written"]
+        return True
+
+    def mark(self, index: int):
+        self._done.add(index)
+        while self.watermark in self._done:
+            self._done.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self):
+        # Атомарная запись: при сбое остается предыдущая контрольная точка
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"input": os.path.abspath(self.input_path), "watermark": self.watermark, "written": self.written}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+def recover_output(output_path: str, checkpoint: Checkpoint) -> set:
+    """
+    Готовит вывод к продолжению: отрезает недописанную последнюю строку
+    и возвращает номера записей за watermark, которые уже есть в файле
+    """
+    already = set()
+    if not os.path.exists(output_path):
+        return already
+    with open(output_path, "rb+") as f:
+        valid = lines = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid += len(line)
+            lines += 1
+            index = json.loads(line)["index"]
+            if index >= checkpoint.watermark:
+                already.add(index)
+        f.truncate(valid)
+    checkpoint.written = lines
+    for index in already:
+        checkpoint.mark(index)
+    return already
+
+
+# ================== ЗАПУСК ==================
+def run(args) -> dict:
+    checkpoint = Checkpoint(args.checkpoint or args.output + ".checkpoint", args.input)
+    resumed = args.resume and checkpoint.load()
+    already = recover_output(args.output, checkpoint) if resumed else set()
+    start_from = checkpoint.watermark
+
+    # Записи нумеруются подряд, поэтому срез по номерам прекращает чтение сразу после лимита
+    stop = start_from + args.limit if args.limit else None
+    records = (
+        record for record in itertools.islice(
+            read_records(args.input, args.text_field, args.id_field, args.table), start_from, stop)
+        if record[0] not in already
+    )
+    batches = make_batches(records, args.batch_size, args.batch_size * args.max_buffered_batches)
+
+    workers = args.workers or os.cpu_count() or 1
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=inference._init_worker,
+        initargs=(torch_threads, args.backend, []),  # Модели языков грузятся по первому батчу
+    )
+    started = time.perf_counter()
+    processed = 0
+    last_save = time.monotonic()
+    max_in_flight = workers * 2  # В очереди пула не больше двух батчей на воркер
+
+    with open(args.output, "a" if resumed else "w", encoding="utf-8") as out:
+        in_flight = set()
+
+        def drain(return_when):
+            nonlocal processed, last_save
+            done, _ = wait(in_flight, return_when=return_when)
+            for future in done:
+                in_flight.remove(future)
+                for row in future.result():
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    checkpoint.mark(row["index"])
+                    checkpoint.written += 1
+                    processed += 1
+            if time.monotonic() - last_save >= CHECKPOINT_INTERVAL:
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.save()
+                last_save = time.monotonic()
+                rate = processed / (time.perf_counter() - started)
+                print(f"{checkpoint.written} written, {rate:.1f} texts/s", file=sys.stderr)
+
+        try:
+            for lang, batch in batches:
+                in_flight.add(pool.submit(classify_batch, lang, batch, args.max_chunk_chars, args.top_k))
+                if len(in_flight) >= max_in_flight:
+                    drain(FIRST_COMPLETED)
+            while in_flight:
+                drain(FIRST_COMPLETED)
+        finally:
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.save()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "processed": processed,
+        "written": checkpoint.written,
+        "seconds": round(elapsed, 3),
+        "texts_per_sec": round(processed / elapsed, 1) if elapsed else 0.0,
+        "resumed_from": start_from if resumed else None,
+    }
+
+
+if __name__ == "__main__":
+    # python api/classify.py chats.jsonl labeled.jsonl --workers 8
+    # python api/classify.py bot/data/user_data.db history_rescored.jsonl --table history --resume
+    parser = argparse.ArgumentParser(description="Offline bulk emotion classification (JSONL, CSV or bot SQLite storage)")
+    parser.add_argument("input", help="Файл .jsonl, .csv или .db (хранилище бота)")
+    parser.add_argument("output", help="Файл результатов JSONL, дописывается по мере готовности")
+    parser.add_argument("--text-field", default="text", help="Поле с текстом в JSONL/CSV")
+    parser.add_argument("--id-field", help="Поле с идентификатором, переносится в результат")
+    parser.add_argument("--table", default="history", choices=["history", "message_to_emotion"], help="Таблица для входа .db")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-buffered-batches", type=int, default=8, help="Сколько батчей можно копить по корзинам")
+    parser.add_argument("--workers", type=int, default=0, help="Процессов, 0 - по числу ядер")
+    parser.add_argument("--torch-threads", type=int, default=0, help="Потоков torch на процесс, 0 - ядра поровну")
+    parser.add_argument("--backend", default=os.getenv("INFERENCE_BACKEND", "torch"), choices=["torch", "onnx", "int8"])
+    parser.add_argument("--max-chunk-chars", type=int, default=int(os.getenv("MAX_CHUNK_CHARS", "1000")))
+    parser.add_argument("--top-k", type=int, default=0, help="Добавить k самых вероятных эмоций")
+    parser.add_argument("--checkpoint", help="Файл прогресса, по умолчанию <output>.checkpoint")
+    parser.add_argument("--resume", action="store_true", help="Продолжить прерванный прогон")
+    parser.add_argument("--limit", type=int, default=0, help="Обработать не больше стольких записей")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args)), file=sys.stderr)
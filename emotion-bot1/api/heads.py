@@ -0,0 +1,154 @@
+# heads.py - обучаемая по голосам пользователей "голова" поверх ответов модели
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPS = 1e-6
+
+
+def score_features(results: List[List[dict]], labels: List[str]) -> np.ndarray:
+    # Признаки текста - логарифмы нормированных оценок всех меток модели в фиксированном порядке
+    index = {label: i for i, label in enumerate(labels)}
+    scores = np.zeros((len(results), len(labels)), dtype=np.float64)
+    for i, result in enumerate(results):
+        for item in result:
+            j = index.get(item["label"])
+            if j is not None:
+                scores[i, j] = item["score"]
+    totals = scores.sum(axis=1, keepdims=True)
+    np.divide(scores, totals, out=scores, where=totals > 0)
+    return np.log(scores + EPS)
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class LinearHead:
+    """
+    Логистическая регрессия от оценок меток модели к эмоциям бота.
+    Ее ответ смешивается с обычным ответом с весом alpha,
+    alpha подбирается при обучении на отложенной выборке
+    """
+
+    def __init__(self, labels: List[str], classes: List[str], mean, std, weights, bias, alpha: float = 1.0, info: dict = None):
+        self.labels = list(labels)  # Метки модели - входы
+        self.classes = list(classes)  # Эмоции - выходы
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)  # (метки x эмоции)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.alpha = alpha
+        self.info = info or {}  # Когда и на чем обучена, точность до и после
+
+    def predict(self, results: List[List[dict]]) -> np.ndarray:
+        features = (score_features(results, self.labels) - self.mean) / self.std
+        return softmax(features @ self.weights + self.bias)
+
+    def rank(self, results: List[List[dict]], ranked: List[List[tuple]]) -> List[List[tuple]]:
+        # ranked - обычный ответ [(эмоция, оценка), ...], возвращается смесь в том же виде
+        mixed = []
+        for probs, base in zip(self.predict(results), ranked):
+            scores: Dict[str, float] = {}
+            if self.alpha < 1:
+                for emotion, score in base:
+                    scores[emotion] = (1 - self.alpha) * score
+            for emotion, prob in zip(self.classes, probs):
+                scores[emotion] = scores.get(emotion, 0.0) + self.alpha * float(prob)
+            mixed.append(sorted(scores.items(), key=lambda item: -item[1]))
+        return mixed
+
+    def to_dict(self) -> dict:
+        return {
+            "labels": self.labels, "classes": self.classes,
+            "mean": self.mean.tolist(), "std": self.std.tolist(),
+            "weights": self.weights.tolist(), "bias": self.bias.tolist(),
+            "alpha": self.alpha, "info": self.info,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LinearHead":
+        return cls(
+            data["labels"], data["classes"], data["mean"], data["std"],
+            data["weights"], data["bias"], data.get("alpha", 1.0), data.get("info"),
+        )
+
+    def save(self, path: str):
+        # Атомарная замена: сервис никогда не прочитает файл наполовину
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LinearHead":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class HeadStore:
+    """
+    Головы по языкам из файлов <directory>/<lang>.json. Время изменения файла
+    проверяется не чаще раза в check_interval секунд, новая версия
+    подхватывается без перезапуска сервиса, удаленный файл отключает голову
+    """
+
+    def __init__(self, directory: str, check_interval: float = 5.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._heads: Dict[str, LinearHead] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def path(self, lang: str) -> str:
+        return os.path.join(self.directory, f"{lang}.json")
+
+    def get(self, lang: str) -> Optional[LinearHead]:
+        now = time.monotonic()
+        if now - self._checked.get(lang, -self.check_interval) >= self.check_interval:
+            self._checked[lang] = now
+            self._refresh(lang)
+        return self._heads.get(lang)
+
+    def reload(self) -> dict:
+        # Немедленная проверка всех голов, не дожидаясь check_interval
+        langs = set(self._checked) | set(self._heads)
+        if os.path.isdir(self.directory):
+            langs.update(name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json"))
+        for lang in langs:
+            self._checked[lang] = time.monotonic()
+            self._refresh(lang)
+        return self.status()
+
+    def _refresh(self, lang: str):
+        path = self.path(lang)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            if self._heads.pop(lang, None) is not None:
+                logger.info(f"Head for {lang} removed")
+            self._mtimes.pop(lang, None)
+            return
+        if self._mtimes.get(lang) == mtime:
+            return
+        with self._lock:
+            try:
+                self._heads[lang] = LinearHead.load(path)
+                self._mtimes[lang] = mtime
+                logger.info(f"Head for {lang} loaded from {path}")
+            except (OSError, ValueError, KeyError) as e:
+                # Битый файл не ломает ответы: остается предыдущая версия
+                logger.error(f"Failed to load head {path}: {e}")
+
+    def status(self) -> dict:
+        return {lang: head.info for lang, head in self._heads.items()}
@@ -0,0 +1,212 @@
+# inference.py - пул воркеров для запуска моделей вне event loop
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+import metrics
+import models
+
+# Модели текущего процесса: в режиме thread они общие для всех потоков,
+# в режиме process у каждого воркера своя копия (реплика)
+_models: Dict[str, object] = {}
+_load_stats: Dict[str, dict] = {}
+_backend = "torch"
+_threads = 0  # Потоков на проход модели в этом процессе: torch.set_num_threads и сессии ONNX Runtime
+_lock = threading.Lock()
+# Быстрый токенизатор HF (Rust) нельзя вызывать из нескольких потоков одновременно
+# с padding/truncation ("Already borrowed"): токенизация идет по очереди, а прямой
+# проход модели - параллельно
+_tokenizer_lock = threading.Lock()
+
+
+class Overloaded(Exception):
+    """Очередь инференса заполнена, клиенту нужно повторить запрос позже"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+def _init_worker(torch_threads: int, backend: str, langs: List[str]):
+    # Ограничиваем число потоков torch и ONNX Runtime, чтобы воркеры не делили ядра между собой
+    global _backend, _threads
+    import torch
+    torch.set_num_threads(torch_threads)
+    _backend = backend
+    _threads = torch_threads
+    # Модели, загруженные мастером до fork (prefork.py), повторно не грузим
+    langs = [lang for lang in langs if lang not in _models]
+    if langs:
+        loaded, stats = models.load_models(backend, langs, torch_threads)
+        _models.update(loaded)
+        _load_stats.update(stats)
+
+def preload_models(backend: str, langs: List[str]):
+    """
+    Загрузка в мастер-процессе prefork до fork: воркеры получают модели
+    в _models без копирования. Прямой проход здесь не выполняется -
+    пул потоков torch, созданный до fork, в дочернем процессе не работает
+    """
+    global _backend
+    _backend = backend
+    loaded, stats = models.load_models(backend, langs)
+    _models.update(loaded)
+    _load_stats.update(stats)
+
+def _ensure_model(lang: str):
+    # Ленивая загрузка: модель языка грузится при первом запросе на этом языке
+    if lang not in _models:
+        with _lock:
+            if lang not in _models:
+                model, stats = models.load_model_timed(lang, _backend, _threads)
+                _load_stats[lang] = stats
+                _models[lang] = model
+    return _models[lang]
+
+def _infer(lang: str, texts: List[str]) -> Tuple[List[List[dict]], Dict[str, float]]:
+    # Один проход модели на весь батч, для каждого текста - оценки всех меток.
+    # Шаги пайплайна вызываются по отдельности, чтобы замерить время каждого;
+    # замеры возвращаются вместе с результатом, потому что воркер может быть другим процессом.
+    # truncation - страховка: окна длиннее лимита модели обрезаются, а не падают
+    import torch
+    model = _ensure_model(lang)
+    started = time.perf_counter()
+    with _tokenizer_lock:
+        inputs = model.tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
+    tokenized = time.perf_counter()
+    with torch.inference_mode():
+        logits = model.model(**inputs).logits
+    forwarded = time.perf_counter()
+    results = [model.postprocess({"logits": row[None]}, top_k=None) for row in logits]
+    finished = time.perf_counter()
+    return results, {
+        "tokenize": tokenized - started,
+        "forward": forwarded - tokenized,
+        "postprocess": finished - forwarded,
+    }
+
+def _worker_status() -> Dict[str, dict]:
+    # Вызывается в воркере после инициализации: какие модели загружены и как долго
+    return dict(_load_stats)
+
+
+class InferenceExecutor:
+    """
+    Выполняет проходы моделей в пуле потоков или процессов.
+    Одновременно считается не больше workers батчей, а в очереди
+    держится не больше max_queue текстов - остальные получают Overloaded.
+    Модели из preload грузятся в фоне после start(), остальные - по первому запросу
+    """
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        workers: int = 1,
+        max_queue: int = 256,
+        torch_threads: int = 0,
+        retry_after: int = 1,
+        backend: str = "torch",
+        preload: List[str] = None,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown inference mode: {mode}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.backend = backend
+        self.preload = list(models.MODEL_IDS) if preload is None else preload
+        # По умолчанию делим ядра поровну между воркерами
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.pending = 0  # Текстов в очереди и в работе
+        self._pool = None
+        self._startup: Future = None  # Завершится, когда модели из preload загружены
+
+    def start(self):
+        if self.mode == "process":
+            # spawn вместо fork: форк процесса с запущенными потоками torch может зависнуть
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.torch_threads, self.backend, self.preload),
+            )
+            # Пустые задачи заставляют пул сразу поднять всех воркеров и загрузить модели
+            pings = [self._pool.submit(_worker_status) for _ in range(self.workers)]
+            self._startup = Future()
+            threading.Thread(target=self._wait_workers, args=(pings,), daemon=True).start()
+        else:
+            # Потоки делят одну копию моделей и общий пул потоков torch
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+            loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+            self._startup = loader.submit(_init_worker, self.torch_threads, self.backend, self.preload)
+            loader.shutdown(wait=False)
+
+    def _wait_workers(self, pings: List[Future]):
+        wait(pings)
+        errors = [ping.exception() for ping in pings if ping.exception() is not None]
+        if errors:
+            self._startup.set_exception(errors[0])
+        else:
+            self._startup.set_result(pings[0].result())
+
+    @property
+    def ready(self) -> bool:
+        return self._startup is not None and self._startup.done() and self._startup.exception() is None
+
+    def status(self) -> dict:
+        if self._startup is not None and self._startup.done() and self._startup.exception() is not None:
+            return {"ready": False, "error": str(self._startup.exception())}
+        # В режиме process статистика приходит от первого воркера
+        stats = self._startup.result() if self.mode == "process" and self.ready else dict(_load_stats)
+        return {"ready": self.ready, "mode": self.mode, "backend": self.backend, "models": stats}
+
+    def reserve(self, count: int = 1) -> Callable[[], None]:
+        """
+        Занимает count мест в очереди или бросает Overloaded. Возвращает функцию
+        освобождения; повторный вызов ничего не делает, поэтому ее можно
+        вызывать из нескольких мест (например, из потокового ответа и его очистки)
+        """
+        metrics.QUEUE_DEPTH.observe(self.pending)
+        if self.pending + count > self.max_queue:
+            metrics.OVERLOADED.inc()
+            raise Overloaded(self.retry_after)
+        self.pending += count
+        metrics.QUEUE_PENDING.set(self.pending)
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.pending -= count
+                metrics.QUEUE_PENDING.set(self.pending)
+
+        return release
+
+    @contextmanager
+    def admit(self, count: int = 1):
+        # Пропускает запрос, только если в очереди есть место
+        release = self.reserve(count)
+        try:
+            yield
+        finally:
+            release()
+
+    async def run(self, lang: str, texts: List[str]) -> List[List[dict]]:
+        # Пока идет фоновая загрузка, запросы ждут ее, а не грузят модели второй раз
+        await asyncio.wrap_future(self._startup)
+        loop = asyncio.get_running_loop()
+        metrics.BATCH_SIZE.labels(lang).observe(len(texts))
+        results, timings = await loop.run_in_executor(self._pool, _infer, lang, texts)
+        metrics.observe_worker_timings(timings)
+        return results
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
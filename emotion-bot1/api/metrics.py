@@ -0,0 +1,55 @@
+# metrics.py - метрики API в формате Prometheus и идентификатор трассировки запроса
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Идентификатор запроса: приходит от бота в заголовке X-Request-ID
+# или создается заново, попадает в логи и в ответ
+TRACE_HEADER = "X-Request-ID"
+trace_id: ContextVar[str] = ContextVar("trace_id", default="-")
+
+# Стадии: request - весь HTTP-запрос, cache - поиск в кэше, queue_wait - ожидание батча,
+# tokenize, forward, postprocess - внутри воркера, aggregate - сборка ответа
+STAGE_LATENCY = Histogram(
+    "emotion_api_stage_seconds", "Время стадии обработки", ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+BATCH_SIZE = Histogram(
+    "emotion_api_batch_size", "Текстов в одном проходе модели", ["language"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUEUE_DEPTH = Histogram(
+    "emotion_api_queue_depth", "Текстов в очереди инференса в момент приема запроса",
+    buckets=(0, 1, 4, 16, 64, 128, 256, 512, 1024),
+)
+QUEUE_PENDING = Gauge("emotion_api_queue_pending", "Текстов в очереди и в работе сейчас")
+CACHE_LOOKUPS = Counter("emotion_api_cache_lookups_total", "Обращения к кэшу предсказаний", ["result"])
+CACHE_HIT_RATE = Gauge("emotion_api_cache_hit_rate", "Доля попаданий в кэш с момента запуска")
+REQUESTS = Counter("emotion_api_texts_total", "Обработано текстов по языку модели", ["language"])
+OVERLOADED = Counter("emotion_api_overloaded_total", "Запросов отклонено из-за переполненной очереди")
+# Память процесса API: rss, pss (общие страницы поделены между воркерами prefork), shared, private
+PROCESS_MEMORY = Gauge("emotion_api_process_memory_mb", "Память процесса API, МБ", ["kind"])
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def stage(name: str):
+    # Замеряет время блока и пишет его в гистограмму стадий
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+def observe_worker_timings(timings: dict):
+    # Воркер (в том числе в другом процессе) возвращает время своих стадий вместе с результатом
+    for name, seconds in timings.items():
+        STAGE_LATENCY.labels(name).observe(seconds)
+
+def render() -> bytes:
+    return generate_latest()
@@ -0,0 +1,139 @@
+# models.py - загрузка моделей для определения эмоций
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from transformers import AutoTokenizer, pipeline
+
+logger = logging.getLogger(__name__)
+
+# Идентификаторы моделей Hugging Face для каждого языка
+MODEL_IDS = {
+    "ru": "blanchefort/rubert-base-cased-sentiment",  # Русская модель для определения эмоций
+    "en": "SamLowe/roberta-base-go_emotions",  # Английская модель для определения эмоций
+}
+# Бэкенды инференса: torch - исходные веса, onnx - ONNX Runtime, int8 - ONNX с динамической int8-квантизацией
+BACKENDS = ("torch", "onnx", "int8")
+# Куда складываются экспортированные модели
+MODEL_CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models_cache")
+)
+# Тексты для сверки бэкендов с исходной моделью
+PARITY_TEXTS = {
+    "ru": ["я победил", "лошадь съела моего друга", "под кроватью таракан", "Какое красивое платье"],
+    "en": ["I don't like you.", "I would never wear that.", "happy", "Thank you so much for your help!"],
+}
+
+def model_key(lang: str, backend: str = "torch") -> str:
+    # Ключ модели с учетом бэкенда: у квантованной модели немного другие оценки
+    return MODEL_IDS[lang] if backend == "torch" else f"{MODEL_IDS[lang]}@{backend}"
+
+def export_dir(lang: str, backend: str) -> str:
+    return os.path.join(MODEL_CACHE_DIR, MODEL_IDS[lang].replace("/", "__"), backend)
+
+def export_model(lang: str, backend: str) -> str:
+    """
+    Экспортирует модель в ONNX (и при необходимости квантует в int8) один раз,
+    дальше берет готовые файлы из MODEL_CACHE_DIR. Возвращает путь к модели
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+
+    onnx_dir = export_dir(lang, "onnx")
+    if not os.path.exists(os.path.join(onnx_dir, "model.onnx")):
+        model = ORTModelForSequenceClassification.from_pretrained(MODEL_IDS[lang], export=True)
+        model.save_pretrained(onnx_dir)
+        AutoTokenizer.from_pretrained(MODEL_IDS[lang]).save_pretrained(onnx_dir)
+    if backend == "onnx":
+        return onnx_dir
+
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    int8_dir = export_dir(lang, "int8")
+    if not os.path.exists(os.path.join(int8_dir, "model_quantized.onnx")):
+        quantizer = ORTQuantizer.from_pretrained(onnx_dir)
+        quantizer.quantize(save_dir=int8_dir, quantization_config=AutoQuantizationConfig.avx2(is_static=False))
+        AutoTokenizer.from_pretrained(onnx_dir).save_pretrained(int8_dir)
+    return int8_dir
+
+def load_model(lang: str, backend: str = "torch", threads: int = 0):
+    # threads - потоков ONNX Runtime на сессию, 0 - по умолчанию (все ядра); для torch задается через torch.set_num_threads
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == "torch":
+        return pipeline("text-classification", model=MODEL_IDS[lang])
+
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+
+    path = export_model(lang, backend)
+    file_name = "model_quantized.onnx" if backend == "int8" else "model.onnx"
+    session_options = onnxruntime.SessionOptions()
+    if threads:
+        # Иначе каждая сессия каждого воркера займет все ядра
+        session_options.intra_op_num_threads = threads
+        session_options.inter_op_num_threads = 1
+    model = ORTModelForSequenceClassification.from_pretrained(path, file_name=file_name, session_options=session_options)
+    return pipeline("text-classification", model=model, tokenizer=AutoTokenizer.from_pretrained(path))
+
+def current_rss_mb() -> float:
+    # Резидентная память процесса в МБ (Linux), иначе пиковая через getrusage
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_model_timed(lang: str, backend: str = "torch", threads: int = 0) -> Tuple[object, dict]:
+    # Загружает модель и возвращает ее вместе со временем загрузки и приростом памяти
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    model = load_model(lang, backend, threads)
+    stats = {
+        "seconds": round(time.perf_counter() - started, 2),
+        # При параллельной загрузке прирост включает и соседние модели
+        "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+    }
+    logger.info(f"Model {lang} ({backend}) loaded in {stats['seconds']} s, RSS +{stats['rss_delta_mb']} MB")
+    return model, stats
+
+def load_models(backend: str = "torch", langs: List[str] = None, threads: int = 0) -> Tuple[Dict[str, object], Dict[str, dict]]:
+    # Модели грузятся параллельно: десериализация весов отпускает GIL
+    langs = list(langs or MODEL_IDS)
+    with ThreadPoolExecutor(max_workers=max(1, len(langs))) as pool:
+        loaded = dict(zip(langs, pool.map(lambda lang: load_model_timed(lang, backend, threads), langs)))
+    return {lang: model for lang, (model, _) in loaded.items()}, {lang: stats for lang, (_, stats) in loaded.items()}
+
+def check_parity(lang: str, backend: str, texts: List[str] = None, tolerance: float = 0.05) -> List[dict]:
+    """
+    Сравнивает метки и оценки бэкенда с исходной моделью torch.
+    Возвращает расхождения: другая метка или разница оценок больше tolerance
+    """
+    texts = texts or PARITY_TEXTS[lang]
+    expected = load_model(lang, "torch")(texts)
+    actual = load_model(lang, backend)(texts)
+    mismatches = []
+    for text, want, got in zip(texts, expected, actual):
+        if want["label"] != got["label"] or abs(want["score"] - got["score"]) > tolerance:
+            mismatches.append({"text": text, "torch": want, backend: got})
+    return mismatches
+
+
+if __name__ == "__main__":
+    # Экспорт и сверка: python api/models.py onnx|int8
+    import sys
+    backend = sys.argv[1] if len(sys.argv) > 1 else "onnx"
+    failed = False
+    for lang in MODEL_IDS:
+        print(f"{lang}: exported to {export_model(lang, backend)}")
+        for mismatch in check_parity(lang, backend):
+            failed = True
+            print(f"{lang}: parity mismatch {mismatch}")
+    sys.exit(1 if failed else 0)
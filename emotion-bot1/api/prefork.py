@@ -0,0 +1,195 @@
+# prefork.py - несколько процессов API с одной копией весов моделей (fork + copy-on-write)
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MASTER_PID_ENV = "PREFORK_MASTER_PID"
+# Поля /proc/<pid>/smaps_rollup, из которых складывается отчет о памяти
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """
+    Память процесса в МБ. rss - все страницы процесса, в том числе общие с соседями;
+    pss - общие страницы делятся поровну между процессами, сумма pss по воркерам
+    и есть реальная цена пула. Только Linux, на других системах - пустой словарь
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in SMAPS_FIELDS:
+                    values[name] = int(rest.split()[0]) / 1024
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(values.get("Rss", 0.0), 1),
+        "pss_mb": round(values.get("Pss", 0.0), 1),
+        "shared_mb": round(values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0), 1),
+        "private_mb": round(values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0), 1),
+    }
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue  # Процесс уже завершился
+        # Имя процесса в скобках может содержать пробелы, поэтому поля считаем после последней ")"
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            children.append(int(name))
+    return sorted(children)
+
+def workers_memory(master_pid: Optional[int] = None) -> dict:
+    # Память мастера и всех воркеров; без prefork - только текущий процесс
+    if master_pid is None:
+        master_pid = int(os.getenv(MASTER_PID_ENV, "0")) or None
+    if master_pid is None:
+        return {"master": None, "workers": [{"pid": os.getpid(), **process_memory(os.getpid())}]}
+    workers = [{"pid": pid, **process_memory(pid)} for pid in child_pids(master_pid)]
+    master = {"pid": master_pid, **process_memory(master_pid)}
+    return {
+        "master": master,
+        "workers": workers,
+        # Столько памяти стоит весь пул; rss складывать нельзя - общие страницы посчитались бы много раз
+        "total_pss_mb": round(master.get("pss_mb", 0.0) + sum(worker.get("pss_mb", 0.0) for worker in workers), 1),
+    }
+
+
+class PreforkServer:
+    """
+    Мастер-процесс открывает порт и загружает модели, затем форкает
+    workers процессов uvicorn, которые принимают соединения с общего сокета.
+    Веса моделей воркеры читают из памяти мастера (copy-on-write): страницы
+    не копируются, пока в них никто не пишет. gc.freeze() перед fork убирает
+    загруженные объекты из обхода сборщика мусора, иначе он переписывал бы
+    их заголовки и копировал страницы в каждый воркер. Упавший воркер
+    форкается заново из мастера - без повторной загрузки моделей
+    """
+
+    def __init__(self, app_module: str, host: str, port: int, workers: int, report_interval: float = 60.0):
+        self.app_module = app_module  # Модуль с объектом app, импортируется в каждом воркере
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.report_interval = report_interval
+        self._children: Dict[int, int] = {}  # pid -> номер воркера
+        self._stopping = False
+
+    def serve(self, preload=None):
+        # preload() - загрузка моделей в мастере, выполняется до fork
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+
+        if preload is not None:
+            started = time.perf_counter()
+            preload()
+            logger.info(f"Models preloaded in master in {time.perf_counter() - started:.1f} s")
+        os.environ[MASTER_PID_ENV] = str(os.getpid())
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for number in range(self.workers):
+            self._spawn(number, sock)
+        logger.info(f"Serving on {self.host}:{self.port} with {self.workers} workers")
+
+        last_report = time.monotonic()
+        while not self._stopping:
+            time.sleep(0.5)
+            self._reap(sock)
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.monotonic()
+        self._shutdown()
+        sock.close()
+
+    def _spawn(self, number: int, sock: socket.socket):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = number
+            return
+        # Воркер: обработчики сигналов мастера не нужны, uvicorn ставит свои
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            import uvicorn
+            module = importlib.import_module(self.app_module)
+            uvicorn.Server(uvicorn.Config(module.app, log_level="info")).run(sockets=[sock])
+        except BaseException:
+            logger.exception(f"Worker {number} failed")
+            code = 1
+        finally:
+            os._exit(code)  # Не выполняем atexit и финализаторы мастера в воркере
+
+    def _reap(self, sock: socket.socket):
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            number = self._children.pop(pid, None)
+            if number is not None and not self._stopping:
+                logger.error(f"Worker {number} (pid {pid}) exited with status {status}, restarting")
+                self._spawn(number, sock)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _shutdown(self, timeout: float = 30.0):
+        # Воркеры по SIGTERM дорабатывают текущие запросы и закрывают кэш
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while self._children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()  # Все воркеры уже забраны
+                break
+            if pid:
+                self._children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        # Не успевшие завершиться воркеры добиваем и забираем их статус, чтобы не оставлять зомби
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass  # Завершился между проверкой срока и kill
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self._children.pop(pid, None)
+
+    def report(self):
+        memory = workers_memory(os.getpid())
+        for worker in memory["workers"]:
+            logger.info(
+                f"Worker pid {worker['pid']}: RSS {worker.get('rss_mb')} MB, PSS {worker.get('pss_mb')} MB, "
+                f"shared {worker.get('shared_mb')} MB, private {worker.get('private_mb')} MB"
+            )
+        logger.info(f"Pool PSS {memory['total_pss_mb']} MB (master PSS {memory['master'].get('pss_mb')} MB)")
@@ -0,0 +1,227 @@
+# train_head.py - офлайн-обучение головы по голосам пользователей и ее горячая замена в API
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)  # Общие модули проекта (common/)
+sys.path.append(os.path.join(BASE_DIR, "bot"))  # Хранилище голосов бота (persistence)
+
+from common.language import route_language
+from aggregation import EN_EMOTION_MAP, ScoreAggregator
+from cache import PredictionCache
+from chunking import pool_scores, split_text
+from heads import LinearHead, score_features, softmax
+from models import MODEL_CACHE_DIR, model_key
+import inference
+
+HEADS_DIR = os.getenv("HEADS_DIR", os.path.join(MODEL_CACHE_DIR, "heads"))
+ALPHAS = (0.0, 0.25, 0.5, 0.75, 1.0)  # Варианты веса головы в смеси с обычным ответом
+EPS_STD = 1e-6
+
+
+# ================== ВЫГРУЗКА ГОЛОСОВ ==================
+def load_votes(kind: str, data_dir: str) -> Dict[str, Dict[str, int]]:
+    from persistence import open_backend
+    backend = open_backend(kind, data_dir)
+    try:
+        return {text: dict(counts) for text, counts in backend.load_votes().items()}
+    finally:
+        backend.close()
+
+def export_dataset(votes: Dict[str, Dict[str, int]], path: str) -> int:
+    # Обучающая выборка в JSONL: текст, язык, эмоция-лидер и все голоса
+    with open(path, "w", encoding="utf-8") as f:
+        for text, counts in votes.items():
+            label = max(counts, key=counts.get)
+            row = {"text": text, "language": route_language(text).lang, "label": label, "votes": counts}
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return len(votes)
+
+
+# ================== ОЦЕНКИ МОДЕЛИ ==================
+def model_scores(lang: str, texts: List[str], backend: str, cache: PredictionCache, batch_size: int = 32, max_chunk_chars: int = 1000) -> List[List[dict]]:
+    """
+    Распределения меток модели для текстов. Сначала ищем в кэше предсказаний
+    (тот же файл, что CACHE_PATH у API), модель считает только промахи
+    и сохраняет их туда же - повторное обучение почти ничего не считает
+    """
+    model_id = model_key(lang, backend)
+    results = [cache.get(model_id, text) for text in texts]
+    misses = [i for i, result in enumerate(results) if result is None]
+    for start in range(0, len(misses), batch_size):
+        batch = misses[start:start + batch_size]
+        chunked = [split_text(texts[i], max_chunk_chars) for i in batch]
+        outputs, _ = inference._infer(lang, [chunk for chunks in chunked for chunk in chunks])
+        offset = 0
+        for i, chunks in zip(batch, chunked):
+            window = outputs[offset:offset + len(chunks)]
+            offset += len(chunks)
+            results[i] = window[0] if len(chunks) == 1 else pool_scores(window, chunks)
+            cache.put(model_id, texts[i], results[i])
+    return results
+
+
+# ================== ОБУЧЕНИЕ ==================
+def fit_softmax(features: np.ndarray, targets: np.ndarray, weights: np.ndarray, l2: float, iterations: int, lr: float):
+    # Многоклассовая логистическая регрессия градиентным спуском; targets - доли голосов (мягкие метки)
+    W = np.zeros((features.shape[1], targets.shape[1]))
+    b = np.zeros(targets.shape[1])
+    w = weights / weights.sum()
+    for _ in range(iterations):
+        error = (softmax(features @ W + b) - targets) * w[:, None]
+        W -= lr * (features.T @ error + l2 * W)
+        b -= lr * error.sum(axis=0)
+    return W, b
+
+def weighted_accuracy(ranked: List[List[tuple]], labels: List[str], weights: np.ndarray) -> float:
+    hits = sum(weight for scores, label, weight in zip(ranked, labels, weights) if scores and scores[0][0] == label)
+    return float(hits / weights.sum()) if weights.sum() else 0.0
+
+def base_ranking(lang: str, results: List[List[dict]]) -> List[List[tuple]]:
+    # Обычный ответ API без головы (как в build_responses); у русской модели это метки тональности
+    if lang == "ru":
+        return [[(item["label"], item["score"]) for item in sorted(result, key=lambda x: -x["score"])] for result in results]
+    aggregator = ScoreAggregator(EN_EMOTION_MAP, list(dict.fromkeys(EN_EMOTION_MAP.values())))
+    return aggregator.top(aggregator.aggregate(results), len(aggregator.categories))
+
+def train_language(
+    lang: str,
+    texts: List[str],
+    counts: List[Dict[str, int]],
+    results: List[List[dict]],
+    l2: float,
+    iterations: int,
+    lr: float,
+    holdout: float,
+    seed: int,
+) -> Tuple[LinearHead, dict]:
+    """
+    Признаки - логарифмы оценок меток модели, цель - доли голосов за эмоции,
+    вес примера - log(1 + голосов). Вес головы в смеси подбирается на
+    отложенной части, затем голова переобучается на всех данных
+    """
+    labels = sorted({item["label"] for result in results for item in result})
+    classes = sorted({emotion for votes in counts for emotion in votes})
+    class_index = {emotion: j for j, emotion in enumerate(classes)}
+    X = score_features(results, labels)
+    Y = np.zeros((len(texts), len(classes)))
+    for i, votes in enumerate(counts):
+        total = sum(votes.values())
+        for emotion, count in votes.items():
+            Y[i, class_index[emotion]] = count / total
+    sample_weights = np.log1p([sum(votes.values()) for votes in counts])
+    leaders = [max(votes, key=votes.get) for votes in counts]
+    base = base_ranking(lang, results)
+
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    split = max(1, int(len(order) * holdout))
+    val, train = order[:split], order[split:]
+
+    def fit(indices):
+        mean, std = X[indices].mean(axis=0), X[indices].std(axis=0) + EPS_STD
+        W, b = fit_softmax((X[indices] - mean) / std, Y[indices], sample_weights[indices], l2, iterations, lr)
+        return mean, std, W, b
+
+    mean, std, W, b = fit(train)
+    head = LinearHead(labels, classes, mean, std, W, b)
+    val_results = [results[i] for i in val]
+    val_base = [base[i] for i in val]
+    val_labels = [leaders[i] for i in val]
+    val_weights = sample_weights[val]
+    if lang == "ru":
+        # Русская модель выдает тональность (POSITIVE/NEGATIVE/NEUTRAL), а не эмоции: ее точность
+        # по голосам всегда 0, а смесь с ней бессмысленна. Голова либо заменяет ответ целиком,
+        # либо не используется; сравниваем ее с самой частой эмоцией обучающей части
+        alphas = (1.0,)
+        majority = Counter({emotion: 0.0 for emotion in classes})
+        for i in train:
+            majority[leaders[i]] += sample_weights[i]
+        reference = [[(majority.most_common(1)[0][0], 1.0)]] * len(val)
+    else:
+        alphas = ALPHAS  # alpha = 0 - это и есть обычный ответ
+        reference = val_base
+    baseline_accuracy = weighted_accuracy(reference, val_labels, val_weights)
+    scores = {0.0: baseline_accuracy}
+    for alpha in alphas:
+        head.alpha = alpha
+        scores[alpha] = weighted_accuracy(head.rank(val_results, val_base), val_labels, val_weights)
+    # Голова берется, только если строго лучше точки отсчета; при равенстве - меньший вес головы
+    best_alpha = max(scores, key=lambda alpha: (scores[alpha], -alpha))
+
+    mean, std, W, b = fit(order)
+    report = {
+        "language": lang,
+        "samples": len(texts),
+        "classes": classes,
+        "validation_samples": len(val),
+        "baseline": "majority_emotion" if lang == "ru" else "model",
+        "baseline_accuracy": round(baseline_accuracy, 4),
+        "accuracy": round(scores[best_alpha], 4),
+        "alpha": best_alpha,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return LinearHead(labels, classes, mean, std, W, b, best_alpha, report), report
+
+
+if __name__ == "__main__":
+    # python api/train_head.py --storage sqlite --cache-path cache.db
+    parser = argparse.ArgumentParser(description="Fit per-language calibration heads on user votes")
+    parser.add_argument("--storage", default=os.getenv("STORAGE_BACKEND", "sqlite"), choices=["sqlite", "journal", "json"])
+    parser.add_argument("--data-dir", default=os.path.join(BASE_DIR, "bot/data"))
+    parser.add_argument("--export", help="Сохранить обучающую выборку в JSONL")
+    parser.add_argument("--backend", default=os.getenv("INFERENCE_BACKEND", "torch"), choices=["torch", "onnx", "int8"])
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-path", default=os.getenv("CACHE_PATH", ""), help="Кэш предсказаний API (SQLite)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-chunk-chars", type=int, default=int(os.getenv("MAX_CHUNK_CHARS", "1000")))
+    parser.add_argument("--heads-dir", default=HEADS_DIR)
+    parser.add_argument("--min-samples", type=int, default=30, help="Меньше текстов с голосами - язык пропускается")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="Записать голову, даже если она не лучше обычного ответа")
+    args = parser.parse_args()
+
+    votes = load_votes(args.storage, args.data_dir)
+    if args.export:
+        print(f"Exported {export_dataset(votes, args.export)} texts to {args.export}", file=sys.stderr)
+
+    by_lang: Dict[str, List[str]] = {}
+    for text in votes:
+        by_lang.setdefault(route_language(text).lang, []).append(text)
+
+    cache = PredictionCache(max_size=0, disk_path=args.cache_path or None)
+    inference._init_worker(args.threads, args.backend, [])  # Модели грузятся лениво, только если в кэше нет оценок
+    reports = []
+    for lang, texts in sorted(by_lang.items()):
+        if len(texts) < args.min_samples:
+            reports.append({"language": lang, "samples": len(texts), "skipped": "not enough votes"})
+            continue
+        if len({emotion for text in texts for emotion in votes[text]}) < 2:
+            reports.append({"language": lang, "samples": len(texts), "skipped": "votes for a single emotion"})
+            continue
+        results = model_scores(lang, texts, args.backend, cache, args.batch_size, args.max_chunk_chars)
+        head, report = train_language(
+            lang, texts, [votes[text] for text in texts], results,
+            args.l2, args.iterations, args.lr, args.holdout, args.seed,
+        )
+        if report["alpha"] > 0 or args.force:
+            # API подхватит новый файл сам (HeadStore проверяет время изменения)
+            head.save(os.path.join(args.heads_dir, f"{lang}.json"))
+            report["saved"] = True
+        else:
+            report["saved"] = False  # Голова не улучшила ответы на отложенной выборке
+        reports.append(report)
+    cache.close()
+    print(json.dumps(reports, ensure_ascii=False, indent=2))
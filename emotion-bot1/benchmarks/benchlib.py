@@ -0,0 +1,70 @@
+# benchlib.py - общие функции бенчмарков: замеры, перцентили, запись результатов в JSON
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Sequence
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks/results")
+
+
+def percentiles(values: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    # Перцентили по ближайшему рангу, без интерполяции
+    if not values:
+        return {f"p{p}": 0.0 for p in points}
+    ordered = sorted(values)
+    return {f"p{p}": ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] for p in points}
+
+def latency_summary(seconds: Sequence[float]) -> dict:
+    # Сводка задержек в миллисекундах
+    ms = [value * 1000 for value in seconds]
+    summary = {key: round(value, 3) for key, value in percentiles(ms).items()}
+    summary["mean"] = round(sum(ms) / len(ms), 3) if ms else 0.0
+    summary["max"] = round(max(ms), 3) if ms else 0.0
+    return summary
+
+def best_of(func: Callable[[], object], repeat: int = 5) -> float:
+    # Лучшее время из нескольких прогонов - меньше всего зависит от шума системы
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def write_results(name: str, params: dict, results: List[dict], out_path: str = None) -> str:
+    """
+    Сохраняет результаты вместе с окружением (коммит, версия Python, число ядер),
+    чтобы прогоны разных версий можно было сравнить через compare.py
+    """
+    report = {
+        "benchmark": name,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+    if out_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out_path = os.path.join(RESULTS_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {out_path}", file=sys.stderr)
+    return out_path
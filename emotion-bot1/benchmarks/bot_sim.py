@@ -0,0 +1,145 @@
+# bot_sim.py - прогон обработчиков бота (analyze, handle_feedback) на заглушках Telegram и API
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+from benchlib import BASE_DIR, latency_summary, write_results
+from corpus import add_corpus_args, get_texts
+
+sys.path.insert(0, os.path.join(BASE_DIR, "bot"))
+from fake_telegram import FakeTelegram, callback_update, message_update
+
+EMOTIONS = ["joy", "sadness", "anger", "fear", "surprise", "neutral", "gratitude", "love"]
+
+
+async def start_server(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+def server_url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}"
+
+def stub_api(delay: float, seed: int) -> web.Application:
+    # API-заглушка: случайная эмоция после задержки, имитирующей модель
+    rng = random.Random(seed)
+
+    async def predict(request: web.Request) -> web.Response:
+        payload = await request.json()
+        await asyncio.sleep(delay)
+        emotion = rng.choice(EMOTIONS)
+        lang = "ru" if any("а" <= ch <= "я" for ch in payload["text"].lower()) else "en"
+        return web.json_response({"emotion": emotion, "confidence": 0.9, "language": lang, "label": emotion})
+
+    app = web.Application()
+    app.router.add_post("/predict", predict)
+    return app
+
+async def simulate(args) -> list:
+    texts = get_texts(args.corpus, args.count, args.seed)
+    rng = random.Random(args.seed)
+    fake = FakeTelegram()
+    telegram_runner = await start_server(fake.app())
+    api_runner = None
+    if args.api_url:
+        api_url = args.api_url
+    else:
+        api_runner = await start_server(stub_api(args.api_delay_ms / 1000, args.seed))
+        api_url = server_url(api_runner)
+    data_dir = tempfile.mkdtemp(prefix="bot-sim-")
+
+    # Бот читает настройки из окружения при импорте
+    os.environ.update({
+        "BOT_TOKEN": "123456:simulation",
+        "TELEGRAM_API_URL": server_url(telegram_runner),
+        "EMOTION_API_URLS": api_url,
+        "BOT_DATA_DIR": data_dir,
+        "STORAGE_BACKEND": args.storage,
+        "FSM_STORAGE": args.fsm,
+        "RATE_LIMIT_BURST": str(10 ** 9),
+        "METRICS_PORT": "0",
+    })
+    import bot as bot_module
+    from aiogram.types import Update
+
+    latencies = defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(kind: str, payload: dict):
+        update = Update.model_validate(payload, context={"bot": bot_module.bot})
+        started = time.perf_counter()
+        await bot_module.dp.feed_update(bot_module.bot, update)
+        latencies[kind].append(time.perf_counter() - started)
+
+    async def user_session(user_id: int):
+        # Сообщения одного пользователя идут по очереди, как в реальном чате
+        async with semaphore:
+            context = bot_module.dp.fsm.get_context(bot_module.bot, chat_id=user_id, user_id=user_id)
+            for _ in range(args.messages):
+                await feed("analyze", message_update(user_id, rng.choice(texts)))
+                if await context.get_state() is None:
+                    continue  # Ответ по голосованию пришел без кнопок обратной связи
+                roll = rng.random()
+                if roll < args.feedback_yes:
+                    await feed("feedback_yes", callback_update(user_id, "feedback_yes"))
+                elif roll < args.feedback_yes + args.feedback_no:
+                    await feed("feedback_no", callback_update(user_id, "feedback_no"))
+                    await feed("emotion_choice", callback_update(user_id, f"emotion_{rng.choice(EMOTIONS)}"))
+
+    await bot_module.on_startup()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(user_session(10_000 + user) for user in range(args.users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await bot_module.on_shutdown()
+        await bot_module.fsm_storage.close()
+        await bot_module.bot.session.close()
+        await telegram_runner.cleanup()
+        if api_runner is not None:
+            await api_runner.cleanup()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    updates = sum(len(values) for values in latencies.values())
+    results = [
+        {"name": "bot_updates", "handler": kind, "updates": len(values), "latency_ms": latency_summary(values)}
+        for kind, values in latencies.items()
+    ]
+    results.append({
+        "name": "bot_total",
+        "users": args.users,
+        "updates": updates,
+        "seconds": elapsed,
+        "updates_per_sec": updates / elapsed if elapsed else 0.0,
+        "telegram_calls": {method: fake.count(method) for method in sorted({name for name, _ in fake.calls})},
+    })
+    return results
+
+
+if __name__ == "__main__":
+    # python benchmarks/bot_sim.py --users 200 --messages 5 --concurrency 50
+    parser = argparse.ArgumentParser(description="Drive bot handlers with simulated Telegram updates")
+    add_corpus_args(parser, count=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=5, help="Сообщений от каждого пользователя")
+    parser.add_argument("--concurrency", type=int, default=50, help="Пользователей одновременно")
+    parser.add_argument("--feedback-yes", type=float, default=0.5, help="Доля ответов 'Подходит'")
+    parser.add_argument("--feedback-no", type=float, default=0.2, help="Доля ответов 'Не подходит' с выбором эмоции")
+    parser.add_argument("--api-url", help="Настоящий API вместо заглушки")
+    parser.add_argument("--api-delay-ms", type=float, default=20, help="Задержка API-заглушки")
+    parser.add_argument("--storage", default="sqlite", choices=["sqlite", "journal", "json"])
+    parser.add_argument("--fsm", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--out", help="Файл результатов (по умолчанию benchmarks/results/)")
+    args = parser.parse_args()
+
+    write_results("bot_sim", vars(args), asyncio.run(simulate(args)), args.out)
@@ -0,0 +1,68 @@
+# compare.py - сравнение двух прогонов бенчмарка и поиск регрессий
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+# Метрики, у которых чем больше, тем лучше; у остальных числовых - наоборот
+HIGHER_IS_BETTER = ("per_sec",)
+# Поля, которые описывают замер, а не являются его результатом
+KEY_FIELDS = ("name", "handler", "backend", "endpoint", "batch_size", "concurrency", "users", "shards")
+
+
+def _key(result: dict) -> Tuple:
+    return tuple((field, result[field]) for field in KEY_FIELDS if field in result)
+
+def _metrics(result: dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    # Все числовые поля, вложенные словари (latency_ms) разворачиваются в latency_ms.p99
+    for name, value in result.items():
+        if name in KEY_FIELDS:
+            continue
+        if isinstance(value, dict):
+            yield from _metrics(value, f"{prefix}{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + name, float(value)
+
+def compare(baseline: dict, current: dict, threshold: float) -> Dict[str, list]:
+    """
+    Сопоставляет замеры с одинаковыми ключевыми полями и возвращает
+    изменения больше threshold (0.1 - 10%) в худшую и лучшую сторону
+    """
+    base = {_key(result): dict(_metrics(result)) for result in baseline["results"]}
+    report = {"regressions": [], "improvements": []}
+    for result in current["results"]:
+        before = base.get(_key(result))
+        if before is None:
+            continue
+        for name, value in _metrics(result):
+            old = before.get(name)
+            if not old or name.endswith(("texts", "requests", "updates", "records", "ok")):
+                continue
+            change = (value - old) / old
+            if abs(change) < threshold:
+                continue
+            better = change > 0 if name.endswith(HIGHER_IS_BETTER) else change < 0
+            if "bytes" in name:
+                better = change < 0
+            entry = {"benchmark": dict(_key(result)), "metric": name, "baseline": old, "current": value, "change": round(change, 4)}
+            report["improvements" if better else "regressions"].append(entry)
+    return report
+
+
+if __name__ == "__main__":
+    # python benchmarks/compare.py results/micro-old.json results/micro-new.json --threshold 0.1
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Относительное изменение, которое считается значимым")
+    args = parser.parse_args()
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    report = compare(baseline, current, args.threshold)
+    report["baseline_commit"] = baseline.get("commit")
+    report["current_commit"] = current.get("commit")
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    sys.exit(1 if report["regressions"] else 0)  # Ненулевой код - для CI
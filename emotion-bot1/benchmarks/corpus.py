@@ -0,0 +1,108 @@
+# corpus.py - генератор воспроизводимого корпуса RU/EN/смешанных текстов для бенчмарков
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from typing import Iterator, List, Tuple
+
+from benchlib import BASE_DIR
+
+sys.path.insert(0, BASE_DIR)  # Общие модули проекта (common/)
+from common.language import detect_language
+
+DATA_FILE = os.path.join(BASE_DIR, "bot/data/user_data.json")
+
+# Запасные фразы, если user_data.json нет или в нем мало текстов одного языка
+FALLBACK_TEXTS = {
+    "ru": [
+        "я победил в споре", "красивый закат", "лошадь съела моего друга",
+        "я думал, мы друзья", "классное платье", "мне страшно идти одному домой",
+        "спасибо тебе за помощь", "не знаю, что теперь делать",
+    ],
+    "en": [
+        "I don't like you.", "I would never wear that.", "What a beautiful morning!",
+        "Thank you so much for your help.", "I'm so tired of waiting.",
+        "This is the best day of my life.", "I can't believe you did that.", "Leave me alone.",
+    ],
+}
+# Доли RU, EN и смешанных текстов
+DEFAULT_MIX = (0.45, 0.45, 0.1)
+# Длина текста в словах - логнормальная: в основном короткие сообщения, изредка длинные
+LENGTH_MEDIAN_WORDS = 8
+LENGTH_SIGMA = 0.9
+MAX_WORDS = 400
+
+
+def load_seed_texts(path: str = DATA_FILE) -> dict:
+    # Тексты из голосов и истории пользователей, разложенные по языку
+    seeds = {"ru": [], "en": []}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        texts = set(data.get("message_to_emotion", {})) | set(data.get("user_votes", {}))
+        for entries in data.get("user_history", {}).values():
+            texts.update(entry["text"] for entry in entries if entry.get("text"))
+        for text in sorted(texts):
+            if text.startswith("/"):
+                continue  # Команды бота не нужны
+            seeds[detect_language(text)].append(text)
+    for lang, fallback in FALLBACK_TEXTS.items():
+        if len(seeds[lang]) < len(fallback):
+            seeds[lang].extend(fallback)
+    return seeds
+
+def _build(rng: random.Random, pools: List[List[str]], words: int) -> str:
+    # Склеивает фразы (по очереди из пулов) до нужного числа слов
+    parts, count, turn = [], 0, 0
+    while count < words:
+        phrase = rng.choice(pools[turn % len(pools)])
+        parts.append(phrase)
+        count += len(phrase.split())
+        turn += 1
+    return " ".join(parts)
+
+def generate(count: int, seed: int = 0, mix: Tuple[float, float, float] = DEFAULT_MIX, path: str = DATA_FILE) -> Iterator[dict]:
+    # Одинаковые count и seed дают одинаковый корпус
+    rng = random.Random(seed)
+    seeds = load_seed_texts(path)
+    kinds = ("ru", "en", "mixed")
+    for _ in range(count):
+        kind = rng.choices(kinds, weights=mix)[0]
+        words = min(MAX_WORDS, max(1, round(rng.lognormvariate(math.log(LENGTH_MEDIAN_WORDS), LENGTH_SIGMA))))
+        pools = [seeds["ru"], seeds["en"]] if kind == "mixed" else [seeds[kind]]
+        yield {"text": _build(rng, pools, words), "kind": kind}
+
+def load_corpus(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+def get_texts(corpus_path: str = None, count: int = 10000, seed: int = 0) -> List[str]:
+    # Корпус из файла или сгенерированный на лету
+    if corpus_path:
+        return load_corpus(corpus_path)
+    return [item["text"] for item in generate(count, seed)]
+
+def add_corpus_args(parser: argparse.ArgumentParser, count: int = 10000):
+    parser.add_argument("--corpus", help="JSONL-файл корпуса (по умолчанию генерируется)")
+    parser.add_argument("--count", type=int, default=count, help="Размер генерируемого корпуса")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+if __name__ == "__main__":
+    # python benchmarks/corpus.py --count 100000 --seed 1 > corpus.jsonl
+    parser = argparse.ArgumentParser(description="Generate a benchmark corpus as JSONL")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", default=",".join(map(str, DEFAULT_MIX)), help="Доли ru,en,mixed")
+    parser.add_argument("--out", help="Файл для записи, по умолчанию stdout")
+    args = parser.parse_args()
+    mix = tuple(float(part) for part in args.mix.split(","))
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        for item in generate(args.count, args.seed, mix):
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+    finally:
+        if args.out:
+            out.close()
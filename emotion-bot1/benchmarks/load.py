@@ -0,0 +1,130 @@
+# load.py - нагрузочный тест API: задержки p50/p95/p99 и пропускная способность
+import argparse
+import asyncio
+import itertools
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+from benchlib import latency_summary, write_results
+from corpus import add_corpus_args, get_texts
+
+
+async def run_load(
+    url: str,
+    endpoint: str,
+    texts,
+    concurrency: int,
+    requests: int,
+    duration: float,
+    batch_size: int,
+    warmup: int,
+    timeout: float,
+) -> dict:
+    """
+    concurrency клиентов отправляют запросы без пауз (замкнутая модель нагрузки),
+    пока не отправлено requests запросов или не прошло duration секунд.
+    Первые warmup запросов не учитываются: модели прогреваются и кэши заполняются
+    """
+    stream = itertools.cycle(texts)
+    latencies, statuses = [], Counter()
+
+    def next_payload():
+        if endpoint == "/predict_batch":
+            return {"texts": [next(stream) for _ in range(batch_size)]}
+        return {"text": next(stream)}
+
+    async def phase(session: aiohttp.ClientSession, limit: int, seconds: float, record: bool):
+        # Один этап нагрузки: до limit запросов (0 - без ограничения) или до истечения seconds
+        issued = 0
+        deadline = time.perf_counter() + seconds if seconds else None
+
+        async def client():
+            nonlocal issued
+            while (not limit or issued < limit) and (deadline is None or time.perf_counter() < deadline):
+                issued += 1
+                started = time.perf_counter()
+                try:
+                    async with session.post(url + endpoint, json=next_payload()) as response:
+                        await response.read()
+                        status = str(response.status)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = type(e).__name__
+                if record:
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] += 1
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        if warmup:
+            await phase(session, warmup, 0, record=False)
+        started = time.perf_counter()
+        await phase(session, requests, duration, record=True)
+        elapsed = time.perf_counter() - started
+
+    ok = statuses.get("200", 0)
+    texts_per_request = batch_size if endpoint == "/predict_batch" else 1
+    return {
+        "name": "load",
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "statuses": dict(statuses),
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "texts_per_sec": ok * texts_per_request / elapsed if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+    }
+
+async def fetch_workers(url: str, timeout: float) -> dict:
+    # Память процессов API после нагрузки: при API_WORKERS > 1 - мастер и все воркеры
+    # Если снимок получить не удалось, в результатах остается запись с available=False
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        try:
+            async with session.get(url + "/workers") as response:
+                if response.status != 200:
+                    return {"name": "workers", "available": False, "error": f"HTTP {response.status}"}
+                memory = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return {"name": "workers", "available": False, "error": repr(e)}
+    workers = memory.get("workers", [])
+    return {
+        "name": "workers",
+        "available": True,
+        "workers": len(workers),
+        "total_pss_mb": memory.get("total_pss_mb", sum(worker.get("pss_mb", 0.0) for worker in workers)),
+        "worker_rss_mb": [worker.get("rss_mb") for worker in workers],
+        "worker_pss_mb": [worker.get("pss_mb") for worker in workers],
+    }
+
+
+if __name__ == "__main__":
+    # python benchmarks/load.py --url http://localhost:8001 --concurrency 1,8,32 --requests 2000
+    parser = argparse.ArgumentParser(description="Closed-loop load test for the emotion API")
+    add_corpus_args(parser)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--endpoint", default="/predict", choices=["/predict", "/predict_batch"])
+    parser.add_argument("--batch-size", type=int, default=16, help="Текстов в запросе для /predict_batch")
+    parser.add_argument("--concurrency", default="1,8,32", help="Уровни параллелизма через запятую")
+    parser.add_argument("--requests", type=int, default=1000, help="Запросов на уровень, 0 - ограничение по времени")
+    parser.add_argument("--duration", type=float, default=0, help="Секунд на уровень")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--out", help="Файл результатов (по умолчанию benchmarks/results/)")
+    args = parser.parse_args()
+
+    texts = get_texts(args.corpus, args.count, args.seed)
+    results = []
+    for concurrency in (int(value) for value in args.concurrency.split(",")):
+        print(f"load: {args.endpoint}, concurrency {concurrency}...", file=sys.stderr)
+        results.append(asyncio.run(run_load(
+            args.url.rstrip("/"), args.endpoint, texts, concurrency,
+            args.requests, args.duration, args.batch_size, args.warmup, args.timeout,
+        )))
+    results.append(asyncio.run(fetch_workers(args.url.rstrip("/"), args.timeout)))
+    write_results("load", vars(args), results, args.out)
@@ -0,0 +1,222 @@
+# micro.py - микробенчмарки: определение языка, сведение меток, сохранение и загрузка данных, память на пользователя
+import argparse
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, deque
+
+from benchlib import BASE_DIR, best_of, write_results
+from corpus import add_corpus_args, get_texts
+
+sys.path.insert(0, os.path.join(BASE_DIR, "api"))  # aggregation
+sys.path.insert(0, os.path.join(BASE_DIR, "bot"))  # persistence
+from common.language import route_language
+from aggregation import EN_EMOTION_MAP, ScoreAggregator
+from history import UserHistory
+from persistence import open_backend
+from votes import VoteIndex
+
+EMOTIONS = list(dict.fromkeys(EN_EMOTION_MAP.values()))
+
+
+def regex_detect_language(text: str) -> str:
+    # Исходное определение языка в боте и API - точка отсчета для route_language
+    return "ru" if re.search(r'[а-яё]', text.lower()) else "en"
+
+def bench_language(texts, repeat: int, long_chars: int = 4096, short_chars: int = 100) -> list:
+    # Тексты корпуса, отдельно короткие сообщения (основной трафик бота) и одно длинное из склеенного корпуса
+    long_text = " ".join(texts)[:long_chars]
+    short_texts = [text for text in texts if len(text) <= short_chars]
+    results = []
+    for name, func in (("regex_baseline", regex_detect_language), ("route_language", route_language)):
+        seconds = best_of(lambda: [func(text) for text in texts], repeat)
+        short_seconds = best_of(lambda: [func(text) for text in short_texts], repeat)
+        long_seconds = best_of(lambda: [func(long_text) for _ in range(100)], repeat) / 100
+        results.append({
+            "name": name,
+            "texts": len(texts),
+            "seconds": seconds,
+            "ns_per_text": seconds / len(texts) * 1e9,
+            "texts_per_sec": len(texts) / seconds,
+            "short_texts": len(short_texts),
+            "ns_per_short_text": short_seconds / max(1, len(short_texts)) * 1e9,
+            "long_chars": len(long_text),
+            "us_per_long_text": long_seconds * 1e6,
+        })
+    return results
+
+def bench_label_mapping(batch_sizes, repeat: int, seed: int) -> list:
+    # Сведение 28 меток GoEmotions к нашим категориям для батчей разного размера
+    rng = random.Random(seed)
+    aggregator = ScoreAggregator(EN_EMOTION_MAP, EMOTIONS)
+    labels = list(EN_EMOTION_MAP)
+    results = []
+    for batch_size in batch_sizes:
+        outputs = [[{"label": label, "score": rng.random()} for label in labels] for _ in range(batch_size)]
+        rounds = max(1, 10000 // batch_size)  # Примерно 10 тысяч текстов на замер
+        seconds = best_of(lambda: [aggregator.top(aggregator.aggregate(outputs), 3) for _ in range(rounds)], repeat)
+        results.append({
+            "name": "label_mapping",
+            "batch_size": batch_size,
+            "us_per_text": seconds / (rounds * batch_size) * 1e6,
+            "texts_per_sec": rounds * batch_size / seconds,
+        })
+    return results
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def bench_storage(kind: str, users: int, per_user: int, texts, sample: int, seed: int) -> dict:
+    """
+    Сохранение: история per_user записей и один голос на пользователя, один сброс на диск.
+    Загрузка: открытие хранилища (для journal - полное чтение журнала), голоса
+    и история sample случайных пользователей - то, что бот делает при старте и первых сообщениях
+    """
+    rng = random.Random(seed)
+    data_dir = tempfile.mkdtemp(prefix=f"bench-{kind}-")
+    try:
+        started = time.perf_counter()
+        backend = open_backend(kind, data_dir)
+        now = time.time()
+        for user in range(users):
+            for j in range(per_user):
+                backend.add_history(str(user), texts[(user * per_user + j) % len(texts)], rng.choice(EMOTIONS), now)
+            backend.add_vote(texts[user % len(texts)], rng.choice(EMOTIONS))
+        written = backend.flush()
+        backend.close()
+        save_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        backend = open_backend(kind, data_dir)
+        backend.load_votes()
+        for user in rng.sample(range(users), min(sample, users)):
+            backend.load_history(str(user), 100)
+            backend.load_stats(str(user))
+        load_seconds = time.perf_counter() - started
+        backend.close()
+        return {
+            "name": "storage",
+            "backend": kind,
+            "users": users,
+            "records": users * (per_user + 1),
+            "save_seconds": save_seconds,
+            "load_seconds": load_seconds,
+            "bytes_written": written,
+            "disk_bytes": _dir_size(data_dir),
+        }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+class DequeHistory:
+    """
+    Прежняя раскладка истории - точка отсчета для UserHistory:
+    deque кортежей (текст, эмоция, время) и Counter эмоций
+    """
+
+    __slots__ = ("entries", "counts", "total")
+
+    def __init__(self, limit: int = 100):
+        self.entries = deque(maxlen=limit)
+        self.counts = Counter()
+        self.total = 0
+
+    @classmethod
+    def restore(cls, entries, stats, limit: int = 100) -> "DequeHistory":
+        history = cls(limit)
+        history.entries.extend(entries)
+        history.counts.update(stats)
+        history.total = sum(history.counts.values())
+        return history
+
+    def append(self, text: str, emotion: str, ts: float):
+        self.entries.append((text, emotion, ts))
+        self.counts[emotion] += 1
+        self.total += 1
+
+
+def bench_user_state(users: int, per_user: int, texts, seed: int, unique: bool = False, history_cls=UserHistory) -> dict:
+    """
+    Память бота на пользователя: история (restore из хранилища и новые сообщения)
+    и голоса. Каждый текст - отдельный объект str, как у сообщений из Telegram
+    и строк, прочитанных из хранилища. Без unique тексты берутся из общего корпуса
+    и повторяются между пользователями, так что часть экономии дает общий пул текстов;
+    с unique каждое сообщение уникально и остается только выигрыш от раскладки в массивах
+    """
+    rng = random.Random(seed)
+    now = time.time()
+
+    def message(user: int, j: int) -> str:
+        text = texts[rng.randrange(len(texts))]
+        return f"{text} #{user}-{j}" if unique else text.encode().decode()
+
+    tracemalloc.start()
+    rows = [
+        [(message(user, j), rng.choice(EMOTIONS), now - j) for j in range(per_user)]
+        for user in range(users)
+    ]
+    histories = {}
+    for user, entries in enumerate(rows):
+        history = history_cls.restore(entries[:per_user // 2], {}, 100)
+        for text, emotion, ts in entries[per_user // 2:]:
+            history.append(text, emotion, ts)
+        histories[str(user)] = history
+    rows = entries = None  # Исходные записи освобождаются, тексты держит только история
+    history_bytes = tracemalloc.get_traced_memory()[0]
+
+    votes = [(message(user, per_user), rng.choice(EMOTIONS).encode().decode()) for user in range(users)]
+    index = VoteIndex()
+    for text, emotion in votes:
+        index.add(text, emotion)
+    votes = text = emotion = None
+    votes_bytes = tracemalloc.get_traced_memory()[0] - history_bytes
+    tracemalloc.stop()
+    return {
+        "name": "user_state",
+        "layout": "arrays" if history_cls is UserHistory else "deque_baseline",
+        "texts": "unique" if unique else "shared_corpus",
+        "users": users,
+        "per_user": per_user,
+        "history_bytes_per_user": history_bytes / users,
+        "votes_bytes_per_user": votes_bytes / users,
+    }
+
+
+if __name__ == "__main__":
+    # python benchmarks/micro.py --users 10000,100000,1000000 --backends sqlite,journal
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for language routing, label mapping and storage")
+    add_corpus_args(parser)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-sizes", default="1,16,64")
+    parser.add_argument("--users", default="10000,100000", help="Числа пользователей через запятую")
+    parser.add_argument("--per-user", type=int, default=5, help="Записей истории на пользователя")
+    parser.add_argument("--sample", type=int, default=1000, help="Пользователей, чья история читается при загрузке")
+    parser.add_argument("--backends", default="sqlite,journal,json")
+    parser.add_argument("--only", default="language,labels,storage,memory", help="Какие группы запускать")
+    parser.add_argument("--out", help="Файл результатов (по умолчанию benchmarks/results/)")
+    args = parser.parse_args()
+
+    texts = get_texts(args.corpus, args.count, args.seed)
+    only = set(args.only.split(","))
+    results = []
+    if "language" in only:
+        results += bench_language(texts, args.repeat)
+    if "labels" in only:
+        results += bench_label_mapping([int(size) for size in args.batch_sizes.split(",")], args.repeat, args.seed)
+    if "storage" in only:
+        for users in (int(value) for value in args.users.split(",")):
+            for kind in args.backends.split(","):
+                print(f"storage: {kind}, {users} users...", file=sys.stderr)
+                results.append(bench_storage(kind, users, args.per_user, texts, args.sample, args.seed))
+    if "memory" in only:
+        for users in (int(value) for value in args.users.split(",")):
+            # Голоса в обеих раскладках хранит VoteIndex, различается только история
+            for history_cls in (DequeHistory, UserHistory):
+                for unique in (False, True):
+                    print(f"memory: {history_cls.__name__}, unique={unique}, {users} users...", file=sys.stderr)
+                    results.append(bench_user_state(users, args.per_user * 4, texts, args.seed, unique, history_cls))
+    write_results("micro", vars(args), results, args.out)
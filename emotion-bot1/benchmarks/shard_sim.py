@@ -0,0 +1,202 @@
+# shard_sim.py - несколько шардов бота локально: маршрутизация по user_id, общие голоса, пропускная способность
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from benchlib import BASE_DIR, latency_summary, write_results
+from bot_sim import EMOTIONS, server_url, start_server, stub_api
+from corpus import add_corpus_args, get_texts
+
+sys.path.insert(0, os.path.join(BASE_DIR, "bot"))
+from fake_telegram import FakeTelegram, callback_update, message_update, push_update
+from persistence import open_backend
+from sharding import shard_dir, shard_of
+
+ROUTER_SCRIPT = os.path.join(BASE_DIR, "bot", "shard_router.py")
+REPLY_METHODS = ("sendMessage", "sendAnimation")
+
+
+def free_ports(count: int) -> int:
+    # Первый из count свободных портов подряд: маршрутизатор и шарды
+    for _ in range(100):
+        base = random.randint(20000, 60000 - count)
+        sockets = []
+        try:
+            for port in range(base, base + count):
+                sock = socket.socket()
+                sock.bind(("127.0.0.1", port))
+                sockets.append(sock)
+            return base
+        except OSError:
+            continue
+        finally:
+            for sock in sockets:
+                sock.close()
+    raise RuntimeError("No free port range")
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} is not ready after {timeout} s")
+
+def check_placement(kind: str, data_dir: str, shards: int) -> dict:
+    # Каждый пользователь должен лежать ровно в своем шарде
+    users_per_shard, misplaced = [], 0
+    for shard in range(shards):
+        backend = open_backend(kind, shard_dir(data_dir, shard, shards))
+        users = {op[1] for op in backend.export() if op[0] == "history"}
+        backend.close()
+        users_per_shard.append(len(users))
+        misplaced += sum(1 for user in users if shard_of(user, shards) != shard)
+    return {"users_per_shard": users_per_shard, "misplaced_users": misplaced}
+
+async def simulate(args, shards: int) -> dict:
+    texts = get_texts(args.corpus, args.count, args.seed)
+    rng = random.Random(args.seed)
+    fake = FakeTelegram()
+    telegram_runner = await start_server(fake.app())
+    api_runner = await start_server(stub_api(args.api_delay_ms / 1000, args.seed))
+    data_dir = tempfile.mkdtemp(prefix="shard-sim-")
+    port = free_ports(shards + 1)
+    router_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123456:simulation",
+        "TELEGRAM_API_URL": server_url(telegram_runner),
+        "EMOTION_API_URLS": server_url(api_runner),
+        "BOT_DATA_DIR": data_dir,
+        "STORAGE_BACKEND": args.storage,
+        "FSM_STORAGE": "sqlite",  # У каждого шарда свой файл состояний
+        "RATE_LIMIT_BURST": str(10 ** 9),
+        "METRICS_PORT": "0",
+        "BOT_SHARDS": str(shards),
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(port),
+        "SHARD_BASE_PORT": str(port + 1),
+        "WEBHOOK_BASE_URL": router_url,
+        "FLUSH_INTERVAL": str(args.flush_interval),
+        "VOTE_SYNC_INTERVAL": str(args.sync_interval),
+    })
+    router = subprocess.Popen([sys.executable, ROUTER_SCRIPT], env=env, stderr=None if args.verbose else subprocess.DEVNULL)
+    latencies = defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    webhook = router_url + "/webhook"
+
+    async with aiohttp.ClientSession() as session:
+
+        async def send(kind: str, update: dict, wait_methods, timeout: float = 10.0, **params):
+            start = len(fake.calls)
+            started = time.perf_counter()
+            status = await push_update(session, webhook, update)
+            if status != 200:
+                raise RuntimeError(f"Router answered {status}")
+            _, reply = await fake.wait_call(start, wait_methods, timeout, **params)
+            latencies[kind].append(time.perf_counter() - started)
+            return reply
+
+        async def user_session(user_id: int):
+            async with semaphore:
+                for _ in range(args.messages):
+                    reply = await send("analyze", message_update(user_id, rng.choice(texts)), REPLY_METHODS, chat_id=user_id)
+                    if "reply_markup" not in reply:
+                        continue  # Ответ по голосованию, без кнопок обратной связи
+                    if rng.random() < args.feedback:
+                        update = callback_update(user_id, "feedback_yes")
+                        await send("feedback_yes", update, ("answerCallbackQuery",), callback_query_id=update["callback_query"]["id"])
+
+        async def vote_propagation() -> float:
+            # Голос пользователя одного шарда должен стать виден пользователю другого
+            first = 500_000
+            second = next(user for user in range(first + 1, first + 1000) if shard_of(user, shards) != shard_of(first, shards))
+            text = f"shard vote check {rng.random()}"
+            await send("analyze", message_update(first, text), REPLY_METHODS, chat_id=first)
+            update = callback_update(first, "feedback_no")
+            await send("feedback_no", update, ("answerCallbackQuery",), callback_query_id=update["callback_query"]["id"])
+            update = callback_update(first, f"emotion_{EMOTIONS[0]}")
+            await send("emotion_choice", update, ("answerCallbackQuery",), callback_query_id=update["callback_query"]["id"])
+            voted_at = time.perf_counter()
+            while time.perf_counter() - voted_at < args.flush_interval + args.sync_interval + 10:
+                reply = await send("analyze", message_update(second, text), REPLY_METHODS, chat_id=second)
+                if "голосования" in (reply.get("text") or reply.get("caption") or ""):
+                    return time.perf_counter() - voted_at
+                await asyncio.sleep(0.1)
+            raise RuntimeError("Vote from another shard never arrived")
+
+        try:
+            await wait_ready(session, router_url + "/ready", args.startup_timeout)
+            started = time.perf_counter()
+            await asyncio.gather(*(user_session(10_000 + user) for user in range(args.users)))
+            elapsed = time.perf_counter() - started
+            updates = sum(len(values) for values in latencies.values())
+            latency = latency_summary(latencies["analyze"])
+            propagation = await vote_propagation() if shards > 1 else None
+        finally:
+            router.send_signal(signal.SIGINT)  # Маршрутизатор останавливает шарды, они сбрасывают данные
+            try:
+                router.wait(30)
+            except subprocess.TimeoutExpired:
+                router.kill()
+            await telegram_runner.cleanup()
+            await api_runner.cleanup()
+
+    try:
+        placement = check_placement(args.storage, data_dir, shards)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {
+        "name": "shard_sim",
+        "shards": shards,
+        "users": args.users,
+        "updates": updates,
+        "seconds": elapsed,
+        "updates_per_sec": updates / elapsed if elapsed else 0.0,
+        "latency_ms": latency,
+        "vote_propagation_seconds": propagation,
+        **placement,
+    }
+
+
+if __name__ == "__main__":
+    # python benchmarks/shard_sim.py --shards 1,2,4 --users 200
+    parser = argparse.ArgumentParser(description="Run several bot shards locally behind the shard router")
+    add_corpus_args(parser, count=1000)
+    parser.add_argument("--shards", default="1,2,4", help="Числа шардов через запятую")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=5, help="Сообщений от каждого пользователя")
+    parser.add_argument("--concurrency", type=int, default=50, help="Пользователей одновременно")
+    parser.add_argument("--feedback", type=float, default=0.5, help="Доля ответов 'Подходит'")
+    parser.add_argument("--api-delay-ms", type=float, default=20, help="Задержка API-заглушки")
+    parser.add_argument("--storage", default="sqlite", choices=["sqlite", "journal"])
+    parser.add_argument("--flush-interval", type=float, default=0.5, help="FLUSH_INTERVAL шардов")
+    parser.add_argument("--sync-interval", type=float, default=0.5, help="VOTE_SYNC_INTERVAL шардов")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--verbose", action="store_true", help="Показывать логи шардов")
+    parser.add_argument("--out", help="Файл результатов (по умолчанию benchmarks/results/)")
+    args = parser.parse_args()
+
+    results = []
+    for shards in (int(value) for value in args.shards.split(",")):
+        print(f"shards: {shards}...", file=sys.stderr)
+        result = asyncio.run(simulate(args, shards))
+        if result["misplaced_users"]:
+            sys.exit(f"{result['misplaced_users']} users stored in a wrong shard")
+        results.append(result)
+    write_results("shard_sim", vars(args), results, args.out)
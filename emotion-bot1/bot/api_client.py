@@ -0,0 +1,91 @@
+# api_client.py - клиент к API определения эмоций с пулом соединений
+import asyncio
+import itertools
+import logging
+import random
+from typing import List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых имеет смысл повторить запрос на другой реплике
+RETRYABLE_STATUSES = {502, 503, 504}
+
+
+class InferenceClient:
+    """
+    Живет столько же, сколько бот: одна ClientSession с keep-alive пулом
+    соединений на все сообщения. Запросы раскидываются по репликам API
+    по кругу, при ошибке повторяются на следующей реплике с паузой и джиттером.
+    Все попытки вместе с паузами укладываются в total_timeout - дольше
+    пользователь не ждет, дальше бот отвечает без API
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        connect_timeout: float = 1.0,
+        read_timeout: float = 3.0,
+        total_timeout: float = 3.0,
+        retries: int = 2,
+        backoff: float = 0.1,
+        pool_size: int = 100,
+    ):
+        if not urls:
+            raise ValueError("At least one API URL is required")
+        self.urls = urls
+        self.retries = retries
+        self.backoff = backoff
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout, sock_read=read_timeout)
+        self.pool_size = pool_size
+        self._next_url = itertools.cycle(urls)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def predict(self, text: str, trace_id: Optional[str] = None) -> dict:
+        return await self._post("/predict", {"text": text}, trace_id)
+
+    async def _post(self, path: str, payload: dict, trace_id: Optional[str] = None) -> dict:
+        # trace_id уходит в заголовке X-Request-ID, API пишет его в свои логи
+        headers = {"X-Request-ID": trace_id} if trace_id else None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.total_timeout
+        last_error = None
+        for attempt in range(self.retries + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break  # Время на запрос вышло, повторов больше не будет
+            url = next(self._next_url) + path
+            # Попытка получает только остаток общего времени
+            timeout = aiohttp.ClientTimeout(total=remaining, sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            try:
+                async with self._session.post(url, json=payload, headers=headers, timeout=timeout) as response:
+                    if response.status in RETRYABLE_STATUSES:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=response.reason or "",
+                        )
+                    response.raise_for_status()
+                    return await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRYABLE_STATUSES:
+                    raise  # Ошибка в самом запросе, повтор не поможет
+                last_error = e
+                logger.warning(f"[{trace_id or '-'}] API request to {url} failed (attempt {attempt + 1}): {e}")
+                if attempt < self.retries:
+                    # Экспоненциальная пауза с полным джиттером, но не дольше остатка времени
+                    delay = random.uniform(0, self.backoff * 2 ** attempt)
+                    await asyncio.sleep(max(0.0, min(delay, deadline - loop.time())))
+        raise last_error or asyncio.TimeoutError(f"API request exceeded {self.total_timeout} s")
@@ -1,29 +1,86 @@
 # bot.py - Telegram бот для взаимодействия с пользователями
 import os
-import re
-import json
+import sys
 import asyncio
 import logging
-import aiohttp
 from datetime import datetime
-from collections import Counter, defaultdict
+import math
 import time
 
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Общие модули проекта (common/)
+from common.language import detect_language
+from api_client import InferenceClient
+from persistence import AsyncStorage, migrate_json, open_backend
+from sticker_cache import StickerCache
+from history import HistoryCache, UserHistory
+from interning import emotion_codes
+from votes import VoteIndex
+from ratelimit import MemoryBucketStore, RateLimiter, RedisBucketStore
+from fsm_storage import SQLiteFSMStorage
+from lexicon import LexiconClassifier
+from circuit import CircuitBreaker
+from sharding import VoteFeed, shard_dir
+import metrics
 
 # Настройки логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_FILE = os.path.join(BASE_DIR, "bot/data/user_data.json")
+# Шардирование: BOT_SHARDS процессов (см. shard_router.py), каждый ведет пользователей своего шарда
+# в папке shard-<BOT_SHARD_ID>, а голоса остальных шардов читает раз в VOTE_SYNC_INTERVAL секунд
+BOT_SHARDS = int(os.getenv("BOT_SHARDS", "1"))
+BOT_SHARD_ID = int(os.getenv("BOT_SHARD_ID", "0"))
+VOTE_SYNC_INTERVAL = float(os.getenv("VOTE_SYNC_INTERVAL", "2"))
+DATA_ROOT = os.getenv("BOT_DATA_DIR", os.path.join(BASE_DIR, "bot/data"))
+DATA_DIR = shard_dir(DATA_ROOT, BOT_SHARD_ID, BOT_SHARDS)
+DATA_FILE = os.path.join(DATA_DIR, "user_data.json")
+VOTES_INDEX_FILE = os.path.join(DATA_DIR, "votes.idx")  # Снимок индекса голосов для быстрого запуска
+FILE_IDS_FILE = os.path.join(DATA_DIR, "file_ids.json")  # file_id уже загруженных в Telegram стикеров
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")  # sqlite, journal или json (старый формат)
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "100"))  # Сколько последних запросов держать в памяти на пользователя
+HISTORY_CACHE_USERS = int(os.getenv("HISTORY_CACHE_USERS", "10000"))  # Сколько историй держать в памяти, остальные читаются из хранилища
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "1"))  # Сколько запросов можно сделать подряд
+RATE_LIMIT_INTERVAL = float(os.getenv("RATE_LIMIT_INTERVAL", "10"))  # За сколько секунд восстанавливается один запрос
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory - в процессе, redis - общий для всех процессов бота
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "5"))  # Сбрасывать изменения на диск не чаще, сек
+FLUSH_MAX_MUTATIONS = int(os.getenv("FLUSH_MAX_MUTATIONS", "100"))  # ...или сразу после стольких изменений
+# Адреса реплик API через запятую, запросы распределяются между ними по кругу
+API_URLS = [url.strip().rstrip("/") for url in os.getenv("EMOTION_API_URLS", "http://localhost:8001").split(",") if url.strip()]
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "1"))  # Таймаут установки соединения, сек
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "3"))  # Таймаут ожидания ответа, сек
+API_TOTAL_TIMEOUT = float(os.getenv("API_TOTAL_TIMEOUT", "3"))  # Общее время на запрос вместе с повторами, сек
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))  # Число повторов при ошибке
+# Выключатель: при большой доле ошибок или медленных ответов API бот на время отвечает словарным классификатором
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # Сколько последних запросов учитывать
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))  # Доля ошибок, при которой API отключается
+BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", "2"))  # Ответ дольше стольких секунд считается ошибкой
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))  # Через сколько секунд снова пробовать API
+BOT_TOKEN = os.getenv("BOT_TOKEN", "You_token_bot")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Другой сервер Bot API, например fake_telegram.py для тестов
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling или webhook
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")  # memory, sqlite (один сервер) или redis (несколько серверов)
+FSM_FILE = os.path.join(DATA_DIR, "fsm.db")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # Внешний адрес бота (или балансировщика перед репликами)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))  # Одновременно обрабатываемых обновлений
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1000"))  # Сверх этого webhook отвечает 503
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))  # Порт /metrics в режиме polling, 0 - не запускать
 #VOTE_THRESHOLD = 2  # Минимальное количество голосов для подтверждения эмоции
 # Словарь эмоций с переводами
 EMOTIONS = {
@@ -46,6 +103,7 @@ EMOTIONS = {
     "confusion": {"ru": "замешательство", "en": "confusion"},
     "no_emotion": {"ru": "нет эмоции", "en": "no emotion"},
 }
+emotion_codes.extend(EMOTIONS) # Коды эмоций в истории и голосах - по порядку EMOTIONS
 # Пути к файлам стикеров для разных эмоций
 STICKER_PATHS = {
     "joy": {
@@ -121,53 +179,78 @@ STICKER_PATHS = {
         "en": os.path.join(BASE_DIR, "bot/assets/en/no_emotion.gif")}
     
 }
+stickers = StickerCache(STICKER_PATHS, FILE_IDS_FILE)
 # Состояния для машины состояний (FSM)
 class FeedbackStates(StatesGroup):
     waiting_for_feedback = State()
     waiting_for_emotion = State()
 
-storage = MemoryStorage()
-bot = Bot(token="You_token_bot", default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=storage)
+#Хранилище состояний FSM: в памяти состояния теряются при перезапуске и не видны другим репликам
+def create_fsm_storage():
+    if FSM_STORAGE == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(REDIS_URL)
+    if FSM_STORAGE == "sqlite":
+        os.makedirs(DATA_DIR, exist_ok=True)
+        return SQLiteFSMStorage(FSM_FILE)
+    return MemoryStorage()
+
+fsm_storage = create_fsm_storage()
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+dp = Dispatcher(storage=fsm_storage)
 
 # Глобальные переменные для хранения данных
-user_history = {} # История запросов пользователей
-emotion_stats = {} # Статистика по эмоциям
-message_to_emotion = {} # Соответствие сообщений и эмоций
-user_votes = {} # Голоса пользователей за эмоции
-user_last_request = defaultdict(float) # Время последнего запроса пользователя
+user_history = HistoryCache(HISTORY_CACHE_USERS) # Истории активных пользователей (подгружаются из хранилища по требованию)
+vote_index = VoteIndex() # Голоса пользователей за эмоции
+rate_limiter = None # Ограничитель частоты запросов, создается при запуске бота
+api_client = None # Клиент к API, создается при запуске бота
+storage = None # Хранилище данных, открывается при запуске бота
+metrics_runner = None # Сервер /metrics в режиме polling
+vote_feeds = {} # Голоса других шардов: номер шарда -> VoteFeed
+saved_feed_cursors = {} # Курсоры vote_feeds, уже записанные в свое хранилище
+vote_sync_task = None
+lexicon = None # Словарный классификатор на случай недоступности API, собирается при запуске
+breaker = CircuitBreaker(
+    window=BREAKER_WINDOW, error_rate=BREAKER_ERROR_RATE, slow_call=BREAKER_SLOW_CALL, cooldown=BREAKER_COOLDOWN
+)
+metrics.CIRCUIT_OPEN.set_function(lambda: breaker.state != CircuitBreaker.CLOSED)
 
-async def detect_emotion_api(text: str) -> dict:
+async def detect_emotion_api(text: str, trace_id: str = None) -> dict:
     """
     Отправляет запрос к API для определения эмоции
-    Возвращает словарь с эмоцией, уверенностью и языком
+    Возвращает словарь с эмоцией, уверенностью, языком и источником ответа:
+    api - модель, lexicon - словарный классификатор, если API недоступен
     """
     lang = detect_language(text)
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "http://localhost:8001/predict",
-                json={"text": text},
-                timeout=3
-            ) as response:
-                data = await response.json()
-                return {
-                    "emotion": data["emotion"],
-                    "confidence": data["confidence"],
-                    "language": data["language"],
-                    "label": data["label"]
-                }
-    except Exception as e:
-        logger.error(f"API error: {e}") # Возвращаем нейтральную эмоцию в случае ошибки
-        return {
-            "emotion": "neutral",
-            "confidence": 0.5,
-            "language": lang,
-            "label": EMOTIONS["neutral"][lang]
-        }
-#Определяет язык текста по наличию кириллицы
-def detect_language(text: str) -> str:
-    return "ru" if re.search(r'[а-яё]', text.lower()) else "en"
+    if breaker.allow():
+        started = time.perf_counter()
+        try:
+            with metrics.stage("api"):
+                data = await api_client.predict(text, trace_id)
+            breaker.record(True, time.perf_counter() - started)
+            return {
+                "emotion": data["emotion"],
+                "confidence": data["confidence"],
+                "language": data["language"],
+                "label": data["label"],
+                "source": "api"
+            }
+        except Exception as e:
+            breaker.record(False, time.perf_counter() - started)
+            logger.error(f"[{trace_id}] API error: {e}")
+            metrics.FALLBACKS.labels(type(e).__name__).inc()
+    else:
+        # Выключатель разомкнут - не ждем таймаута, отвечаем сразу
+        metrics.FALLBACKS.labels("circuit_open").inc()
+    emotion, confidence = lexicon.classify(text)
+    return {
+        "emotion": emotion,
+        "confidence": confidence,
+        "language": lang,
+        "label": EMOTIONS[emotion][lang],
+        "source": "lexicon"
+    }
 #Создает клавиатуру для подтверждения/отклонения эмоции
 def get_feedback_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -186,30 +269,80 @@ def get_emotions_kb():
     if row:
         buttons.append(row)
     return InlineKeyboardMarkup(inline_keyboard=buttons)
-#Сохраняет данные пользователей в файл
-def save_data():
-    data = {
-        "message_to_emotion": message_to_emotion,
-        "user_history": user_history,
-        "emotion_stats": {k: dict(v) for k, v in emotion_stats.items()},
-        "user_votes": {k: dict(v) for k, v in user_votes.items()}
-    }
-    try:
-        with open(DATA_FILE, "w", encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка сохранения данных: {e}")
-#Загружает данные пользователей из файла
+#Открывает хранилище и загружает голоса, при первом запуске переносит старый user_data.json
 def load_data():
-    if os.path.exists(DATA_FILE):
+    os.makedirs(DATA_DIR, exist_ok=True) # Папка шарда создается при первом запуске
+    backend = open_backend(STORAGE_BACKEND, DATA_DIR, HISTORY_LIMIT)
+    if STORAGE_BACKEND != "json" and backend.is_empty() and os.path.exists(DATA_FILE):
+        try:
+            migrate_json(DATA_FILE, backend)
+            logger.info(f"Данные из {DATA_FILE} перенесены в хранилище {STORAGE_BACKEND}")
+        except Exception as e:
+            logger.error(f"Ошибка переноса данных: {e}")
+    return AsyncStorage(
+        backend, flush_interval=FLUSH_INTERVAL, max_pending=FLUSH_MAX_MUTATIONS, on_flush=metrics.observe_flush
+    )
+#Возвращает историю пользователя, при первом обращении читает ее из хранилища
+async def get_history(user_id: str) -> UserHistory:
+    history = user_history.get(user_id)
+    if history is None:
+        with metrics.stage("history"):
+            entries = await storage.load_history(user_id, HISTORY_LIMIT)
+            stats = await storage.load_stats(user_id)
+        history = UserHistory.restore(entries, stats, HISTORY_LIMIT)
+        user_history.put(user_id, history, storage.flushed_writes)
+    return history
+#Загружает индекс голосов. Снимок пишется только при штатной остановке и удаляется
+#после чтения, поэтому после аварийного завершения индекс собирается из хранилища
+async def load_votes() -> VoteIndex:
+    # В снимке шарда были бы и голоса соседей, поэтому при шардировании он не используется
+    if BOT_SHARDS == 1 and os.path.exists(VOTES_INDEX_FILE):
+        try:
+            index = await asyncio.to_thread(VoteIndex.load, VOTES_INDEX_FILE)
+            os.remove(VOTES_INDEX_FILE)
+            return index
+        except Exception as e:
+            logger.error(f"Ошибка загрузки индекса голосов: {e}")
+    return VoteIndex.from_counts(await storage.load_votes())
+#Добавляет в индекс новые голоса других шардов
+async def sync_votes():
+    for shard, feed in vote_feeds.items():
+        for text, emotion, count in await asyncio.to_thread(feed.read):
+            vote_index.add(text, emotion, count)
+            if lexicon is not None:
+                lexicon.add_vote(text, emotion, count)
+        # Свой курсор сохраняем в своем хранилище: по нему шард shard чистит свой vote_log
+        if feed.cursor is not None and saved_feed_cursors.get(shard) != feed.cursor:
+            await storage.save_feed_cursor(shard, feed.cursor)
+            saved_feed_cursors[shard] = feed.cursor
+
+async def prune_vote_log():
+    # Из своего журнала голосов удаляем то, что уже прочитали все остальные шарды
+    consumed = [await asyncio.to_thread(feed.consumed, BOT_SHARD_ID) for feed in vote_feeds.values()]
+    if None in consumed:
+        return
+    deleted = await storage.prune_vote_log(min(consumed, default=sys.maxsize))
+    if deleted:
+        logger.debug(f"Vote log pruned: {deleted} records")
+
+async def vote_sync_loop():
+    while True:
+        await asyncio.sleep(VOTE_SYNC_INTERVAL)
         try:
-            with open(DATA_FILE, "r", encoding='utf-8') as f:
-                data = json.load(f)
-                globals().update(data)
-                emotion_stats.update({k: Counter(v) for k, v in data.get("emotion_stats", {}).items()})
-                user_votes.update({k: Counter(v) for k, v in data.get("user_votes", {}).items()})
+            await sync_votes()
+            await prune_vote_log()
         except Exception as e:
-            logger.error(f"Ошибка загрузки данных: {e}")
+            logger.error(f"Ошибка чтения голосов других шардов: {e}")
+#Добавляет голос за эмоцию и сохраняет только его
+#Возвращает (лидер, голосов у лидера, голосов за emotion)
+async def add_vote(user_text: str, emotion: str) -> tuple:
+    result = vote_index.add(user_text, emotion)
+    lexicon.add_vote(user_text, emotion) # Голос сразу уточняет словарный классификатор
+    try:
+        await storage.add_vote(user_text, emotion)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения данных: {e}")
+    return result
 
 # ================== ОБРАБОТЧИКИ КОМАНД ==================
 @dp.message(Command("start"))
@@ -250,18 +383,15 @@ async def help_command(message: types.Message):
 @dp.message(Command("stats"))
 async def show_stats(message: types.Message):
     user_id = str(message.from_user.id)
+    history = await get_history(user_id)
     
-    if user_id not in user_history or not user_history[user_id]:
+    if not history:
         await message.answer("У вас пока нет истории эмоций.")
         return
     
-    # Собираем полную статистику по всем эмоциям
-    emotion_counter = Counter()
-    for entry in user_history[user_id]:
-        emotion = entry["emotion"]
-        emotion_counter[emotion] += 1
-    
-    total = sum(emotion_counter.values())
+    # Полная статистика по всем эмоциям уже посчитана в истории
+    emotion_counter = history.counts
+    total = history.total
     lang = detect_language(message.text) if message.text else "ru"
     
     # Формируем сообщение с полной статистикой
@@ -290,8 +420,9 @@ async def show_stats(message: types.Message):
 @dp.message(Command("history"))
 async def show_history(message: types.Message):
     user_id = str(message.from_user.id)
+    history = await get_history(user_id)
     
-    if user_id not in user_history or not user_history[user_id]:
+    if not history:
         await message.answer("У вас пока нет истории запросов.")
         return
     
@@ -299,16 +430,15 @@ async def show_history(message: types.Message):
     history_text = "🕒 <b>Последние 5 запросов:</b>\n\n"
     
     # Берем последние 5 записей
-    last_entries = user_history[user_id][-5:][::-1]  # Новые сверху
+    last_entries = history.last(5)  # Новые сверху
     
-    for i, entry in enumerate(last_entries, 1):
-        emotion = entry["emotion"]
+    for i, (text, emotion, ts) in enumerate(last_entries, 1):
         text_preview = (
-            entry["text"][:20] + "..." 
-            if len(entry["text"]) > 20 
-            else entry["text"]
+            text[:20] + "..." 
+            if len(text) > 20 
+            else text
         )
-        timestamp = datetime.fromisoformat(entry["timestamp"]).strftime("%d.%m %H:%M")
+        timestamp = datetime.fromtimestamp(ts).strftime("%d.%m %H:%M")
         
         history_text += (
             f"{i}. <i>{text_preview}</i>\n"
@@ -356,71 +486,79 @@ async def how_i_work(message: types.Message):
 #Определяет эмоцию в тексте и отправляет результат пользователю
 @dp.message(F.text)
 async def analyze(message: types.Message, state: FSMContext):
+    with metrics.stage("handler"):
+        await analyze_message(message, state)
+
+async def analyze_message(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     current_time = time.time()
-    # Защита от флуда - 10 секунд между запросами
-    if current_time - user_last_request.get(user_id, 0) < 10:
-        await message.answer("Пожалуйста, подождите 10 секунд перед следующим запросом.")
+    # Защита от флуда - token bucket на пользователя
+    allowed, retry_after = await rate_limiter.acquire(user_id)
+    if not allowed:
+        await message.answer(f"Пожалуйста, подождите {math.ceil(retry_after)} сек. перед следующим запросом.")
         return
     
-    user_last_request[user_id] = current_time
-    user_text = message.text.lower()
+    # Текст хранится как есть: индекс голосов сам не различает регистр, а обучение
+    # голов (api/train_head.py) ищет оценки в кэше API по исходному тексту
+    user_text = message.text
     
     # Проверяем, есть ли голосованные эмоции для этого текста
-    if user_text in user_votes:
-        votes = user_votes[user_text]
+    voted = vote_index.lookup(user_text)
+    if voted:
+        # Эмоция с максимальным количеством голосов уже известна индексу
+        max_emotion, max_votes = voted
+        lang = detect_language(user_text)
+        metrics.REQUESTS.labels(lang, "votes").inc()
         
-        # Если есть голоса, выбираем эмоцию с максимальным количеством
-        if votes:
-            max_emotion = max(votes, key=votes.get)
-            lang = detect_language(user_text)
-            sticker_path = STICKER_PATHS.get(max_emotion, {}).get(lang, "")
-            
-            if sticker_path and os.path.exists(sticker_path):
-                with open(sticker_path, "rb") as f:
-                    await message.answer_animation(
-                        BufferedInputFile(f.read(), "sticker.gif"),
-                        caption=f"На основе голосования: {EMOTIONS[max_emotion][lang]} (голосов: {votes[max_emotion]})"
-                    )
+        with metrics.stage("sticker"):
+            if stickers.has(max_emotion, lang):
+                await stickers.send(
+                    message.answer_animation, max_emotion, lang,
+                    caption=f"На основе голосования: {EMOTIONS[max_emotion][lang]} (голосов: {max_votes})"
+                )
             else:
-                await message.answer(f"На основе голосования: {EMOTIONS[max_emotion][lang]} (голосов: {votes[max_emotion]})")
-            return
+                await message.answer(f"На основе голосования: {EMOTIONS[max_emotion][lang]} (голосов: {max_votes})")
+        return
     
-    # Если нет подтвержденной эмоции, определяем через API
-    emotion_data = await detect_emotion_api(message.text)
+    # Если нет подтвержденной эмоции, определяем через API.
+    # Идентификатор трассировки связывает записи бота и API об одном сообщении
+    trace_id = metrics.new_trace_id()
+    emotion_data = await detect_emotion_api(message.text, trace_id)
+    metrics.REQUESTS.labels(emotion_data["language"], emotion_data["source"]).inc()
     
     # Сохраняем историю
-    if user_id not in user_history:
-        user_history[user_id] = []
-    user_history[user_id].append({
-        "text": message.text,
-        "emotion": emotion_data["emotion"],
-        "timestamp": datetime.now().isoformat()
-    })
+    history = await get_history(str(user_id))
+    history.append(message.text, emotion_data["emotion"], current_time)
+    try:
+        seq = await storage.add_history(str(user_id), message.text, emotion_data["emotion"], current_time)
+        user_history.written(str(user_id), seq) # Пока запись не на диске, историю не вытесняем
+    except Exception as e:
+        logger.error(f"Ошибка сохранения данных: {e}")
     
-    # Отправляем результат с возможностью обратной связи
-    sticker_path = STICKER_PATHS.get(emotion_data["emotion"], {}).get(emotion_data["language"], "")
-    if sticker_path and os.path.exists(sticker_path):
-        with open(sticker_path, "rb") as f:
-            sent_message = await message.answer_animation(
-                BufferedInputFile(f.read(), "sticker.gif"),
-                caption=f"Я думаю, это {emotion_data['label']}...",
+    # Отправляем результат с возможностью обратной связи.
+    # Ответ словарного классификатора помечается, чтобы пользователь знал, что он приблизительный
+    note = "\n⚡ Упрощенный режим: сервис распознавания временно недоступен" if emotion_data["source"] == "lexicon" else ""
+    with metrics.stage("sticker"):
+        if stickers.has(emotion_data["emotion"], emotion_data["language"]):
+            sent_message = await stickers.send(
+                message.answer_animation, emotion_data["emotion"], emotion_data["language"],
+                caption=f"Я думаю, это {emotion_data['label']}...{note}",
+                reply_markup=get_feedback_kb()
+            )
+        else:
+            sent_message = await message.answer(
+                f"{emotion_data['label']} (уверенность: {emotion_data['confidence']:.0%}){note}",
                 reply_markup=get_feedback_kb()
             )
-    else:
-        sent_message = await message.answer(
-            f"{emotion_data['label']} (уверенность: {emotion_data['confidence']:.0%})",
-            reply_markup=get_feedback_kb()
-        )
     # Сохраняем состояние для обработки обратной связи
     await state.set_state(FeedbackStates.waiting_for_feedback)
     await state.set_data({
-        "user_text": message.text.lower(),
+        "user_text": message.text,
         "original_emotion": emotion_data["emotion"],
+        "language": emotion_data["language"], # Язык, который выбрал API
+        "source": emotion_data["source"], # api или lexicon
         "message_id": sent_message.message_id
     })
-    
-    save_data()
 
 # ================== ОБРАБОТЧИКИ ОБРАТНОЙ СВЯЗИ ==================
 @dp.callback_query(F.data.startswith("feedback_")) #Обработчик обратной связи (подтверждение/отклонение эмоции)
@@ -428,19 +566,14 @@ async def handle_feedback(callback: types.CallbackQuery, state: FSMContext):
     user_data = await state.get_data()
     user_text = user_data.get("user_text", "")
     original_emotion = user_data.get("original_emotion", "")
+    lang = user_data.get("language") or detect_language(user_text)
     
     if callback.data == "feedback_yes": # Пользователь подтвердил эмоцию - увеличиваем счетчик
-        if user_text not in user_votes:
-            user_votes[user_text] = Counter()
-        user_votes[user_text][original_emotion] += 1
-        
-        votes = user_votes[user_text]
-        max_emotion = max(votes, key=votes.get)
-        lang = detect_language(user_text)
+        max_emotion, max_votes, _ = await add_vote(user_text, original_emotion)
         
          # Обновляем подпись сообщения
         await callback.message.edit_caption(
-            caption=f"✅ Ваш голос учтён: {EMOTIONS[max_emotion][lang]} (голосов: {votes[max_emotion]})",
+            caption=f"✅ Ваш голос учтён: {EMOTIONS[max_emotion][lang]} (голосов: {max_votes})",
             reply_markup=None  # Убираем кнопки
         )
         await state.clear()
@@ -452,23 +585,18 @@ async def handle_feedback(callback: types.CallbackQuery, state: FSMContext):
         )
         await state.set_state(FeedbackStates.waiting_for_emotion)
     
-    save_data()
     await callback.answer()
 
 @dp.callback_query(F.data.startswith("emotion_"), FeedbackStates.waiting_for_emotion)  #Обработчик выбора эмоции пользователем
 async def handle_emotion_choice(callback: types.CallbackQuery, state: FSMContext):
-    selected_emotion = callback.data.split("_")[1]
+    selected_emotion = callback.data.split("_", 1)[1] # "emotion_no_emotion" -> "no_emotion"
     user_data = await state.get_data()
     user_text = user_data.get("user_text", "")
     original_emotion = user_data.get("original_emotion", "")
+    lang = user_data.get("language") or detect_language(user_text)
     message_id = user_data.get("message_id", "")
     # Увеличиваем счетчик для выбранной эмоции
-    if user_text not in user_votes:
-        user_votes[user_text] = Counter()
-    user_votes[user_text][selected_emotion] += 1
-    
-    votes = user_votes[user_text]
-    lang = detect_language(user_text)
+    _, _, selected_votes = await add_vote(user_text, selected_emotion)
     
      # Если эмоция изменилась, удаляем старый стикер и отправляем новый
     if selected_emotion != original_emotion:
@@ -477,40 +605,93 @@ async def handle_emotion_choice(callback: types.CallbackQuery, state: FSMContext
         except Exception as e:
             logger.error(f"Ошибка при удалении сообщения: {e}")
         
-        sticker_path = STICKER_PATHS.get(selected_emotion, {}).get(lang, "")
-        if sticker_path and os.path.exists(sticker_path):
-            with open(sticker_path, "rb") as f:
-                await callback.message.answer_animation(
-                    BufferedInputFile(f.read(), "sticker.gif"),
-                    caption=f"✅ Спасибо за помощь! Благодаря вам, я стал умнее!\n"
-                           f"Выбрано: {EMOTIONS[selected_emotion][lang]} (голосов: {votes[selected_emotion]})"
-                )
+        if stickers.has(selected_emotion, lang):
+            await stickers.send(
+                callback.message.answer_animation, selected_emotion, lang,
+                caption=f"✅ Спасибо за помощь! Благодаря вам, я стал умнее!\n"
+                       f"Выбрано: {EMOTIONS[selected_emotion][lang]} (голосов: {selected_votes})"
+            )
         else: 
             await callback.message.answer(
                 f"✅ Спасибо за помощь! Благодаря вам, я стал умнее!\n"
-                f"Выбрано: {EMOTIONS[selected_emotion][lang]} (голосов: {votes[selected_emotion]})"
+                f"Выбрано: {EMOTIONS[selected_emotion][lang]} (голосов: {selected_votes})"
             )
     else:
         # Если эмоция не изменилась, просто обновляем подпись
         await callback.message.edit_caption(
-            caption=f"✅ Ваш голос учтён: {EMOTIONS[selected_emotion][lang]} (голосов: {votes[selected_emotion]})",
+            caption=f"✅ Ваш голос учтён: {EMOTIONS[selected_emotion][lang]} (голосов: {selected_votes})",
             reply_markup=None
         )
     
     await state.clear()
-    save_data()
     await callback.answer()
 
 # ================== ЗАПУСК БОТА ==================
 async def on_startup():
-    load_data() # Загружаем сохраненные данные
+    global api_client, storage, vote_index, rate_limiter, metrics_runner, lexicon, vote_feeds, vote_sync_task
+    storage = load_data() # Открываем хранилище и загружаем голоса
+    vote_index = await load_votes()
+    if BOT_SHARDS > 1: # Глобальные голоса - сумма голосов всех шардов
+        vote_feeds = {
+            shard: VoteFeed(STORAGE_BACKEND, shard_dir(DATA_ROOT, shard, BOT_SHARDS))
+            for shard in range(BOT_SHARDS) if shard != BOT_SHARD_ID
+        }
+        await sync_votes()
+    # С одним шардом цикл только чистит vote_log: читать его некому
+    vote_sync_task = asyncio.create_task(vote_sync_loop())
+    lexicon = LexiconClassifier.from_votes(EMOTIONS, vote_index.items())
+    storage.start() # Фоновый сброс изменений на диск
+    if RATE_LIMIT_BACKEND == "redis":
+        bucket_store = RedisBucketStore(REDIS_URL)
+    else:
+        bucket_store = MemoryBucketStore()
+    rate_limiter = RateLimiter(bucket_store, burst=RATE_LIMIT_BURST, interval=RATE_LIMIT_INTERVAL)
+    await asyncio.to_thread(stickers.preload) # Стикеры без file_id читаем в память заранее
+    api_client = InferenceClient(
+        API_URLS,
+        connect_timeout=API_CONNECT_TIMEOUT,
+        read_timeout=API_READ_TIMEOUT,
+        total_timeout=API_TOTAL_TIMEOUT,
+        retries=API_RETRIES
+    )
+    await api_client.start()
+    if BOT_MODE != "webhook" and METRICS_PORT:
+        metrics_runner = await metrics.start_metrics_server("0.0.0.0", METRICS_PORT)
     logger.info("Bot started")
 
 async def on_shutdown():
-    save_data() # Сохраняем данные перед выходом
+    if vote_sync_task is not None:
+        vote_sync_task.cancel()
+    for feed in vote_feeds.values():
+        feed.close()
+    if storage is not None:
+        await storage.close() # Закрываем хранилище перед выходом
+        if BOT_SHARDS == 1:
+            try:
+                vote_index.save(VOTES_INDEX_FILE)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения индекса голосов: {e}")
+    if api_client is not None:
+        await api_client.close()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
     logger.info("Bot stopped")
 
 if __name__ == "__main__":
     dp.startup.register(on_startup) # Регистрируем обработчики событий
     dp.shutdown.register(on_shutdown)
-    asyncio.run(dp.start_polling(bot))   # Запускаем бота
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(
+            dp, bot, WEBHOOK_BASE_URL,
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_concurrency=MAX_CONCURRENT_UPDATES,
+            max_pending=MAX_PENDING_UPDATES
+        )
+    else:
+        asyncio.run(dp.start_polling(bot))   # Запускаем бота
@@ -0,0 +1,57 @@
+# circuit.py - автоматический выключатель для запросов к API
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """
+    Следит за последними window запросами к API. Если доля ошибок
+    (медленный ответ дольше slow_call тоже считается ошибкой) достигает
+    error_rate, выключатель размыкается: cooldown секунд запросы к API
+    не отправляются и бот сразу отвечает запасным способом. После паузы
+    пропускается один пробный запрос: успех замыкает цепь, ошибка - снова пауза
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = 20, min_calls: int = 5, error_rate: float = 0.5, slow_call: float = 2.0, cooldown: float = 30.0):
+        self.window = window
+        self.min_calls = min_calls  # Меньше вызовов - мало данных для решения
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._calls = deque(maxlen=window)  # True - ошибка или медленный ответ
+        self._opened_at = 0.0
+        self._probe_at = None  # Когда отправлен пробный запрос
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            self._probe_at = None
+        # Если пробный запрос так и не завершился (например, отменен), через cooldown пробуем снова
+        if self.state == self.HALF_OPEN and (self._probe_at is None or now - self._probe_at >= self.cooldown):
+            self._probe_at = now
+            return True
+        return False
+
+    def record(self, ok: bool, duration: float):
+        failed = not ok or duration > self.slow_call
+        if self.state == self.HALF_OPEN:
+            if failed:
+                self._open()
+            else:
+                self.state = self.CLOSED
+                self._calls.clear()
+            return
+        self._calls.append(failed)
+        if len(self._calls) >= self.min_calls and sum(self._calls) / len(self._calls) >= self.error_rate:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
@@ -0,0 +1,120 @@
+# fake_telegram.py - локальная заглушка Telegram Bot API для тестов и нагрузочных прогонов
+import asyncio
+import itertools
+import time
+from typing import List, Tuple
+
+import aiohttp
+from aiohttp import web
+
+
+class FakeTelegram:
+    """
+    Отвечает на вызовы Bot API (/bot<token>/<method>) правдоподобными
+    результатами и запоминает их. Бот подключается к заглушке через
+    TELEGRAM_API_URL=http://localhost:<port>, а обновления подаются
+    в webhook бота через push_update()
+    """
+
+    def __init__(self):
+        self.calls: List[Tuple[str, dict]] = []  # (метод, параметры) в порядке вызова
+        self.webhook_url = None
+        self._ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 ** 2)  # Бот загружает GIF-стикеры
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {key: value for key, value in (await request.post()).items()}
+        self.calls.append((method, params))
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _message(self, params: dict, **fields) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            **fields,
+        }
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method == "sendMessage":
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendAnimation":
+            file_id = f"fake-file-{next(self._ids)}"
+            animation = {"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1, "duration": 1}
+            return self._message(params, caption=params.get("caption", ""), animation=animation)
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+        return True  # editMessageCaption, deleteMessage, answerCallbackQuery и прочие
+
+    def count(self, method: str) -> int:
+        return sum(1 for name, _ in self.calls if name == method)
+
+    async def wait_call(self, start: int, methods: Tuple[str, ...], timeout: float = 10.0, **params) -> Tuple[str, dict]:
+        """
+        Ждет вызова одного из methods с указанными параметрами (сравниваются как строки)
+        среди вызовов после номера start - так проверяется ответ бота в режиме webhook
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            for method, call_params in self.calls[start:]:
+                if method in methods and all(str(call_params.get(key)) == str(value) for key, value in params.items()):
+                    return method, call_params
+            if time.monotonic() > deadline:
+                raise asyncio.TimeoutError(f"No {methods} call with {params}")
+            await asyncio.sleep(0.005)
+
+
+_update_ids = itertools.count(1)
+
+def message_update(user_id: int, text: str) -> dict:
+    # Обновление с текстовым сообщением пользователя
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+def callback_update(user_id: int, data: str, message_id: int = 1) -> dict:
+    # Нажатие inline-кнопки (feedback_yes, feedback_no, emotion_<эмоция>)
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "chat_instance": str(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "caption": "",
+            },
+        },
+    }
+
+async def push_update(session: aiohttp.ClientSession, webhook_url: str, update: dict, secret_token: str = None) -> int:
+    # Доставляет обновление в webhook бота так же, как это делает Telegram
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+    async with session.post(webhook_url, json=update, headers=headers) as response:
+        return response.status
+
+
+if __name__ == "__main__":
+    # Отдельный запуск: python bot/fake_telegram.py [порт]
+    import sys
+    web.run_app(FakeTelegram().app(), host="127.0.0.1", port=int(sys.argv[1]) if len(sys.argv) > 1 else 8081)
@@ -0,0 +1,67 @@
+# fsm_storage.py - хранилище состояний FSM в SQLite, переживает перезапуск бота
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """
+    Состояния и данные FSM (FeedbackStates) в SQLite в режиме WAL.
+    Несколько процессов бота на одной машине могут работать с одним файлом,
+    для нескольких машин используется RedisStorage из aiogram
+    """
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA busy_timeout=5000")  # Ждем, если файл занят другим процессом
+        self.db.execute("CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT)")
+        # Один поток: соединение не делится между потоками
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    def _read(self, key: str, column: str):
+        row = self.db.execute(f"SELECT {column} FROM fsm WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, key: str, column: str, value):
+        self.db.execute(
+            f"INSERT INTO fsm (key, {column}) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET {column} = excluded.{column}",
+            (key, value),
+        )
+        # Пустая запись (нет состояния и данных) удаляется, иначе таблица растет с каждым пользователем
+        self.db.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND data IS NULL", (key,))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._call(self._write, self._key(key), "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._call(self._read, self._key(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        value = json.dumps(data, ensure_ascii=False) if data else None
+        await self._call(self._write, self._key(key), "data", value)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self._call(self._read, self._key(key), "data")
+        return json.loads(value) if value else {}
+
+    async def close(self) -> None:
+        await self._call(self.db.close)
+        self._executor.shutdown()
@@ -0,0 +1,146 @@
+# history.py - компактная история пользователя с готовой статистикой
+import itertools
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from interning import emotion_codes, text_pool
+
+# Запись истории: (текст, эмоция, время в секундах с эпохи)
+Entry = Tuple[str, str, float]
+
+
+class UserHistory:
+    """
+    Последние limit записей в кольцевом буфере и счетчики эмоций
+    за все время. /stats читает только счетчики, /history - хвост буфера,
+    поэтому стоимость не зависит от возраста аккаунта.
+
+    Запись хранится в трех параллельных массивах: номер текста в общем
+    пуле, код эмоции и время в целых секундах - 10 байт вместо кортежа,
+    строки эмоции и отдельной копии текста. Счетчики - массив по кодам эмоций
+    """
+
+    __slots__ = ("limit", "_texts", "_emotions", "_times", "_start", "_counts", "total")
+
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        self._texts = array("I")  # Номера в text_pool
+        self._emotions = array("H")  # Коды emotion_codes
+        self._times = array("I")  # Секунды с эпохи (хватит до 2106 года)
+        self._start = 0  # Самая старая запись, когда буфер заполнен
+        self._counts = array("I")
+        self.total = 0
+
+    @classmethod
+    def restore(cls, entries: Iterable[Entry], stats: Dict[str, int], limit: int = 100) -> "UserHistory":
+        # entries - последние записи из хранилища, stats - счетчики за все время
+        history = cls(limit)
+        for text, emotion, ts in entries:
+            history._push(text, emotion, ts)
+        for emotion, count in stats.items():
+            history._count(emotion, count)
+        return history
+
+    def _push(self, text: str, emotion: str, ts: float):
+        text_id = text_pool.acquire(text)
+        code = emotion_codes.code(emotion)
+        if len(self._texts) < self.limit:
+            self._texts.append(text_id)
+            self._emotions.append(code)
+            self._times.append(int(ts))
+            return
+        # Буфер заполнен - перезаписываем самую старую запись
+        i = self._start
+        text_pool.release(self._texts[i])
+        self._texts[i], self._emotions[i], self._times[i] = text_id, code, int(ts)
+        self._start = (i + 1) % self.limit
+
+    def _count(self, emotion: str, count: int):
+        code = emotion_codes.code(emotion)
+        if code >= len(self._counts):
+            self._counts.extend([0] * (code + 1 - len(self._counts)))
+        self._counts[code] += count
+        self.total += count
+
+    def append(self, text: str, emotion: str, ts: float):
+        self._push(text, emotion, ts)
+        self._count(emotion, 1)
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        # Ненулевые счетчики по названиям эмоций
+        return {emotion_codes.name(code): count for code, count in enumerate(self._counts) if count}
+
+    def last(self, k: int) -> List[Entry]:
+        # Последние k записей, новые первыми
+        n = len(self._texts)
+        result = []
+        for offset in range(1, min(k, n) + 1):
+            i = (self._start - offset) % n
+            result.append((text_pool[self._texts[i]], emotion_codes.name(self._emotions[i]), float(self._times[i])))
+        return result
+
+    def __del__(self):
+        # История выгружена - ее тексты больше не держат место в пуле
+        for text_id in self._texts:
+            text_pool.release(text_id)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __bool__(self) -> bool:
+        return self.total > 0
+
+
+class HistoryCache:
+    """
+    Истории недавно активных пользователей, не больше max_users. Вытесняются
+    давно не использованные, но только если их записи уже сброшены на диск:
+    при следующем обращении история снова читается из хранилища
+    """
+
+    def __init__(self, max_users: int = 10000):
+        self.max_users = max_users
+        self._items: "OrderedDict[str, UserHistory]" = OrderedDict()
+        self._writes: Dict[str, int] = {}  # user_id -> номер последней записи в хранилище (AsyncStorage.writes)
+        self.evictions = 0
+
+    def get(self, user_id: str) -> Optional[UserHistory]:
+        history = self._items.get(user_id)
+        if history is not None:
+            self._items.move_to_end(user_id)
+        return history
+
+    def put(self, user_id: str, history: UserHistory, flushed: int):
+        self._items[user_id] = history
+        self._items.move_to_end(user_id)
+        self.evict(flushed)
+
+    def written(self, user_id: str, seq: int):
+        if user_id in self._items:
+            self._writes[user_id] = seq
+
+    def evict(self, flushed: int) -> int:
+        # flushed - номер последней записи, которая уже на диске (AsyncStorage.flushed_writes)
+        excess = len(self._items) - self.max_users
+        if excess <= 0:
+            return 0
+        victims = []
+        # От давно не использованных к недавним; только что добавленную историю не трогаем
+        for user_id in itertools.islice(self._items, len(self._items) - 1):
+            if self._writes.get(user_id, 0) <= flushed:
+                victims.append(user_id)
+                if len(victims) == excess:
+                    break
+        for user_id in victims:
+            del self._items[user_id]
+            self._writes.pop(user_id, None)
+        self.evictions += len(victims)
+        return len(victims)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
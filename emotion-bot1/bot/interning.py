@@ -0,0 +1,85 @@
+# interning.py - общие таблицы, чтобы состояние пользователей хранило числа вместо строк
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+
+class Codebook:
+    """
+    Эмоция <-> небольшое число. Коды раздаются по порядку появления;
+    бот заранее регистрирует ключи EMOTIONS, незнакомые метки (например,
+    от новой модели) получают следующий свободный код. Коды живут только
+    в памяти процесса, на диск всегда пишутся названия
+    """
+
+    __slots__ = ("names", "_codes")
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self.extend(names)
+
+    def extend(self, names: Iterable[str]):
+        for name in names:
+            self.code(name)
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def name(self, code: int) -> str:
+        return self.names[code]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class TextPool:
+    """
+    Каждый текст хранится один раз, записи ссылаются на него номером.
+    Счетчик ссылок освобождает текст, когда его не держит ни одна запись,
+    номер затем переиспользуется
+    """
+
+    __slots__ = ("_ids", "_texts", "_refs", "_free")
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._texts: List[Optional[str]] = []
+        self._refs = array("I")
+        self._free: List[int] = []
+
+    def acquire(self, text: str) -> int:
+        text_id = self._ids.get(text)
+        if text_id is None:
+            if self._free:
+                text_id = self._free.pop()
+                self._texts[text_id] = text
+                self._refs[text_id] = 0
+            else:
+                text_id = len(self._texts)
+                self._texts.append(text)
+                self._refs.append(0)
+            self._ids[text] = text_id
+        self._refs[text_id] += 1
+        return text_id
+
+    def release(self, text_id: int):
+        self._refs[text_id] -= 1
+        if self._refs[text_id] == 0:
+            del self._ids[self._texts[text_id]]
+            self._texts[text_id] = None
+            self._free.append(text_id)
+
+    def __getitem__(self, text_id: int) -> str:
+        return self._texts[text_id]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+# Общие для всего процесса таблицы
+emotion_codes = Codebook()
+text_pool = TextPool()
@@ -0,0 +1,165 @@
+# lexicon.py - быстрый словарный классификатор эмоций для работы без API
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from votes import normalize_vote_text
+
+# Начальный словарь: основы слов для каждой эмоции. Слово подходит, если
+# начинается с основы, поэтому "радост" покрывает "радостный" и "радостью".
+# Основы короче MIN_PREFIX_STEM совпадают только с целым словом: "ура" - это
+# не "уравнение", а "fun" - не "funeral"
+SEED_STEMS = {
+    "joy": {
+        "ru": ["рад", "рада", "радо", "радост", "раду", "счаст", "весел", "ура", "класс", "отлич", "супер", "круто", "побед", "хорош", "прекрасн"],
+        "en": ["joy", "joyf", "happ", "glad", "great", "awesome", "yay", "fun", "funn", "win", "winn", "cool", "wonderful", "amazing"],
+    },
+    "sadness": {
+        "ru": ["груст", "печал", "тоск", "плак", "жаль", "плох", "скуча"],
+        "en": ["sad", "sadn", "sadd", "cry", "cryi", "crie", "unhapp", "sorrow", "depress", "upset", "hurt", "lost"],
+    },
+    "anger": {
+        "ru": ["злю", "злой", "злит", "злост", "злюс", "бесит", "бешен", "ненави", "гнев", "ярост", "раздраж", "достал"],
+        "en": ["angr", "hate", "furious", "annoy", "rage", "pissed", "irritat"],
+    },
+    "fear": {
+        "ru": ["страш", "боюс", "бояз", "ужас", "тревож", "паник", "опаса"],
+        "en": ["fear", "afraid", "scare", "scary", "terrif", "anxi", "panic", "nervous", "worr"],
+    },
+    "surprise": {
+        "ru": ["удив", "неожидан", "вау", "ого", "невероят", "внезап"],
+        "en": ["surpris", "wow", "unexpect", "shock", "omg", "unbeliev", "sudden"],
+    },
+    "gratitude": {
+        "ru": ["спасиб", "благодар", "признател"],
+        "en": ["thank", "grateful", "appreciat", "thx"],
+    },
+    "excitement": {
+        "ru": ["волн", "предвкуш", "жду не дожд", "восторг", "азарт"],
+        "en": ["excit", "thrill", "can't wait", "pumped", "eager"],
+    },
+    "love": {
+        "ru": ["любл", "любов", "любим", "обожа", "нежн", "милы", "мила"],
+        "en": ["love", "ador", "darling", "sweet", "dear"],
+    },
+    "loneliness": {
+        "ru": ["одино", "никому не нуж", "покину"],
+        "en": ["lonely", "alone", "lonel", "abandon", "nobody"],
+    },
+    "anticipation": {
+        "ru": ["ожида", "жду", "скоро", "надеюс"],
+        "en": ["anticipat", "expect", "await", "soon", "hope"],
+    },
+    "disgust": {
+        "ru": ["отвра", "мерз", "противн", "гадк", "тошн"],
+        "en": ["disgust", "gross", "yuck", "nasty", "eww", "sick of"],
+    },
+    "jealousy": {
+        "ru": ["ревн", "завид", "завист"],
+        "en": ["jealous", "envy", "envious"],
+    },
+    "embarrassment": {
+        "ru": ["смущ", "неловк", "стесн", "конфуз"],
+        "en": ["embarrass", "awkward", "blush", "cringe"],
+    },
+    "serenity": {
+        "ru": ["спокой", "умиротвор", "тихо", "безмятеж", "расслаб"],
+        "en": ["calm", "peace", "seren", "relax", "tranquil"],
+    },
+    "shame": {
+        "ru": ["стыд", "позор", "винова"],
+        "en": ["shame", "asham", "guilt", "disgrace"],
+    },
+    "confusion": {
+        "ru": ["не понима", "запута", "замешат", "странн", "непонят"],
+        "en": ["confus", "puzzl", "don't understand", "weird", "strange"],
+    },
+}
+SEED_WEIGHT = 1.0
+MIN_PREFIX_STEM = 4  # Основы короче этого совпадают только с целым словом
+VOTE_PRIOR = 3.0  # Слову нужно несколько голосов, чтобы его распределение стало весомым
+MAX_CONFIDENCE = 0.9  # Словарь не должен выглядеть увереннее модели
+
+
+class LexiconClassifier:
+    """
+    Считает эмоцию по словам текста: основы из SEED_STEMS и распределения
+    эмоций, которые пользователи выбирали для текстов с этими словами.
+    Работает в процессе бота за микросекунды и дообучается с каждым голосом
+    """
+
+    def __init__(self, emotion_names: Dict[str, Dict[str, str]], default: str = "neutral"):
+        self.default = default
+        self._emotions = set(emotion_names)  # Голоса за другие метки не учитываются
+        self._stems: Dict[str, Dict[str, float]] = defaultdict(dict)  # основа -> {эмоция: вес}
+        self._phrases: Dict[str, Dict[str, float]] = defaultdict(dict)  # фразы из нескольких слов
+        self._word_votes: Dict[str, Dict[str, int]] = defaultdict(dict)  # слово -> {эмоция: голосов}
+        for emotion, stems in SEED_STEMS.items():
+            for stem in stems["ru"] + stems["en"]:
+                self._add_seed(stem, emotion)
+        # Названия категорий из EMOTIONS тоже считаются ключевыми словами
+        for emotion, names in emotion_names.items():
+            if emotion in ("neutral", "no_emotion"):
+                continue
+            for name in names.values():
+                self._add_seed(name, emotion)
+
+    def _add_seed(self, stem: str, emotion: str):
+        stem = normalize_vote_text(stem)  # Как и текст: "can't wait" -> "can t wait"
+        target = self._phrases if " " in stem else self._stems
+        target[stem][emotion] = SEED_WEIGHT
+
+    def add_vote(self, text: str, emotion: str, count: int = 1):
+        if emotion not in self._emotions:
+            return  # Старые или испорченные метки (например, "no" вместо "no_emotion")
+        for word in set(normalize_vote_text(text).split()):
+            votes = self._word_votes[word]
+            votes[emotion] = votes.get(emotion, 0) + count
+
+    @classmethod
+    def from_votes(cls, emotion_names: Dict[str, Dict[str, str]], votes: Iterable[Tuple[str, Dict[str, int]]]) -> "LexiconClassifier":
+        lexicon = cls(emotion_names)
+        for text, counts in votes:
+            for emotion, count in counts.items():
+                lexicon.add_vote(text, emotion, count)
+        return lexicon
+
+    def _stem_match(self, word: str) -> Optional[Dict[str, float]]:
+        # Целое слово или самая длинная основа не короче MIN_PREFIX_STEM, с которой оно начинается
+        weights = self._stems.get(word)
+        if weights is not None:
+            return weights
+        for end in range(len(word) - 1, MIN_PREFIX_STEM - 1, -1):
+            weights = self._stems.get(word[:end])
+            if weights is not None:
+                return weights
+        return None
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """(эмоция, уверенность); без совпадений - default с нулевой уверенностью"""
+        normalized = normalize_vote_text(text)
+        scores: Dict[str, float] = defaultdict(float)
+        for phrase, weights in self._phrases.items():
+            if phrase in normalized:
+                for emotion, weight in weights.items():
+                    scores[emotion] += weight
+        for word in normalized.split():
+            weights = self._stem_match(word)
+            if weights:
+                for emotion, weight in weights.items():
+                    scores[emotion] += weight
+            votes = self._word_votes.get(word)
+            if votes:
+                # Доля голосов за эмоцию, с поправкой на малое число голосов;
+                # частые слова ("я", "the") размазаны по всем эмоциям и почти не влияют
+                total = sum(votes.values())
+                strength = total / (total + VOTE_PRIOR)
+                for emotion, count in votes.items():
+                    scores[emotion] += strength * count / total
+        if not scores:
+            return self.default, 0.0
+        emotion = max(scores, key=scores.get)
+        # Уверенность - доля лидера, умноженная на насыщение по его весу: одно слово дает мало
+        share = scores[emotion] / sum(scores.values())
+        evidence = 1 - math.exp(-scores[emotion])
+        return emotion, round(min(MAX_CONFIDENCE, share * evidence), 3)
@@ -0,0 +1,56 @@
+# metrics.py - метрики бота в формате Prometheus
+import time
+import uuid
+from contextlib import contextmanager
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Заголовок, в котором идентификатор трассировки уходит в API
+TRACE_HEADER = "X-Request-ID"
+
+# Стадии: handler - обработка сообщения целиком, api - HTTP-запрос к API,
+# sticker - отправка стикера или текста, history - загрузка истории пользователя
+STAGE_LATENCY = Histogram(
+    "emotion_bot_stage_seconds", "Время стадии обработки сообщения", ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+FLUSH_LATENCY = Histogram(
+    "emotion_bot_storage_flush_seconds", "Время сброса хранилища на диск",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+FLUSH_BYTES = Counter("emotion_bot_storage_flush_bytes_total", "Записано байт при сбросах хранилища")
+REQUESTS = Counter("emotion_bot_messages_total", "Сообщений на анализ по языку и источнику ответа", ["language", "source"])
+FALLBACKS = Counter("emotion_bot_fallback_total", "Ответов словарного классификатора вместо API", ["reason"])
+CIRCUIT_OPEN = Gauge("emotion_bot_api_circuit_open", "1 - запросы к API приостановлены выключателем")
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+def observe_flush(duration: float, written: int):
+    # Передается в AsyncStorage и вызывается после каждого сброса
+    FLUSH_LATENCY.observe(duration)
+    FLUSH_BYTES.inc(written)
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    response = web.Response(body=generate_latest())
+    response.content_type = CONTENT_TYPE_LATEST.split(";")[0]
+    return response
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    # Отдельный сервер /metrics для режима polling; в режиме webhook маршрут на общем сервере
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
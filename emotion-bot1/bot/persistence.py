@@ -0,0 +1,525 @@
+# persistence.py - хранилища состояния бота (история, голоса, статистика)
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Dict, Iterator, List, Tuple
+
+from history import Entry
+
+logger = logging.getLogger(__name__)
+
+
+def to_timestamp(value) -> float:
+    # Старые записи хранят время как ISO-строку, новые - как число
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+def entry_emotion(entry: dict) -> str:
+    # В самых старых записях эмоция хранилась в original_emotion/final_emotion
+    return entry.get("emotion") or entry.get("final_emotion") or entry.get("original_emotion") or "neutral"
+
+
+class StorageBackend:
+    """
+    Общий интерфейс хранилища. Каждый обработчик пишет только
+    изменившуюся запись, а при запуске читаются индексы (голоса),
+    история пользователя подгружается по требованию.
+    Изменения копятся до вызова flush(), который делает их надежными на диске
+    """
+
+    pending = 0  # Изменений с момента последнего flush()
+
+    def is_empty(self) -> bool:
+        raise NotImplementedError
+
+    def load_votes(self) -> Dict[str, Counter]:
+        raise NotImplementedError
+
+    def load_history(self, user_id: str, limit: int) -> List[Entry]:
+        # Последние limit записей в хронологическом порядке
+        raise NotImplementedError
+
+    def load_stats(self, user_id: str) -> Dict[str, int]:
+        # Счетчики эмоций пользователя за все время
+        raise NotImplementedError
+
+    def add_history(self, user_id: str, text: str, emotion: str, ts: float):
+        raise NotImplementedError
+
+    def add_vote(self, text: str, emotion: str):
+        raise NotImplementedError
+
+    def set_message_emotion(self, text: str, emotion: str):
+        raise NotImplementedError
+
+    def export(self) -> Iterator[Tuple]:
+        """
+        Все данные в виде операций для переноса в другое хранилище:
+        ("history", user_id, text, emotion, ts), ("vote", text, emotion, count),
+        ("message", text, emotion). История - в хронологическом порядке
+        """
+        raise NotImplementedError
+
+    def save_feed_cursor(self, shard: int, seq: int):
+        # Запоминает, до какого номера прочитан журнал голосов шарда shard (только SQLite)
+        pass
+
+    def prune_vote_log(self, seq: int) -> int:
+        # Удаляет из журнала голосов записи до seq включительно, возвращает их число
+        return 0
+
+    def flush(self) -> int:
+        # Возвращает число записанных байт
+        self.pending = 0
+        return 0
+
+    def close(self):
+        self.flush()
+
+
+class JsonStorage(StorageBackend):
+    """
+    Прежний формат: весь user_data.json в памяти. Файл перезаписывается
+    целиком только при flush() - через временный файл и атомарное переименование
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {"message_to_emotion": {}, "user_history": {}, "emotion_stats": {}, "user_votes": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+
+    def is_empty(self) -> bool:
+        return not any(self.data.values())
+
+    def flush(self) -> int:
+        payload = json.dumps(self.data, ensure_ascii=False, indent=2).encode("utf-8")
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # После аварии на диске останется либо старый, либо новый снимок целиком
+        os.replace(tmp_path, self.path)
+        self.pending = 0
+        return len(payload)
+
+    def load_votes(self) -> Dict[str, Counter]:
+        return {text: Counter(votes) for text, votes in self.data["user_votes"].items()}
+
+    def load_history(self, user_id: str, limit: int) -> List[Entry]:
+        entries = self.data["user_history"].get(user_id, [])[-limit:]
+        return [(entry["text"], entry_emotion(entry), to_timestamp(entry["timestamp"])) for entry in entries]
+
+    def load_stats(self, user_id: str) -> Dict[str, int]:
+        # Старые emotion_stats в файле не обновлялись, поэтому считаем по истории
+        return Counter(entry_emotion(entry) for entry in self.data["user_history"].get(user_id, []))
+
+    def add_history(self, user_id: str, text: str, emotion: str, ts: float):
+        self.data["user_history"].setdefault(user_id, []).append(
+            {"text": text, "emotion": emotion, "timestamp": datetime.fromtimestamp(ts).isoformat()}
+        )
+        stats = self.data["emotion_stats"].setdefault(user_id, {})
+        stats[emotion] = stats.get(emotion, 0) + 1
+        self.pending += 1
+
+    def add_vote(self, text: str, emotion: str):
+        votes = self.data["user_votes"].setdefault(text, {})
+        votes[emotion] = votes.get(emotion, 0) + 1
+        self.pending += 1
+
+    def set_message_emotion(self, text: str, emotion: str):
+        self.data["message_to_emotion"][text] = emotion
+        self.pending += 1
+
+    def export(self) -> Iterator[Tuple]:
+        for user_id, entries in self.data["user_history"].items():
+            for entry in entries:
+                yield "history", str(user_id), entry["text"], entry_emotion(entry), to_timestamp(entry["timestamp"])
+        for text, votes in self.data["user_votes"].items():
+            for emotion, count in votes.items():
+                yield "vote", text, emotion, count
+        for text, emotion in self.data["message_to_emotion"].items():
+            yield "message", text, emotion
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite в режиме WAL: каждое изменение - одна строка, коммит при flush()"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                user_id TEXT NOT NULL, text TEXT NOT NULL, emotion TEXT NOT NULL, ts REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_user ON history (user_id, ts);
+            CREATE TABLE IF NOT EXISTS votes (
+                text TEXT NOT NULL, emotion TEXT NOT NULL, count INTEGER NOT NULL,
+                PRIMARY KEY (text, emotion)
+            );
+            CREATE TABLE IF NOT EXISTS emotion_stats (
+                user_id TEXT NOT NULL, emotion TEXT NOT NULL, count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, emotion)
+            );
+            CREATE TABLE IF NOT EXISTS message_to_emotion (text TEXT PRIMARY KEY, emotion TEXT NOT NULL);
+            -- Каждый голос по порядку: другие шарды читают отсюда новые голоса (sharding.VoteFeed)
+            CREATE TABLE IF NOT EXISTS vote_log (seq INTEGER PRIMARY KEY, text TEXT NOT NULL, emotion TEXT NOT NULL);
+            -- До какого seq этот шард прочитал vote_log шарда shard: по минимуму из всех шардов журнал чистится
+            CREATE TABLE IF NOT EXISTS feed_cursors (shard INTEGER PRIMARY KEY, seq INTEGER NOT NULL);
+        """)
+
+    def is_empty(self) -> bool:
+        for table in ("history", "votes", "emotion_stats", "message_to_emotion"):
+            if self.db.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    def load_votes(self) -> Dict[str, Counter]:
+        votes = defaultdict(Counter)
+        for text, emotion, count in self.db.execute("SELECT text, emotion, count FROM votes"):
+            votes[text][emotion] = count
+        return dict(votes)
+
+    def load_history(self, user_id: str, limit: int) -> List[Entry]:
+        rows = self.db.execute(
+            "SELECT text, emotion, ts FROM history WHERE user_id = ? ORDER BY ts DESC LIMIT ?", (user_id, limit)
+        ).fetchall()
+        return [tuple(row) for row in reversed(rows)]
+
+    def load_stats(self, user_id: str) -> Dict[str, int]:
+        rows = self.db.execute("SELECT emotion, count FROM emotion_stats WHERE user_id = ?", (user_id,))
+        return dict(rows)
+
+    def add_history(self, user_id: str, text: str, emotion: str, ts: float):
+        self.db.execute(
+            "INSERT INTO history (user_id, text, emotion, ts) VALUES (?, ?, ?, ?)",
+            (user_id, text, emotion, ts),
+        )
+        self.db.execute(
+            "INSERT INTO emotion_stats (user_id, emotion, count) VALUES (?, ?, 1) "
+            "ON CONFLICT (user_id, emotion) DO UPDATE SET count = count + 1",
+            (user_id, emotion),
+        )
+        self.pending += 1
+
+    def add_vote(self, text: str, emotion: str):
+        self.db.execute(
+            "INSERT INTO votes (text, emotion, count) VALUES (?, ?, 1) "
+            "ON CONFLICT (text, emotion) DO UPDATE SET count = count + 1",
+            (text, emotion),
+        )
+        self.db.execute("INSERT INTO vote_log (text, emotion) VALUES (?, ?)", (text, emotion))
+        self.pending += 1
+
+    def set_message_emotion(self, text: str, emotion: str):
+        self.db.execute("INSERT OR REPLACE INTO message_to_emotion (text, emotion) VALUES (?, ?)", (text, emotion))
+        self.pending += 1
+
+    def save_feed_cursor(self, shard: int, seq: int):
+        self.db.execute(
+            "INSERT INTO feed_cursors (shard, seq) VALUES (?, ?) ON CONFLICT (shard) DO UPDATE SET seq = excluded.seq",
+            (shard, seq),
+        )
+        self.pending += 1
+
+    def prune_vote_log(self, seq: int) -> int:
+        # Последняя запись остается всегда: без AUTOINCREMENT SQLite выдает номер MAX(seq) + 1,
+        # и после удаления всех строк новые голоса получили бы номера, которые читатели уже прошли
+        deleted = self.db.execute(
+            "DELETE FROM vote_log WHERE seq <= ? AND seq < (SELECT MAX(seq) FROM vote_log)", (seq,)
+        ).rowcount
+        if deleted:
+            self.pending += 1
+        return deleted
+
+    def export(self) -> Iterator[Tuple]:
+        for user_id, text, emotion, ts in self.db.execute("SELECT user_id, text, emotion, ts FROM history ORDER BY ts, rowid"):
+            yield "history", user_id, text, emotion, ts
+        for text, emotion, count in self.db.execute("SELECT text, emotion, count FROM votes"):
+            yield "vote", text, emotion, count
+        for text, emotion in self.db.execute("SELECT text, emotion FROM message_to_emotion"):
+            yield "message", text, emotion
+
+    def flush(self) -> int:
+        # Все накопленные изменения уходят одной транзакцией
+        wal_path = self.path + "-wal"
+        size_before = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        self.db.commit()
+        size_after = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        self.pending = 0
+        return max(0, size_after - size_before)
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class JournalStorage(StorageBackend):
+    """
+    Журнал только на дозапись: одна JSON-строка на изменение.
+    При запуске журнал проигрывается один раз: голоса и счетчики эмоций
+    собираются в память, а для истории запоминаются только смещения
+    последних history_limit строк каждого пользователя
+    """
+
+    def __init__(self, path: str, history_limit: int = 100):
+        self.path = path
+        self.votes: Dict[str, Counter] = defaultdict(Counter)
+        self.stats: Dict[str, Counter] = defaultdict(Counter)
+        self.offsets: Dict[str, deque] = defaultdict(lambda: deque(maxlen=history_limit))
+        self._unsynced = 0  # Байт записано, но еще не сброшено на диск через fsync
+        self._replay()
+        self.file = open(path, "ab")
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Недописанный хвост после аварийного завершения
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Поврежденная строка - пропускаем, остальной журнал читаем
+                    logger.warning(f"Skipping broken journal record at offset {offset}")
+                    offset += len(line)
+                    continue
+                if record["op"] == "history":
+                    self.offsets[record["user"]].append(offset)
+                    self.stats[record["user"]][record["emotion"]] += 1
+                elif record["op"] == "vote":
+                    self.votes[record["text"]][record["emotion"]] += 1
+                offset += len(line)
+        # Отрезаем хвост, чтобы следующая запись начиналась с новой строки
+        if offset < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+
+    def _append(self, record: dict) -> int:
+        offset = self.file.tell()
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        self.file.write(line)
+        self.file.flush()  # Чтобы load_history видел запись, fsync - в flush()
+        self._unsynced += len(line)
+        self.pending += 1
+        return offset
+
+    def is_empty(self) -> bool:
+        return self.file.tell() == 0
+
+    def load_votes(self) -> Dict[str, Counter]:
+        return {text: Counter(votes) for text, votes in self.votes.items()}
+
+    def load_history(self, user_id: str, limit: int) -> List[Entry]:
+        entries = []
+        with open(self.path, "rb") as f:
+            for offset in list(self.offsets.get(user_id, []))[-limit:]:
+                f.seek(offset)
+                record = json.loads(f.readline())
+                entries.append((record["text"], record["emotion"], record["ts"]))
+        return entries
+
+    def load_stats(self, user_id: str) -> Dict[str, int]:
+        return dict(self.stats.get(user_id, {}))
+
+    def add_history(self, user_id: str, text: str, emotion: str, ts: float):
+        offset = self._append({"op": "history", "user": user_id, "text": text, "emotion": emotion, "ts": ts})
+        self.offsets[user_id].append(offset)
+        self.stats[user_id][emotion] += 1
+
+    def add_vote(self, text: str, emotion: str):
+        self._append({"op": "vote", "text": text, "emotion": emotion})
+        self.votes[text][emotion] += 1
+
+    def set_message_emotion(self, text: str, emotion: str):
+        self._append({"op": "message", "text": text, "emotion": emotion})
+
+    def export(self) -> Iterator[Tuple]:
+        self.file.flush()
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Поврежденные строки пропускаются и при запуске
+                if record["op"] == "history":
+                    yield "history", record["user"], record["text"], record["emotion"], record["ts"]
+                elif record["op"] == "vote":
+                    yield "vote", record["text"], record["emotion"], 1
+                elif record["op"] == "message":
+                    yield "message", record["text"], record["emotion"]
+
+    def flush(self) -> int:
+        written = self._unsynced
+        os.fsync(self.file.fileno())
+        self._unsynced = 0
+        self.pending = 0
+        return written
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def open_backend(kind: str, data_dir: str, history_limit: int = 100) -> StorageBackend:
+    if kind == "sqlite":
+        return SQLiteStorage(os.path.join(data_dir, "user_data.db"))
+    if kind == "journal":
+        return JournalStorage(os.path.join(data_dir, "user_data.journal"), history_limit)
+    if kind == "json":
+        return JsonStorage(os.path.join(data_dir, "user_data.json"))
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+def migrate_json(json_path: str, backend: StorageBackend):
+    # Переносит данные из старого user_data.json в новое хранилище
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for user_id, entries in data.get("user_history", {}).items():
+        for entry in entries:
+            backend.add_history(str(user_id), entry["text"], entry_emotion(entry), to_timestamp(entry["timestamp"]))
+    # emotion_stats не переносим: статистика заново считается по истории
+    for text, votes in data.get("user_votes", {}).items():
+        for emotion, count in votes.items():
+            for _ in range(count):
+                backend.add_vote(text, emotion)
+    for text, emotion in data.get("message_to_emotion", {}).items():
+        backend.set_message_emotion(text, emotion)
+    backend.flush()
+
+
+class AsyncStorage:
+    """
+    Обертка, которая выполняет операции хранилища в отдельном потоке,
+    чтобы запись на диск не блокировала event loop бота.
+    Фоновая задача сбрасывает изменения не чаще раза в flush_interval секунд
+    или сразу, как только накопилось max_pending изменений
+    """
+
+    def __init__(self, backend: StorageBackend, flush_interval: float = 5.0, max_pending: int = 100, on_flush=None):
+        self.backend = backend
+        self.on_flush = on_flush  # (длительность, байт записано) после каждого сброса, для метрик
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Один поток: операции идут строго по очереди, соединение не делится
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._dirty = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = None
+        self.writes = 0  # Изменений отправлено в хранилище, номер последнего
+        self.flushed_writes = 0  # Номер последнего изменения, которое уже сброшено на диск
+        # Метрики сброса на диск
+        self.flush_count = 0
+        self.last_flush_duration = 0.0
+        self.total_flush_duration = 0.0
+        self.bytes_written = 0
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(method, *args))
+
+    async def _mutate(self, method, *args) -> int:
+        # Возвращает номер изменения; оно на диске, когда flushed_writes его догонит
+        self.writes += 1
+        seq = self.writes
+        await self._call(method, *args)
+        self._dirty.set()
+        if self.backend.pending >= self.max_pending:
+            self._full.set()
+        return seq
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            # Копим изменения до таймаута или до заполнения пачки
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения данных: {e}")
+
+    async def flush(self):
+        self._dirty.clear()
+        self._full.clear()
+        started = time.perf_counter()
+        # Поток хранилища один, поэтому все изменения до этого номера попадут в сброс
+        target = self.writes
+        written = await self._call(self.backend.flush)
+        self.flushed_writes = target
+        duration = time.perf_counter() - started
+        self.flush_count += 1
+        self.last_flush_duration = duration
+        self.total_flush_duration += duration
+        self.bytes_written += written
+        if self.on_flush is not None:
+            self.on_flush(duration, written)
+        logger.debug(f"Storage flush: {written} bytes in {duration * 1000:.1f} ms")
+
+    async def load_votes(self) -> Dict[str, Counter]:
+        return await self._call(self.backend.load_votes)
+
+    async def load_history(self, user_id: str, limit: int) -> List[Entry]:
+        return await self._call(self.backend.load_history, user_id, limit)
+
+    async def load_stats(self, user_id: str) -> Dict[str, int]:
+        return await self._call(self.backend.load_stats, user_id)
+
+    async def add_history(self, user_id: str, text: str, emotion: str, ts: float) -> int:
+        return await self._mutate(self.backend.add_history, user_id, text, emotion, ts)
+
+    async def add_vote(self, text: str, emotion: str):
+        await self._mutate(self.backend.add_vote, text, emotion)
+
+    async def save_feed_cursor(self, shard: int, seq: int):
+        await self._mutate(self.backend.save_feed_cursor, shard, seq)
+
+    async def prune_vote_log(self, seq: int) -> int:
+        deleted = await self._call(self.backend.prune_vote_log, seq)
+        if deleted:
+            self._dirty.set()
+        return deleted
+
+    async def close(self):
+        # Останавливаем фоновую задачу и делаем финальный сброс
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        await self._call(self.backend.close)
+        self._executor.shutdown()
+
+
+if __name__ == "__main__":
+    # Ручная миграция: python bot/persistence.py sqlite|journal [путь к user_data.json]
+    import sys
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    kind = sys.argv[1] if len(sys.argv) > 1 else "sqlite"
+    json_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(data_dir, "user_data.json")
+    backend = open_backend(kind, data_dir)
+    if not backend.is_empty():
+        sys.exit(f"{kind} storage already contains data, migration skipped")
+    migrate_json(json_path, backend)
+    backend.close()
+    print(f"Migrated {json_path} to {kind} storage")
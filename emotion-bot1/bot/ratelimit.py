@@ -0,0 +1,97 @@
+# ratelimit.py - ограничение частоты запросов по алгоритму token bucket
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+
+class MemoryBucketStore:
+    """
+    Корзины в памяти процесса. Корзина, которая простояла дольше времени
+    полного пополнения, ничем не отличается от новой, поэтому удаляется.
+    max_users - жесткий предел на случай всплеска новых пользователей
+    """
+
+    def __init__(self, max_users: int = 1_000_000):
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # user -> (токены, время)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def take(self, key: str, capacity: float, rate: float, now: float) -> Tuple[bool, float]:
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)  # В конец: самые давние обращения остаются в начале
+        self._evict(capacity / rate, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _evict(self, idle_ttl: float, now: float):
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < idle_ttl and len(self._buckets) <= self.max_users:
+                break
+            del self._buckets[key]
+
+
+# Атомарное обновление корзины в Redis: KEYS[1] - ключ, ARGV - емкость, скорость, время
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """
+    Корзины в общем Redis (или совместимом сервере), чтобы лимит действовал
+    на все процессы бота. Ключ живет до полного пополнения корзины
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.redis.register_script(TOKEN_BUCKET_LUA)
+
+    async def take(self, key: str, capacity: float, rate: float, now: float) -> Tuple[bool, float]:
+        allowed, tokens = await self._script(keys=[self.prefix + key], args=[capacity, rate, now])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+class RateLimiter:
+    """
+    Token bucket: в корзине до burst токенов, один токен восстанавливается
+    за interval секунд, каждый запрос тратит токен
+    """
+
+    def __init__(self, store, burst: int = 1, interval: float = 10.0):
+        self.store = store
+        self.capacity = float(burst)
+        self.rate = 1.0 / interval
+
+    async def acquire(self, user_id) -> Tuple[bool, float]:
+        # (разрешен ли запрос, через сколько секунд появится токен)
+        return await self.store.take(str(user_id), self.capacity, self.rate, time.time())
+
+    async def close(self):
+        if hasattr(self.store, "close"):
+            await self.store.close()
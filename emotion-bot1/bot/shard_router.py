@@ -0,0 +1,184 @@
+# shard_router.py - запуск шардов бота и маршрутизация обновлений Telegram по user_id
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+from typing import List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from sharding import shard_of
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Объекты обновления, в которых есть поле from - автор действия
+USER_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "my_chat_member", "chat_member", "chat_join_request",
+)
+
+
+def update_user_id(update: dict) -> Optional[int]:
+    for field in USER_FIELDS:
+        user = update.get(field, {}).get("from")
+        if user:
+            return user["id"]
+    return None  # Обновления без пользователя (например, poll) идут в шард 0
+
+
+class ShardRouter:
+    """
+    Принимает webhook Telegram и пересылает обновление шарду, который
+    ведет данные пользователя. Ответ шарда возвращается Telegram как есть:
+    503 от перегруженного или недоступного шарда - сигнал повторить доставку
+    """
+
+    def __init__(self, worker_urls: List[str], path: str = "/webhook", secret_token: str = None):
+        self.worker_urls = worker_urls
+        self.path = path
+        self.secret_token = secret_token
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.router.add_get("/ready", self.ready)
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def _start(self, app: web.Application):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+
+    async def _stop(self, app: web.Application):
+        await self.session.close()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and request.headers.get(SECRET_HEADER) != self.secret_token:
+            return web.Response(status=401, text="Unauthorized")
+        body = await request.read()
+        try:
+            user_id = update_user_id(json.loads(body))
+        except (ValueError, AttributeError):
+            return web.Response(status=400, text="Bad update")
+        shard = shard_of(user_id if user_id is not None else 0, len(self.worker_urls))
+        headers = {"Content-Type": "application/json"}
+        if self.secret_token:
+            headers[SECRET_HEADER] = self.secret_token
+        try:
+            async with self.session.post(self.worker_urls[shard] + self.path, data=body, headers=headers) as response:
+                return web.Response(status=response.status, body=await response.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Shard {shard} unavailable: {e}")
+            return web.Response(status=503, text=f"Shard {shard} unavailable")
+
+    async def ready(self, request: web.Request) -> web.Response:
+        # Готов, когда отвечают все шарды
+        status = {}
+        for shard, url in enumerate(self.worker_urls):
+            try:
+                async with self.session.get(url + "/metrics") as response:
+                    status[shard] = response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status[shard] = False
+        return web.json_response({"ready": all(status.values()), "shards": status}, status=200 if all(status.values()) else 503)
+
+
+class ShardSupervisor:
+    """Процессы bot.py по одному на шард; упавший процесс перезапускается"""
+
+    def __init__(self, shards: int, base_port: int, env: dict = None):
+        self.shards = shards
+        self.base_port = base_port
+        self.env = dict(env if env is not None else os.environ)
+        self.processes: List[Optional[subprocess.Popen]] = [None] * shards
+
+    def worker_urls(self) -> List[str]:
+        return [f"http://127.0.0.1:{self.base_port + shard}" for shard in range(self.shards)]
+
+    def _spawn(self, shard: int) -> subprocess.Popen:
+        env = dict(self.env)
+        env.update({
+            "BOT_MODE": "webhook",
+            "BOT_SHARDS": str(self.shards),
+            "BOT_SHARD_ID": str(shard),
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(self.base_port + shard),
+            "WEBHOOK_BASE_URL": "",  # Webhook в Telegram регистрирует только маршрутизатор
+        })
+        return subprocess.Popen([sys.executable, BOT_SCRIPT], env=env)
+
+    def start(self):
+        for shard in range(self.shards):
+            self.processes[shard] = self._spawn(shard)
+        logger.info(f"Started {self.shards} bot shards on ports {self.base_port}-{self.base_port + self.shards - 1}")
+
+    async def watch(self, interval: float = 1.0):
+        while True:
+            await asyncio.sleep(interval)
+            for shard, process in enumerate(self.processes):
+                if process.poll() is not None:
+                    logger.error(f"Shard {shard} exited with code {process.returncode}, restarting")
+                    self.processes[shard] = self._spawn(shard)
+
+    def stop(self, timeout: float = 10.0):
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()  # SIGTERM: шард закрывает хранилище и сбрасывает данные
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def register_webhook(base_url: str, path: str, secret_token: str = None):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    api_url = os.getenv("TELEGRAM_API_URL")
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    bot = Bot(token=os.getenv("BOT_TOKEN", "You_token_bot"), session=session)
+    try:
+        await bot.set_webhook(base_url.rstrip("/") + path, secret_token=secret_token, drop_pending_updates=False)
+        logger.info(f"Webhook set to {base_url.rstrip('/') + path}")
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    # BOT_SHARDS=4 WEBHOOK_BASE_URL=https://example.com python bot/shard_router.py
+    shards = int(os.getenv("BOT_SHARDS", str(os.cpu_count() or 1)))
+    host = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    port = int(os.getenv("WEBHOOK_PORT", "8080"))
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    secret_token = os.getenv("WEBHOOK_SECRET") or None
+    base_url = os.getenv("WEBHOOK_BASE_URL", "")
+
+    supervisor = ShardSupervisor(shards, int(os.getenv("SHARD_BASE_PORT", str(port + 1))))
+    router = ShardRouter(supervisor.worker_urls(), path, secret_token)
+    app = router.app()
+    tasks = []
+
+    async def on_startup(app: web.Application):
+        supervisor.start()
+        tasks.append(asyncio.create_task(supervisor.watch()))
+        if base_url:
+            await register_webhook(base_url, path, secret_token)
+
+    async def on_shutdown(app: web.Application):
+        for task in tasks:
+            task.cancel()
+        await asyncio.to_thread(supervisor.stop)
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(app, host=host, port=port)
@@ -0,0 +1,200 @@
+# sharding.py - разделение данных бота по шардам: номер шарда пользователя, чтение голосов соседей, перешардирование
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import zlib
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from persistence import open_backend
+
+FLUSH_EVERY = 10000  # При перешардировании сбрасываем изменения на диск через столько операций
+
+
+def shard_of(key, shards: int) -> int:
+    # Стабильный хэш: hash() в Python меняется между запусками, crc32 - нет
+    return zlib.crc32(str(key).encode("utf-8")) % shards
+
+def shard_dir(data_dir: str, shard: int, shards: int) -> str:
+    # Один шард - прежняя раскладка без подпапок
+    return data_dir if shards == 1 else os.path.join(data_dir, f"shard-{shard}")
+
+
+class VoteFeed:
+    """
+    Голоса чужого шарда только на чтение. Первый read() возвращает все голоса
+    шарда, следующие - только новые: для SQLite по номеру в vote_log,
+    для журнала по смещению в файле. Пишет в шард только его процесс,
+    поэтому соседи видят голоса после очередного сброса на диск
+    """
+
+    def __init__(self, kind: str, directory: str):
+        if kind == "sqlite":
+            self.path = os.path.join(directory, "user_data.db")
+        elif kind == "journal":
+            self.path = os.path.join(directory, "user_data.journal")
+        else:
+            raise ValueError(f"Storage backend {kind} does not support sharding, use sqlite or journal")
+        self.kind = kind
+        self.cursor: Optional[int] = None
+        self._db = None
+
+    def read(self) -> List[Tuple[str, str, int]]:
+        # [(текст, эмоция, голосов), ...]
+        if not os.path.exists(self.path):
+            return []  # Шард еще не создан
+        return self._read_sqlite() if self.kind == "sqlite" else self._read_journal()
+
+    def _read_sqlite(self) -> List[Tuple[str, str, int]]:
+        if self._db is None:
+            self._db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, isolation_level=None, check_same_thread=False)
+        # Голоса и номер последней записи журнала читаются из одного снимка базы
+        self._db.execute("BEGIN")
+        try:
+            if self.cursor is None:
+                rows = self._db.execute("SELECT text, emotion, count FROM votes").fetchall()
+                self.cursor = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM vote_log").fetchone()[0]
+                return rows
+            log = self._db.execute(
+                "SELECT seq, text, emotion FROM vote_log WHERE seq > ? ORDER BY seq", (self.cursor,)
+            ).fetchall()
+        finally:
+            self._db.execute("COMMIT")
+        if log:
+            self.cursor = log[-1][0]
+        return [(text, emotion, 1) for _, text, emotion in log]
+
+    def consumed(self, shard: int) -> Optional[int]:
+        """
+        До какого номера владелец этого шарда прочитал vote_log шарда shard
+        (сохраненный и уже сброшенный на диск курсор). None - курсора еще нет
+        или хранилище не SQLite: тогда журнал шарда shard чистить нельзя
+        """
+        if self.kind != "sqlite" or not os.path.exists(self.path):
+            return None
+        if self._db is None:
+            self._db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, isolation_level=None, check_same_thread=False)
+        try:
+            row = self._db.execute("SELECT seq FROM feed_cursors WHERE shard = ?", (shard,)).fetchone()
+        except sqlite3.OperationalError:
+            return None  # Шард еще не обновлен до версии с feed_cursors
+        return row[0] if row else None
+
+    def _read_journal(self) -> List[Tuple[str, str, int]]:
+        votes = Counter()
+        offset = self.cursor or 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Строка еще дописывается - прочитаем в следующий раз
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record["op"] == "vote":
+                    votes[(record["text"], record["emotion"])] += 1
+        self.cursor = offset
+        return [(text, emotion, count) for (text, emotion), count in votes.items()]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _summary(backends) -> dict:
+    # Пользователей, записей истории и голосов в каждом шарде
+    report = {"users": [], "history": [], "votes": []}
+    for backend in backends:
+        users, history, votes = set(), 0, 0
+        for op in backend.export():
+            if op[0] == "history":
+                users.add(op[1])
+                history += 1
+            elif op[0] == "vote":
+                votes += op[3]
+        report["users"].append(len(users))
+        report["history"].append(history)
+        report["votes"].append(votes)
+    return report
+
+def rebalance(kind: str, data_dir: str, old_shards: int, new_shards: int, out_dir: str) -> dict:
+    """
+    Переносит данные из old_shards шардов в data_dir в new_shards шардов в out_dir:
+    история - в шард пользователя, голоса и подтвержденные эмоции - в шард по
+    хэшу текста (глобальные голоса - сумма по шардам, место хранения не важно).
+    Исходные данные не меняются; бот на время переноса должен быть остановлен
+    """
+    sources = [open_backend(kind, shard_dir(data_dir, i, old_shards)) for i in range(old_shards)]
+    targets = []
+    for i in range(new_shards):
+        os.makedirs(shard_dir(out_dir, i, new_shards), exist_ok=True)
+        targets.append(open_backend(kind, shard_dir(out_dir, i, new_shards)))
+    try:
+        if not all(target.is_empty() for target in targets):
+            raise ValueError(f"{out_dir} already contains data")
+        operations = 0
+        for source in sources:
+            for op in source.export():
+                if op[0] == "history":
+                    _, user_id, text, emotion, ts = op
+                    targets[shard_of(user_id, new_shards)].add_history(user_id, text, emotion, ts)
+                elif op[0] == "vote":
+                    _, text, emotion, count = op
+                    for _ in range(count):
+                        targets[shard_of(text, new_shards)].add_vote(text, emotion)
+                else:
+                    _, text, emotion = op
+                    targets[shard_of(text, new_shards)].set_message_emotion(text, emotion)
+                operations += 1
+                if operations % FLUSH_EVERY == 0:
+                    for target in targets:
+                        target.flush()
+        for target in targets:
+            # Новые шарды стартуют со снимка таблицы votes, так что журнал голосов переноса не нужен
+            target.prune_vote_log(sys.maxsize)
+            target.flush()
+        before, after = _summary(sources), _summary(targets)
+    finally:
+        for backend in sources + targets:
+            backend.close()
+
+    # file_id стикеров одинаковы для всех шардов - копируем, чтобы не загружать GIF заново
+    file_ids = os.path.join(shard_dir(data_dir, 0, old_shards), "file_ids.json")
+    if os.path.exists(file_ids):
+        for i in range(new_shards):
+            shutil.copy(file_ids, shard_dir(out_dir, i, new_shards))
+
+    for field in ("users", "history", "votes"):
+        if sum(before[field]) != sum(after[field]):
+            raise RuntimeError(f"Rebalance lost data: {field} {sum(before[field])} -> {sum(after[field])}")
+    return {"operations": operations, "before": before, "after": after}
+
+
+if __name__ == "__main__":
+    # python bot/sharding.py rebalance --from 1 --to 4 --out bot/data-4
+    # python bot/sharding.py locate 123456789 --shards 4
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Bot state sharding tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    move = commands.add_parser("rebalance", help="Перенести данные на другое число шардов")
+    move.add_argument("--storage", default=os.getenv("STORAGE_BACKEND", "sqlite"), choices=["sqlite", "journal", "json"])
+    move.add_argument("--data-dir", default=os.getenv("BOT_DATA_DIR", os.path.join(base_dir, "data")))
+    move.add_argument("--from", dest="old_shards", type=int, default=int(os.getenv("BOT_SHARDS", "1")))
+    move.add_argument("--to", dest="new_shards", type=int, required=True)
+    move.add_argument("--out", required=True, help="Новая папка данных, затем BOT_DATA_DIR=<out> BOT_SHARDS=<to>")
+    locate = commands.add_parser("locate", help="Номер шарда пользователя")
+    locate.add_argument("user_id")
+    locate.add_argument("--shards", type=int, default=int(os.getenv("BOT_SHARDS", "1")))
+    args = parser.parse_args()
+
+    if args.command == "rebalance":
+        report = rebalance(args.storage, args.data_dir, args.old_shards, args.new_shards, args.out)
+        print(json.dumps(report, indent=2))
+    else:
+        print(shard_of(args.user_id, args.shards))
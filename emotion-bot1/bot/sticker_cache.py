@@ -0,0 +1,91 @@
+# sticker_cache.py - кэш GIF-стикеров и повторное использование file_id Telegram
+import json
+import logging
+import os
+from typing import Dict
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+
+logger = logging.getLogger(__name__)
+
+
+class StickerCache:
+    """
+    Держит в памяти байты стикеров, которые еще ни разу не отправлялись.
+    После первой загрузки Telegram возвращает file_id, дальше стикер
+    отправляется по нему без повторной загрузки, а байты выгружаются из памяти.
+    Соответствие стикеров и file_id сохраняется в файл между перезапусками
+    """
+
+    def __init__(self, paths: Dict[str, Dict[str, str]], file_ids_path: str):
+        self.file_ids_path = file_ids_path
+        # Наличие файлов проверяем один раз, а не на каждое сообщение
+        self.paths = {
+            (emotion, lang): path
+            for emotion, by_lang in paths.items()
+            for lang, path in by_lang.items()
+            if os.path.exists(path)
+        }
+        self.file_ids: Dict[str, str] = {}
+        self._data: Dict[tuple, bytes] = {}
+        if os.path.exists(file_ids_path):
+            try:
+                with open(file_ids_path, "r", encoding="utf-8") as f:
+                    self.file_ids = json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки file_id стикеров: {e}")
+
+    @staticmethod
+    def _key(emotion: str, lang: str) -> str:
+        return f"{emotion}:{lang}"
+
+    def has(self, emotion: str, lang: str) -> bool:
+        return (emotion, lang) in self.paths
+
+    def preload(self):
+        # Читаем с диска только стикеры, для которых еще нет file_id
+        for (emotion, lang), path in self.paths.items():
+            if self._key(emotion, lang) not in self.file_ids:
+                with open(path, "rb") as f:
+                    self._data[(emotion, lang)] = f.read()
+
+    def _read(self, emotion: str, lang: str) -> bytes:
+        data = self._data.get((emotion, lang))
+        if data is None:
+            with open(self.paths[(emotion, lang)], "rb") as f:
+                data = self._data[(emotion, lang)] = f.read()
+        return data
+
+    async def send(self, send_animation, emotion: str, lang: str, **kwargs):
+        """
+        Отправляет стикер через send_animation (например, message.answer_animation).
+        Возвращает отправленное сообщение
+        """
+        key = self._key(emotion, lang)
+        file_id = self.file_ids.get(key)
+        if file_id:
+            try:
+                return await send_animation(file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # file_id мог устареть или принадлежать другому боту - загружаем заново
+                logger.warning(f"file_id для {key} не принят: {e}")
+                del self.file_ids[key]
+
+        sent = await send_animation(BufferedInputFile(self._read(emotion, lang), "sticker.gif"), **kwargs)
+        media = sent.animation or sent.document
+        if media is not None:
+            self.file_ids[key] = media.file_id
+            self._data.pop((emotion, lang), None)  # Байты больше не нужны
+            self._save()
+        return sent
+
+    def _save(self):
+        # Атомарная запись: при сбое остается предыдущая версия файла
+        tmp_path = self.file_ids_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.file_ids, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.file_ids_path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения file_id стикеров: {e}")
@@ -0,0 +1,105 @@
+# votes.py - индекс голосов пользователей за эмоции
+import os
+import re
+import unicodedata
+from typing import Dict, Iterator, Optional, Tuple
+
+from interning import emotion_codes
+
+
+def normalize_vote_text(text: str) -> str:
+    """
+    Ключ для голосования: регистр, пробелы, пунктуация и эмодзи не важны,
+    так что "лошадь съела моего друга(" и "Лошадь съела  моего друга" - один ключ.
+    Если после очистки ничего не осталось (сообщение из одних эмодзи
+    или скобок), ключом остается сам текст без лишних пробелов
+    """
+    text = unicodedata.normalize("NFKC", text).lower().replace("ё", "е")
+    collapsed = re.sub(r"\s+", " ", text).strip()
+    # P* - пунктуация, S* - символы и эмодзи, Mn/Cf - модификаторы эмодзи
+    stripped = "".join(
+        ch if unicodedata.category(ch)[0] not in "PS" and unicodedata.category(ch) not in ("Mn", "Cf") else " "
+        for ch in collapsed
+    )
+    stripped = re.sub(r"\s+", " ", stripped).strip()
+    return stripped or collapsed
+
+
+class VoteIndex:
+    """
+    Голоса по нормализованному тексту. Для каждого ключа хранится текущий
+    лидер и его число голосов, они обновляются при каждом голосе,
+    поэтому поиск не пересчитывает max() по всем эмоциям.
+    Эмоции хранятся кодами emotion_codes, а не строками из callback_data
+    """
+
+    def __init__(self):
+        # ключ -> [код лидера, голосов у лидера, {код эмоции: голосов}]
+        self._entries: Dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, text: str, emotion: str, count: int = 1) -> Tuple[str, int, int]:
+        """Добавляет голоса и возвращает (лидер, голосов у лидера, голосов за emotion)"""
+        key = normalize_vote_text(text)
+        code = emotion_codes.code(emotion)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [code, 0, {}]
+        counts = entry[2]
+        counts[code] = counts.get(code, 0) + count
+        if counts[code] > entry[1] or code == entry[0]:
+            entry[0], entry[1] = code, counts[code]
+        return emotion_codes.name(entry[0]), entry[1], counts[code]
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, int]]]:
+        # (ключ, {эмоция: голосов}) для всех текстов
+        for key, (_, _, counts) in self._entries.items():
+            yield key, {emotion_codes.name(code): count for code, count in counts.items()}
+
+    def lookup(self, text: str) -> Optional[Tuple[str, int]]:
+        # (эмоция-лидер, число голосов) или None, если за текст еще не голосовали
+        entry = self._entries.get(normalize_vote_text(text))
+        if entry is None:
+            return None
+        return emotion_codes.name(entry[0]), entry[1]
+
+    @classmethod
+    def from_counts(cls, votes: Dict[str, Dict[str, int]]) -> "VoteIndex":
+        index = cls()
+        for text, counts in votes.items():
+            for emotion, count in counts.items():
+                index.add(text, emotion, count)
+        return index
+
+    def save(self, path: str):
+        """
+        Компактный снимок: первая строка - список эмоций, дальше по строке
+        на ключ: ключ, номер лидера, голосов у лидера, пары номер:голосов
+        """
+        # Номера в файле - коды emotion_codes, заголовок переводит их в названия
+        lines = []
+        for key, (leader, leader_count, counts) in self._entries.items():
+            pairs = ",".join(f"{code}:{c}" for code, c in counts.items())
+            lines.append(f"{key}\t{leader}\t{leader_count}\t{pairs}")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\t".join(emotion_codes.names) + "\n")
+            f.write("\n".join(lines))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VoteIndex":
+        index = cls()
+        with open(path, "r", encoding="utf-8") as f:
+            # Коды в файле могут отличаться от текущих - переводим через названия
+            codes = [emotion_codes.code(name) for name in f.readline().rstrip("\n").split("\t")]
+            for line in f:
+                key, leader, leader_count, pairs = line.rstrip("\n").split("\t")
+                counts = {}
+                for pair in pairs.split(","):
+                    number, count = pair.split(":")
+                    counts[codes[int(number)]] = int(count)
+                index._entries[key] = [codes[int(leader)], int(leader_count), counts]
+        return index
@@ -0,0 +1,73 @@
+# webhook.py - прием обновлений Telegram через webhook на aiohttp
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from metrics import metrics_handler
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Отвечает Telegram сразу и обрабатывает обновление в фоне, но одновременно
+    выполняется не больше max_concurrency обработчиков. Если в очереди уже
+    max_pending обновлений, отвечаем 503 - Telegram повторит доставку позже
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int = 64, max_pending: int = 1000, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_pending = max_pending
+
+    async def _background_feed_update(self, bot: Bot, update: dict) -> None:
+        async with self._semaphore:
+            await super()._background_feed_update(bot, update)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if len(self._background_feed_update_tasks) >= self.max_pending:
+            return web.Response(status=503, text="Too many pending updates")
+        return await super().handle(request)
+
+
+def build_webhook_app(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    path: str = "/webhook",
+    secret_token: str = None,
+    max_concurrency: int = 64,
+    max_pending: int = 1000,
+) -> web.Application:
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher, bot, max_concurrency=max_concurrency, max_pending=max_pending, secret_token=secret_token
+    )
+    handler.register(app, path=path)
+    app.router.add_get("/metrics", metrics_handler)
+    # Запуск и остановка приложения вызывают startup/shutdown диспетчера
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+def run_webhook(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    base_url: str,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    path: str = "/webhook",
+    secret_token: str = None,
+    max_concurrency: int = 64,
+    max_pending: int = 1000,
+):
+    async def register_webhook():
+        # Каждая реплика регистрирует один и тот же адрес балансировщика
+        await bot.set_webhook(base_url.rstrip("/") + path, secret_token=secret_token, drop_pending_updates=False)
+        logger.info(f"Webhook set to {base_url.rstrip('/') + path}")
+
+    if base_url:  # Без внешнего адреса (шард за shard_router.py) webhook не регистрируется
+        dispatcher.startup.register(register_webhook)
+    app = build_webhook_app(dispatcher, bot, path, secret_token, max_concurrency, max_pending)
+    web.run_app(app, host=host, port=port)
@@ -0,0 +1,66 @@
+# language.py - определение языка текста по преобладающему алфавиту
+from typing import NamedTuple
+
+# Буквы считаются в байтах UTF-8 методами bytes на C, без цикла по символам в Python:
+# кириллица U+0400-U+047F (а-я, ё и буквы соседних алфавитов) начинается с байта
+# 0xD0 или 0xD1, которые не встречаются внутри других символов, латиница - это ASCII-байты.
+# Один проход translate оставляет только латиницу и ведущие байты кириллицы (0xD1 -> 0xD0)
+_LATIN_BYTES = frozenset(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+_LEAD_TO_D0 = bytes(0xD0 if b == 0xD1 else b for b in range(256))
+_NOT_LETTER = bytes(b for b in range(256) if b not in _LATIN_BYTES and b not in (0xD0, 0xD1))
+# Готовые маршруты для коротких текстов по паре (кириллица, латиница): кортеж не создается
+# на каждый вызов. Размер ограничен: кэшируются только тексты меньше чем из _CACHED_LETTERS букв
+_CACHED_LETTERS = 256
+_routes = {}
+# Доля второго алфавита, начиная с которой текст считается смешанным
+MIXED_THRESHOLD = 0.2
+
+
+class LanguageRoute(NamedTuple):
+    lang: str  # "ru" или "en"
+    confidence: float  # Доля букв выбранного алфавита (0-1), 0 - букв нет
+    cyrillic: int  # Букв кириллицы
+    latin: int  # Букв латиницы; для ASCII-текста - его длина
+
+    @property
+    def mixed(self) -> bool:
+        letters = self.cyrillic + self.latin
+        return letters > 0 and min(self.cyrillic, self.latin) / letters >= MIXED_THRESHOLD
+
+    def share(self, lang: str) -> float:
+        letters = self.cyrillic + self.latin
+        if not letters:
+            return 0.0
+        return (self.cyrillic if lang == "ru" else self.latin) / letters
+
+
+def _new_route(cyrillic: int, latin: int) -> LanguageRoute:
+    letters = cyrillic + latin
+    if not letters:
+        route = LanguageRoute("en", 0.0, 0, 0)
+    elif cyrillic >= latin:
+        route = LanguageRoute("ru", cyrillic / letters, cyrillic, latin)
+    else:
+        route = LanguageRoute("en", latin / letters, cyrillic, latin)
+    if letters < _CACHED_LETTERS:
+        _routes[cyrillic << 16 | latin] = route
+    return route
+
+def route_language(text: str) -> LanguageRoute:
+    if text.isascii():
+        # Кириллицы нет - английский без кодирования и подсчета: в latin идет длина текста,
+        # на язык и доли алфавитов это не влияет
+        cyrillic, latin = 0, len(text)
+    else:
+        try:
+            data = text.encode()
+        except UnicodeEncodeError:
+            # Одиночные суррогаты из JSON не должны ронять определение языка
+            data = text.encode("utf-8", "surrogatepass")
+        letters = data.translate(_LEAD_TO_D0, _NOT_LETTER)
+        cyrillic = letters.count(b"\xd0")
+        latin = len(letters) - cyrillic
+    return _routes.get(cyrillic << 16 | latin) or _new_route(cyrillic, latin)
+
+def detect_language(text: str) -> str:
+    return route_language(text).lang
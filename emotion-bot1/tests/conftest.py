@@ -0,0 +1,8 @@
+# conftest.py - модули бота и API импортируются так же, как при запуске скриптов (python bot/bot.py)
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (BASE_DIR, os.path.join(BASE_DIR, "bot"), os.path.join(BASE_DIR, "api")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from batching import MicroBatcher
+
+
+class FakeModel:
+    # Запоминает батчи и отвечает текстом в верхнем регистре
+    def __init__(self, error: Exception = None):
+        self.batches = []
+        self.error = error
+
+    async def __call__(self, lang, texts):
+        self.batches.append((lang, list(texts)))
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return [text.upper() for text in texts]
+
+
+def test_full_batch_flushes_without_waiting():
+    model = FakeModel()
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_batch_size=3, max_wait=10)
+        return await asyncio.wait_for(batcher.submit_many("ru", ["a", "b", "c"]), timeout=1)
+
+    assert asyncio.run(scenario()) == ["A", "B", "C"]
+    assert model.batches == [("ru", ["a", "b", "c"])]
+
+
+def test_partial_batch_flushes_on_timer():
+    model = FakeModel()
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_batch_size=16, max_wait=0.01)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await batcher.submit_many("en", ["a", "b"])
+        return results, loop.time() - started
+
+    results, waited = asyncio.run(scenario())
+    assert results == ["A", "B"]
+    assert model.batches == [("en", ["a", "b"])]
+    assert 0.005 <= waited < 1
+
+
+def test_callers_get_own_results_when_batches_mix():
+    model = FakeModel()
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait=0.01)
+        return await asyncio.gather(
+            batcher.submit_many("ru", ["a1", "a2", "a3"]),
+            batcher.submit_many("ru", ["b1", "b2", "b3"]),
+            batcher.submit_many("en", ["c1"]),
+        )
+
+    first, second, third = asyncio.run(scenario())
+    assert first == ["A1", "A2", "A3"]
+    assert second == ["B1", "B2", "B3"]
+    assert third == ["C1"]
+    ru_batches = [texts for lang, texts in model.batches if lang == "ru"]
+    assert any({text[0] for text in texts} == {"a", "b"} for texts in ru_batches)  # Батч из двух запросов
+    assert all(len(texts) <= 4 for _, texts in model.batches)
+    assert [texts for lang, texts in model.batches if lang == "en"] == [["c1"]]
+
+
+def test_batch_error_reaches_every_waiting_caller():
+    model = FakeModel(error=RuntimeError("model failed"))
+
+    async def scenario():
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait=0.01)
+        return await asyncio.gather(
+            batcher.submit_many("ru", ["a1", "a2"]),
+            batcher.submit("ru", "b1"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert len(model.batches) == 1
+    for result in results:
+        assert isinstance(result, RuntimeError) and str(result) == "model failed"
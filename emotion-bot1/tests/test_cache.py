@@ -0,0 +1,49 @@
+import asyncio
+
+from cache import PredictionCache, cache_key
+
+SCORES = [{"label": "joy", "score": 0.9}]
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(max_size=2)
+    cache.put("m", "a", SCORES)
+    cache.put("m", "b", SCORES)
+    assert cache.get("m", "a") == SCORES  # "a" становится недавним
+    cache.put("m", "c", SCORES)
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == SCORES and cache.get("m", "c") == SCORES
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cache.time.time", lambda: now[0])
+    cache = PredictionCache(ttl=60)
+    cache.put("m", "a", SCORES)
+    now[0] += 59
+    assert cache.get("m", "a") == SCORES
+    now[0] += 2
+    assert cache.get("m", "a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_key_ignores_whitespace_but_not_case_or_model():
+    assert cache_key("m", "  привет\n мир ") == cache_key("m", "привет мир")
+    assert cache_key("m", "Привет") != cache_key("m", "привет")
+    assert cache_key("ru", "привет") != cache_key("en", "привет")
+
+
+def test_disk_tier_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = PredictionCache(disk_path=path, write_batch=100, write_interval=3600)
+    cache.put("m", "a", SCORES)
+    assert cache.stats()["pending_writes"] == 1  # Коммит пачкой, не на каждую запись
+    cache.close()
+
+    cache = PredictionCache(disk_path=path)
+    try:
+        assert asyncio.run(cache.get_many("m", ["a", "b"])) == [SCORES, None]
+        assert cache.disk_hits == 1 and cache.misses == 1
+    finally:
+        cache.close()
@@ -0,0 +1,36 @@
+import pytest
+
+from chunking import pool_scores, split_text
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("привет", max_chars=10) == ["привет"]
+
+
+def test_splits_on_sentences_and_merges_neighbours():
+    text = "Первое. Второе! Третье предложение?"
+    assert split_text(text, max_chars=16) == ["Первое. Второе!", "Третье", "предложение?"]
+    assert split_text(text, max_chars=20) == ["Первое. Второе!", "Третье предложение?"]
+
+
+@pytest.mark.parametrize("text", [
+    "слово " * 300,
+    "a" * 2500,
+    "Раз. Два.\n\nТри " + "очень длинное предложение " * 80,
+])
+def test_chunks_respect_limit_and_keep_words(text):
+    chunks = split_text(text, max_chars=100)
+    assert all(0 < len(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "") == "".join(text.split())
+
+
+def test_pool_scores_weights_by_chunk_length():
+    chunks = ["a" * 30, "b" * 10]
+    results = [
+        [{"label": "joy", "score": 1.0}, {"label": "sadness", "score": 0.0}],
+        [{"label": "joy", "score": 0.0}, {"label": "sadness", "score": 1.0}],
+    ]
+    pooled = pool_scores(results, chunks)
+    assert [item["label"] for item in pooled] == ["joy", "sadness"]
+    assert pooled[0]["score"] == pytest.approx(0.75)
+    assert pooled[1]["score"] == pytest.approx(0.25)
@@ -0,0 +1,57 @@
+import pytest
+
+from circuit import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("circuit.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_error_rate(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5, cooldown=30)
+    for ok in (True, False, True):
+        breaker.record(ok, 0.1)
+    assert breaker.state == CircuitBreaker.CLOSED  # Меньше min_calls вызовов
+    breaker.record(False, 0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_slow_calls_count_as_errors(clock):
+    breaker = CircuitBreaker(min_calls=2, error_rate=1.0, slow_call=2.0)
+    breaker.record(True, 2.5)
+    breaker.record(True, 3.0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_probe_closes_on_success(clock):
+    breaker = CircuitBreaker(min_calls=1, error_rate=1.0, cooldown=30)
+    breaker.record(False, 0.1)
+    clock[0] += 30
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # Пока идет пробный запрос, остальные не пропускаются
+    breaker.record(True, 0.1)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(min_calls=1, error_rate=1.0, cooldown=30)
+    breaker.record(False, 0.1)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 29
+    assert not breaker.allow()
+
+
+def test_lost_probe_is_retried_after_cooldown(clock):
+    breaker = CircuitBreaker(min_calls=1, error_rate=1.0, cooldown=30)
+    breaker.record(False, 0.1)
+    clock[0] += 30
+    assert breaker.allow()  # Пробный запрос отменен и не записан
+    clock[0] += 30
+    assert breaker.allow()
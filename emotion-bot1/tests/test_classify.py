@@ -0,0 +1,24 @@
+import json
+
+from classify import read_records
+
+
+def test_read_jsonl_skips_lines_without_string_text(tmp_path, capsys):
+    path = tmp_path / "input.jsonl"
+    lines = [
+        json.dumps({"text": "привет", "id": 1}),
+        json.dumps({"text": 42, "id": 2}),
+        json.dumps({"text": ["a", "b"], "id": 3}),
+        json.dumps({"text": {"nested": "x"}, "id": 4}),
+        "42",
+        "null",
+        "{broken",
+        json.dumps("просто строка"),
+        json.dumps({"id": 5}),
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    records = list(read_records(str(path), "text", "id"))
+    assert records == [(0, {"id": 1}, "привет"), (1, {}, "просто строка"), (2, {"id": 5}, "")]
+    warnings = capsys.readouterr().err.splitlines()
+    assert len(warnings) == 6
+    assert "skipped int in field text" in warnings[0]
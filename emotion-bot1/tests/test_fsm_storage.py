@@ -0,0 +1,46 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteFSMStorage
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+def rows(storage: SQLiteFSMStorage) -> int:
+    return storage.db.execute("SELECT COUNT(*) FROM fsm").fetchone()[0]
+
+
+def test_state_and_data_survive_reopen(tmp_path):
+    path = str(tmp_path / "fsm.db")
+
+    async def scenario():
+        storage = SQLiteFSMStorage(path)
+        await storage.set_state(KEY, "FeedbackStates:waiting")
+        await storage.set_data(KEY, {"text": "привет"})
+        await storage.close()
+        storage = SQLiteFSMStorage(path)
+        try:
+            return await storage.get_state(KEY), await storage.get_data(KEY)
+        finally:
+            await storage.close()
+
+    assert asyncio.run(scenario()) == ("FeedbackStates:waiting", {"text": "привет"})
+
+
+def test_cleared_key_deletes_row(tmp_path):
+    async def scenario():
+        storage = SQLiteFSMStorage(str(tmp_path / "fsm.db"))
+        try:
+            await storage.set_state(KEY, "FeedbackStates:waiting")
+            await storage.set_data(KEY, {"text": "привет"})
+            await storage.set_state(KEY, None)
+            assert rows(storage) == 1  # Данные еще есть
+            await storage.set_data(KEY, {})
+            assert rows(storage) == 0
+            assert await storage.get_state(KEY) is None
+            assert await storage.get_data(KEY) == {}
+        finally:
+            await storage.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+from history import HistoryCache, UserHistory
+from interning import text_pool
+
+
+def make_history(text: str = "привет") -> UserHistory:
+    history = UserHistory(limit=5)
+    history.append(text, "joy", 1_700_000_000)
+    return history
+
+
+def test_ring_buffer_keeps_last_entries_and_all_time_counts():
+    history = UserHistory(limit=3)
+    for i in range(5):
+        history.append(f"текст {i}", "joy" if i % 2 else "sadness", 1_700_000_000 + i)
+    assert len(history) == 3
+    assert [text for text, _, _ in history.last(10)] == ["текст 4", "текст 3", "текст 2"]
+    assert history.last(1) == [("текст 4", "sadness", 1_700_000_004.0)]
+    assert history.counts == {"sadness": 3, "joy": 2} and history.total == 5
+
+
+def test_restore_keeps_stats_beyond_buffer():
+    entries = [("a", "joy", 1.0), ("b", "anger", 2.0)]
+    history = UserHistory.restore(entries, {"joy": 10, "anger": 4}, limit=5)
+    assert history.last(5) == [("b", "anger", 2.0), ("a", "joy", 1.0)]
+    assert history.counts == {"joy": 10, "anger": 4}
+
+
+def test_overwritten_and_unloaded_texts_leave_the_pool():
+    before = len(text_pool)
+    history = UserHistory(limit=1)
+    history.append("уникальный текст 1", "joy", 1)
+    history.append("уникальный текст 2", "joy", 2)
+    assert len(text_pool) == before + 1
+    del history
+    assert len(text_pool) == before
+
+
+def test_cache_evicts_least_recently_used():
+    cache = HistoryCache(max_users=2)
+    cache.put("a", make_history(), flushed=0)
+    cache.put("b", make_history(), flushed=0)
+    assert cache.get("a") is not None  # "a" становится недавним
+    cache.put("c", make_history(), flushed=0)
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.evictions == 1
+
+
+def test_cache_keeps_histories_with_unflushed_writes():
+    cache = HistoryCache(max_users=1)
+    cache.put("a", make_history(), flushed=0)
+    cache.written("a", 5)
+    cache.put("b", make_history(), flushed=4)
+    assert "a" in cache and len(cache) == 2  # Запись 5 еще не на диске
+    assert cache.evict(flushed=5) == 1
+    assert "a" not in cache and "b" in cache
+
+
+def test_written_ignores_evicted_users():
+    cache = HistoryCache(max_users=1)
+    cache.written("ghost", 3)
+    cache.put("a", make_history(), flushed=0)
+    cache.put("b", make_history(), flushed=0)
+    assert "a" not in cache
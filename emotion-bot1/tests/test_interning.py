@@ -0,0 +1,27 @@
+from interning import Codebook, TextPool
+
+
+def test_codebook_assigns_codes_in_order():
+    codes = Codebook(["joy", "anger"])
+    assert codes.code("joy") == 0 and codes.code("anger") == 1
+    assert codes.code("new_label") == 2  # Незнакомая метка получает следующий код
+    assert codes.code("joy") == 0
+    assert [codes.name(i) for i in range(len(codes))] == ["joy", "anger", "new_label"]
+
+
+def test_text_pool_stores_each_text_once():
+    pool = TextPool()
+    first, second = pool.acquire("привет"), pool.acquire("привет")
+    assert first == second and len(pool) == 1
+    assert pool[first] == "привет"
+
+
+def test_text_pool_frees_and_reuses_ids():
+    pool = TextPool()
+    text_id = pool.acquire("a")
+    pool.acquire("a")
+    pool.release(text_id)
+    assert len(pool) == 1  # Еще одна ссылка держит текст
+    pool.release(text_id)
+    assert len(pool) == 0 and pool[text_id] is None
+    assert pool.acquire("b") == text_id
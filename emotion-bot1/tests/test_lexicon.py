@@ -0,0 +1,50 @@
+import pytest
+
+from lexicon import LexiconClassifier
+
+EMOTIONS = {
+    "joy": {"ru": "радость", "en": "joy"},
+    "anger": {"ru": "гнев", "en": "anger"},
+    "surprise": {"ru": "удивление", "en": "surprise"},
+    "neutral": {"ru": "нейтрально", "en": "neutral"},
+    "no_emotion": {"ru": "нет эмоции", "en": "no emotion"},
+}
+
+
+@pytest.fixture
+def lexicon():
+    return LexiconClassifier(EMOTIONS)
+
+
+@pytest.mark.parametrize("text", [
+    "I went to a funeral today",
+    "I wonder why",
+    "I won't go",
+    "огород",
+    "уравнение сложное",
+])
+def test_short_stems_do_not_match_word_prefixes(lexicon, text):
+    assert lexicon.classify(text) == ("neutral", 0.0)
+
+
+@pytest.mark.parametrize("text, emotion", [
+    ("ура, сдал экзамен", "joy"),
+    ("that was fun", "joy"),
+    ("я так радуюсь", "joy"),
+    ("меня это злит", "anger"),
+    ("ого, вот это да", "surprise"),
+])
+def test_seed_words_still_match(lexicon, text, emotion):
+    assert lexicon.classify(text)[0] == emotion
+
+
+def test_votes_teach_new_words(lexicon):
+    for _ in range(5):
+        lexicon.add_vote("котики", "joy")
+    emotion, confidence = lexicon.classify("котики")
+    assert emotion == "joy" and confidence > 0
+
+
+def test_votes_for_unknown_labels_are_ignored(lexicon):
+    lexicon.add_vote("котики", "no", 10)
+    assert lexicon.classify("котики") == ("neutral", 0.0)
@@ -0,0 +1,40 @@
+import asyncio
+
+from ratelimit import MemoryBucketStore
+
+
+def take(store, key, now, capacity=2.0, rate=0.1):
+    return asyncio.run(store.take(key, capacity, rate, now))
+
+
+def test_burst_then_wait_for_refill():
+    store = MemoryBucketStore()
+    assert take(store, "u", 0.0) == (True, 0.0)
+    assert take(store, "u", 0.0) == (True, 0.0)
+    allowed, retry_after = take(store, "u", 0.0)
+    assert not allowed and retry_after == 10.0
+    assert take(store, "u", 10.0)[0]  # Один токен за 1 / rate секунд
+
+
+def test_users_have_separate_buckets():
+    store = MemoryBucketStore()
+    take(store, "a", 0.0)
+    take(store, "a", 0.0)
+    assert not take(store, "a", 0.0)[0]
+    assert take(store, "b", 0.0)[0]
+
+
+def test_idle_buckets_are_dropped():
+    store = MemoryBucketStore()
+    take(store, "a", 0.0)
+    take(store, "b", 15.0)
+    assert len(store) == 2
+    take(store, "b", 25.0)  # "a" простояла дольше полного пополнения (20 с)
+    assert len(store) == 1
+
+
+def test_max_users_is_hard_limit():
+    store = MemoryBucketStore(max_users=3)
+    for i in range(10):
+        take(store, str(i), 0.0)
+    assert len(store) == 3
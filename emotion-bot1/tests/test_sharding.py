@@ -0,0 +1,84 @@
+import os
+import zlib
+
+import pytest
+
+from persistence import open_backend
+from sharding import VoteFeed, rebalance, shard_dir, shard_of
+
+
+def count_log(backend) -> int:
+    return backend.db.execute("SELECT COUNT(*) FROM vote_log").fetchone()[0]
+
+
+def test_vote_log_pruned_after_every_reader_passed(tmp_path):
+    writer_dir, reader_dir = tmp_path / "shard-0", tmp_path / "shard-1"
+    os.makedirs(writer_dir)
+    os.makedirs(reader_dir)
+    writer = open_backend("sqlite", str(writer_dir))
+    reader = open_backend("sqlite", str(reader_dir))
+    feed_of_writer = VoteFeed("sqlite", str(writer_dir))  # Шард 1 читает голоса шарда 0
+    feed_of_reader = VoteFeed("sqlite", str(reader_dir))  # Шард 0 читает курсоры шарда 1
+    try:
+        feed_of_writer.read()
+        for emotion in ("joy", "joy", "anger"):
+            writer.add_vote("ура", emotion)
+        writer.flush()
+        assert feed_of_reader.consumed(0) is None
+
+        assert sorted(feed_of_writer.read()) == [("ура", "anger", 1), ("ура", "joy", 1), ("ура", "joy", 1)]
+        reader.save_feed_cursor(0, feed_of_writer.cursor)
+        reader.flush()
+        assert writer.prune_vote_log(feed_of_reader.consumed(0)) == 2
+        writer.flush()
+        assert count_log(writer) == 1  # Последняя запись держит нумерацию
+
+        # Номера не переиспользуются: новые голоса видны читателю
+        writer.add_vote("ура", "surprise")
+        writer.flush()
+        assert feed_of_writer.read() == [("ура", "surprise", 1)]
+    finally:
+        feed_of_writer.close()
+        feed_of_reader.close()
+        writer.close()
+        reader.close()
+
+
+def test_shard_of_is_stable_and_in_range():
+    # crc32, а не hash(): номер не меняется между запусками и процессами
+    assert shard_of(123456789, 4) == shard_of("123456789", 4) == zlib.crc32(b"123456789") % 4
+    assert {shard_of(user_id, 3) for user_id in range(1000)} == {0, 1, 2}
+    assert all(shard_of(user_id, 1) == 0 for user_id in range(100))
+
+
+def test_rebalance_preserves_totals(tmp_path):
+    os.makedirs(tmp_path / "data")
+    source = open_backend("sqlite", str(tmp_path / "data"))
+    for i in range(60):
+        source.add_history(str(i % 13), f"текст {i}", "joy" if i % 3 else "anger", 1_700_000_000 + i)
+        source.add_vote(f"текст {i % 7}", "joy")
+    source.set_message_emotion("текст 1", "joy")
+    source.close()
+
+    report = rebalance("sqlite", str(tmp_path / "data"), 1, 3, str(tmp_path / "out"))
+    assert report["before"] == {"users": [13], "history": [60], "votes": [60]}
+    for field in ("users", "history", "votes"):
+        assert sum(report["after"][field]) == sum(report["before"][field])
+    # Пользователь целиком лежит в своем шарде
+    for shard in range(3):
+        target = open_backend("sqlite", shard_dir(str(tmp_path / "out"), shard, 3))
+        try:
+            users = {op[1] for op in target.export() if op[0] == "history"}
+            assert all(shard_of(user_id, 3) == shard for user_id in users)
+        finally:
+            target.close()
+
+
+def test_rebalance_refuses_non_empty_target(tmp_path):
+    os.makedirs(tmp_path / "data")
+    source = open_backend("sqlite", str(tmp_path / "data"))
+    source.add_vote("ура", "joy")
+    source.close()
+    rebalance("sqlite", str(tmp_path / "data"), 1, 2, str(tmp_path / "out"))
+    with pytest.raises(ValueError):
+        rebalance("sqlite", str(tmp_path / "data"), 1, 2, str(tmp_path / "out"))
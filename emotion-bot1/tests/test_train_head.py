@@ -0,0 +1,37 @@
+import random
+
+from train_head import train_language
+
+
+def sentiment_dataset(count: int, seed: int = 0):
+    # Русская модель: только тональность; голоса - эмоции, связанные с ней
+    rng = random.Random(seed)
+    texts, counts, results = [], [], []
+    for i in range(count):
+        positive = rng.random()
+        results.append([
+            {"label": "POSITIVE", "score": positive},
+            {"label": "NEGATIVE", "score": 1 - positive},
+            {"label": "NEUTRAL", "score": 0.01},
+        ])
+        texts.append(f"текст {i}")
+        counts.append({"joy" if positive > 0.4 else "sadness": rng.randint(1, 3)})
+    return texts, counts, results
+
+
+def test_ru_head_is_compared_with_majority_emotion():
+    texts, counts, results = sentiment_dataset(200)
+    head, report = train_language("ru", texts, counts, results, 1e-3, 300, 0.5, 0.25, 0)
+    assert report["baseline"] == "majority_emotion"
+    assert report["baseline_accuracy"] > 0  # Метки тональности больше не дают точность 0
+    assert report["accuracy"] > report["baseline_accuracy"] and report["alpha"] == 1.0
+    assert head.rank(results[:1], [[("POSITIVE", 1.0)]])[0][0][0] in ("joy", "sadness")
+
+
+def test_ru_head_without_signal_is_not_used():
+    texts, counts, results = sentiment_dataset(200)
+    for result in results:
+        for item in result:
+            item["score"] = 1 / 3  # Модель ничего не говорит о голосах
+    _, report = train_language("ru", texts, counts, results, 1e-3, 300, 0.5, 0.25, 0)
+    assert report["alpha"] == 0.0